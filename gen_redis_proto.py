@@ -4,12 +4,35 @@
 Generating Redis Protocol
 
 Generate the Redis protocol, in raw format, in order to use 'redis-cli --pipe' command to massively insert/delete.... keys in a redis server
-It accepts as input a pipe with redis commands formatted as "SET key value" or "DEL key"...
+It accepts as input a pipe with redis commands formatted as "SET key value" or "DEL key"..., or files of them.
+The lines are handled as bytes, encoded by batches of BATCH_SIZE lines into one buffer each (gen_redis_protos)
+and written through a large buffered standard output.
+Files are split at newlines into chunks of CHUNK_SIZE bytes (with mmap), encoded in a pool of worker processes
+and written in their order, so the commands keep their order; the standard input is encoded as it is read.
+With --host, --port or --socket, the commands are sent to the server over a non-blocking socket instead, at most --window
+commands being in flight, and each error reply is reported with the file and the line of its command, then a summary
+of the throughput.
 
-Usage:
+Usage: python gen_redis_proto.py [options] [files]
+
+Options:
+  -w ..., --workers=...       optional numbers of worker processes encoding the chunks of the files,
+                              if not defined the numbers of cores is the default, 1 encoding them as they are read . e.g. 4
+  --host=...                  send the commands directly to the redis server at host instead of writing them to the standard
+                              output, reading its replies as they arrive, errors being reported with their input line . e.g. 192.168.0.101
+  --port=...                  optional port of the redis server, if not defined 6379 is the default . e.g. 6380
+  --socket=...                send the commands directly to the redis server listening on this unix socket . e.g. /tmp/redis.sock
+  --db=...                    optional redis database to select before sending the commands . e.g. 2
+  --window=...                optional numbers of commands sent before their replies are read, larger over high latency links,
+                              if not defined 10000 is the default . e.g. 100000
+  -h, --help                  show this help
+
+Examples:
 
       echo "SET mykey1 value1\nSET mykey2 value2" > data.txt
       cat data.txt | python gen_redis_proto.py | redis-cli --pipe
+      python gen_redis_proto.py data.txt | redis-cli --pipe
+      python gen_redis_proto.py --host=192.168.0.101 --db=2 data.txt
 
 """
 
@@ -20,30 +43,372 @@ __copyleft__ = "Copyleft (c) 2013 Salimane Adjao Moustapha"
 __license__ = "MIT"
 
 import sys
-import fileinput
-from itertools import imap
+import io
+import os
+import mmap
+import time
+import errno
+import select
+import socket
+import getopt
+import collections
+import multiprocessing
 
 
 def encode(value):
-    "Return a bytestring representation of the value"
+    "Return the bytes of an argument, bytes or str encoded in utf-8"
     if isinstance(value, bytes):
         return value
-    if not isinstance(value, unicode):
-        value = str(value)
-    if isinstance(value, unicode):
-        value = value.encode('utf-8', 'strict')
-    return value
+    if isinstance(value, str):
+        return value.encode('utf-8', 'strict')
+    raise TypeError("arguments must be bytes or str, not %s" % type(value).__name__)
 
 
-def gen_redis_proto(*cmd):
-    proto = ""
-    proto += "*" + str(len(cmd)) + "\r\n"
-    for arg in imap(encode, cmd):
-        proto += "$" + str(len(arg)) + "\r\n"
-        proto += arg + "\r\n"
+#headers of the commands and arguments of the common lengths, built once
+COUNT_HEADERS = [b"*%d\r\n" % n for n in range(64)]
+LENGTH_HEADERS = [b"$%d\r\n" % n for n in range(1024)]
+
+#numbers of lines encoded at once, and size in bytes of the buffer of the standard output
+BATCH_SIZE = 10000
+BUFFER_SIZE = 1 << 20
+
+#size in bytes of the chunks of the input files encoded by the worker processes
+CHUNK_SIZE = 16 << 20
+
+#numbers of commands sent to the server before their replies are read, when loading it directly
+WINDOW = 10000
+
+
+def gen_redis_protos(commands):
+    "Return the protocol of a batch of commands, each a sequence of arguments, as one bytearray"
+    proto = bytearray()
+    for cmd in commands:
+        n = len(cmd)
+        proto += COUNT_HEADERS[n] if n < 64 else b"*%d\r\n" % n
+        for arg in cmd:
+            if not isinstance(arg, bytes):
+                arg = encode(arg)
+            n = len(arg)
+            proto += LENGTH_HEADERS[n] if n < 1024 else b"$%d\r\n" % n
+            proto += arg
+            proto += b"\r\n"
     return proto
 
 
+def gen_redis_proto(*cmd):
+    "Return the protocol of a command as a bytestring"
+    return bytes(gen_redis_protos([cmd]))
+
+
+def input_batches(paths, batch=BATCH_SIZE):
+    "Generate the (path, number of the first line, numbers of lines, protocol) batches of batch lines of the files paths, or of the standard input for none or -, encoded as they are read through a large buffer"
+    for path in paths or ['-']:
+        if path == '-':
+            f = io.open(sys.stdin.fileno(), 'rb', buffering=BUFFER_SIZE, closefd=False)
+        else:
+            f = io.open(path, 'rb', buffering=BUFFER_SIZE)
+        with f:
+            first = 1
+            lines = []
+            for line in f:
+                lines.append(line.rstrip().split(b' '))
+                if len(lines) >= batch:
+                    yield path, first, len(lines), gen_redis_protos(lines)
+                    first += len(lines)
+                    lines = []
+            if lines:
+                yield path, first, len(lines), gen_redis_protos(lines)
+
+
+def file_chunks(path, size=CHUNK_SIZE):
+    "Return the (start, end) offsets of the chunks of about size bytes of the file path, each ending after a newline"
+    chunks = []
+    with io.open(path, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if not length:
+            return chunks
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < length:
+                end = m.find(b"\n", start + size - 1)
+                end = length if end < 0 else end + 1
+                chunks.append((start, end))
+                start = end
+        finally:
+            m.close()
+    return chunks
+
+
+def encode_chunk(chunk):
+    "Return the (numbers of lines, protocol) batches of batch lines of a (path, start, end, batch) chunk of a file, in a worker process"
+    path, start, end, batch = chunk
+    with io.open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split(b"\n")
+    #the chunk ends with a newline, unless it is the end of a file without one
+    if not lines[-1]:
+        lines.pop()
+    return [(len(lines[i:i + batch]), gen_redis_protos([line.rstrip().split(b' ') for line in lines[i:i + batch]]))
+            for i in range(0, len(lines), batch)]
+
+
+def file_batches(paths, workers, batch=BATCH_SIZE):
+    "Generate the batches of the files paths as input_batches, their chunks being encoded in a pool of workers processes, in order"
+    pool = multiprocessing.Pool(workers)
+    try:
+        #a few chunks per worker in flight, so the encoded chunks waiting for a slow output do not pile up
+        pending = collections.deque()
+        lines = {}
+
+        def done():
+            index, path, result = pending.popleft()
+            batches = []
+            for count, proto in result.get():
+                batches.append((path, lines[index], count, proto))
+                lines[index] += count
+            return batches
+
+        for index, path in enumerate(paths):
+            lines[index] = 1
+            for start, end in file_chunks(path):
+                pending.append((index, path, pool.apply_async(encode_chunk, ((path, start, end, batch),))))
+                if len(pending) >= 2 * workers:
+                    for item in done():
+                        yield item
+        while pending:
+            for item in done():
+                yield item
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_reply(buf, pos):
+    "Return (error message or None, end) of the reply starting at pos in buf, or None if buf does not hold the whole reply yet"
+    eol = buf.find(b"\r\n", pos)
+    if eol < 0:
+        return None
+    kind = buf[pos:pos + 1]
+    if kind in (b"+", b":"):
+        return None, eol + 2
+    if kind == b"-":
+        return bytes(buf[pos + 1:eol]), eol + 2
+    if kind == b"$":
+        n = int(bytes(buf[pos + 1:eol]))
+        end = eol + 2 if n < 0 else eol + n + 4
+        return (None, end) if end <= len(buf) else None
+    if kind == b"*":
+        n = int(bytes(buf[pos + 1:eol]))
+        pos = eol + 2
+        for _ in range(max(n, 0)):
+            reply = parse_reply(buf, pos)
+            if reply is None:
+                return None
+            pos = reply[1]
+        return None, pos
+    raise ValueError("unexpected reply: %r" % bytes(buf[pos:pos + 32]))
+
+
+def parse_commands(buf, pos=0, view=None):
+    "Generate the (args, end) of the whole commands of buf (bytes or mmap) from pos, stopping at the first incomplete one, args being slices of view (a memoryview of buf, so the values are not copied) or of buf"
+    if view is None:
+        view = buf
+    size = len(buf)
+    while pos < size:
+        if buf[pos:pos + 1] != b"*":
+            raise ValueError("not a command at byte %d: %r" % (pos, bytes(buf[pos:pos + 32])))
+        eol = buf.find(b"\r\n", pos)
+        if eol < 0:
+            return
+        end = eol + 2
+        args = []
+        for _ in range(int(buf[pos + 1:eol])):
+            eol = buf.find(b"\r\n", end)
+            if eol < 0:
+                return
+            start = eol + 2
+            end = start + int(buf[end + 1:eol])
+            if end + 2 > size:
+                return
+            args.append(view[start:end])
+            end += 2
+        yield args, end
+        pos = end
+
+
+def read_commands(read, buf=b"", size=BUFFER_SIZE):
+    "Generate the (args, frame) of the commands read with the read function (e.g. file.read) after the bytes buf, frame being the slice of the whole command, decoded as they arrive in constant memory. The bytes of an incomplete command at the end are returned as its frame with args None"
+    while True:
+        #memoryviews of bytes only on python 3, where they slice without copying
+        view = memoryview(buf) if bytes is not str else None
+        pos = 0
+        for args, end in parse_commands(buf, 0, view):
+            yield args, (buf if view is None else view)[pos:end]
+            pos = end
+        data = read(size)
+        if not data:
+            if pos < len(buf):
+                yield None, buf[pos:]
+            return
+        buf = buf[pos:] + data
+
+
+class Loader:
+    "A class sending batches of commands to a redis server over a non-blocking socket, at most window commands being in flight, and reading their replies as they arrive to report the errors with their input lines"
+
+    def __init__(self, host='127.0.0.1', port=6379, unixsocket=None, window=WINDOW):
+        if unixsocket is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unixsocket)
+            self.address = unixsocket
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.address = "%s:%s" % (host, port)
+        self.sock.setblocking(False)
+        self.window = window
+        self.buf = bytearray()
+        self.pos = 0
+        #[path, number of the first line, numbers of lines, replies read] of the batches in flight
+        self.batches = collections.deque()
+        self.inflight = 0
+        self.commands = 0
+        self.errors = 0
+        self.bytes = 0
+
+    def send(self, path, first, count, proto):
+        "Send a batch of count commands, from the line first of path, reading the replies while the window is full"
+        self.batches.append([path, first, count, 0])
+        self.inflight += count
+        self.commands += count
+        self.bytes += len(proto)
+        view = memoryview(proto)
+        while len(view) or self.inflight > self.window:
+            readable, writable, _ = select.select([self.sock], [self.sock] if len(view) else [], [])
+            if readable:
+                self.receive()
+            if writable:
+                try:
+                    view = view[self.sock.send(view):]
+                except socket.error as e:
+                    if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+
+    def receive(self):
+        "Read the replies received so far, reporting the errors on stderr with the input line of their command"
+        data = self.sock.recv(BUFFER_SIZE)
+        if not data:
+            raise IOError("connection closed by %s" % self.address)
+        self.buf += data
+        #most replies of a bulk load being +OK, a run of them is counted at once
+        n = len(self.buf) // 5
+        if n and self.buf.count(b"+OK\r\n", 0, 5 * n) == n:
+            self.pos = 5 * n
+            self.replied(n)
+        while True:
+            reply = parse_reply(self.buf, self.pos)
+            if reply is None:
+                break
+            error, self.pos = reply
+            if error is not None:
+                batch = self.batches[0]
+                self.errors += 1
+                sys.stderr.write("%s:%d: %s\n" % (batch[0], batch[1] + batch[3], error.decode('utf-8', 'replace')))
+            self.replied(1)
+        del self.buf[:self.pos]
+        self.pos = 0
+
+    def replied(self, n):
+        "Account for the next n replies"
+        self.inflight -= n
+        while n:
+            batch = self.batches[0]
+            done = min(n, batch[2] - batch[3])
+            batch[3] += done
+            n -= done
+            if batch[3] == batch[2]:
+                self.batches.popleft()
+
+    def drain(self):
+        "Wait for the replies of all the commands sent"
+        while self.inflight:
+            select.select([self.sock], [], [])
+            self.receive()
+
+    def close(self):
+        self.sock.close()
+
+
+def main(paths, workers=1, host=None, port=None, unixsocket=None, db=None, window=WINDOW):
+    #lines are read and written as bytes, a batch of BATCH_SIZE lines at a time, through large buffers
+    loader = None
+    if host is not None or port is not None or unixsocket is not None:
+        loader = Loader(host or '127.0.0.1', port or 6379, unixsocket, window)
+        if db is not None:
+            #an error is reported as the one of the line db of --db
+            loader.send('--db', db, 1, gen_redis_proto('SELECT', db))
+            loader.drain()
+            if loader.errors:
+                sys.exit(1)
+            loader.commands = loader.bytes = 0
+    else:
+        out = io.open(sys.stdout.fileno(), 'wb', buffering=BUFFER_SIZE, closefd=False)
+
+    #the window being in commands, a batch is never bigger than it
+    batch = BATCH_SIZE if loader is None else max(1, min(BATCH_SIZE, window))
+    if workers > 1 and paths and '-' not in paths:
+        batches = file_batches(paths, workers, batch)
+    else:
+        batches = input_batches(paths, batch)
+
+    started = time.time()
+    for path, first, count, proto in batches:
+        if loader is None:
+            out.write(proto)
+        else:
+            loader.send(path, first, count, proto)
+    if loader is None:
+        out.flush()
+        return
+
+    loader.drain()
+    loader.close()
+    elapsed = max(time.time() - started, 0.001)
+    print ("%d commands sent to %s, %d errors, in %.2fs: %d commands/s, %.1f MB/s" % (
+        loader.commands, loader.address, loader.errors, elapsed, loader.commands / elapsed, loader.bytes / elapsed / (1 << 20)))
+    if loader.errors:
+        sys.exit(1)
+
+
+def usage():
+    print (__doc__)
+
+
 if __name__ == '__main__':
-    for line in fileinput.input():
-        sys.stdout.write(gen_redis_proto(*line.rstrip().split(' ')))
+    workers = multiprocessing.cpu_count()
+    host = port = unixsocket = db = None
+    window = WINDOW
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hw:", ["help", "workers=", "host=", "port=", "socket=", "db=", "window="])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt == "--host":
+            host = arg
+        elif opt == "--port":
+            port = int(arg)
+        elif opt == "--socket":
+            unixsocket = arg
+        elif opt == "--db":
+            db = int(arg)
+        elif opt == "--window":
+            window = int(arg)
+
+    main(args, workers, host, port, unixsocket, db, window)
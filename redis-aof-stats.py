@@ -0,0 +1,395 @@
+#! /usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Redis AOF Stats
+
+A command stream analyzer that parses appendonly.aof files, or any captured stream of redis commands in the redis
+protocol, for counts and sizes stats about commands, key prefixes and dbs, and can rewrite the stream filtered
+by key patterns or compacted.
+
+The files are read through mmap and the commands decoded in place (gen_redis_proto.parse_commands), the standard
+input by chunks, so the memory used does not depend on the size of the stream.
+An AOF starting with a RDB preamble has its keys counted as RESTORE commands (see redis_rdb.py), and the
+appendonlydir directory of redis >= 7.0 is read in the order of its manifest: the base file then the incr files.
+
+- --match and --exclude keep the commands whose key matches the patterns, the commands without a key
+  (SELECT, MULTI, EXEC, FLUSHALL...) being always kept
+- --compact drops the SETs overwritten by a later SET (without NX, XX or KEEPTTL), DEL or UNLINK of their key,
+  when no command in between uses the key, and the overwrite is within the --window commands buffered.
+  FLUSHDB, FLUSHALL and SWAPDB keep the SETs before them
+
+Usage: ./redis-aof-stats.py [options] [<appendonly.aof or appendonlydir> ...]
+
+      OR
+
+      cat <captured commands> | ./redis-aof-stats.py [options]
+
+      options:
+      --prefix-delimiter=...           String to split on for delimiting prefix and rest of key, if not provided `:` is the default . --prefix-delimiter=#
+      --output=...                     File to write the commands kept to, loadable with redis-cli --pipe . --output=/tmp/compacted.aof
+      --match=...                      Glob pattern of the keys of the commands to keep, may be repeated . --match=session:*
+      --exclude=...                    Glob pattern of the keys of the commands to drop, may be repeated . --exclude=tmp:*
+      --compact                        Drop the SETs overwritten later in the stream
+      --window=...                     Numbers of commands buffered to find the overwritten SETs, if not provided 100000 is the default . --window=1000000
+
+Examples:
+  ./redis-aof-stats.py /var/lib/redis/appendonly.aof
+
+  ./redis-aof-stats.py /var/lib/redis/appendonlydir
+
+  ./redis-aof-stats.py --compact --exclude='tmp:*' --output=/tmp/compacted.aof /var/lib/redis/appendonly.aof
+  redis-cli --pipe < /tmp/compacted.aof
+
+
+Dependencies: none
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+import argparse
+import collections
+import fnmatch
+import io
+import mmap
+import os
+import sys
+import time
+from collections import defaultdict
+
+import gen_redis_proto
+import redis_rdb
+
+
+#commands without a key, or with their key at another position than the first argument
+NO_KEY = set([b'SELECT', b'MULTI', b'EXEC', b'DISCARD', b'FLUSHDB', b'FLUSHALL', b'SWAPDB', b'PING', b'FUNCTION',
+              b'SCRIPT', b'PUBLISH', b'SPUBLISH'])
+KEY_POSITIONS = {b'BITOP': 2, b'XGROUP': 2, b'OBJECT': 2, b'EVAL': 3, b'EVALSHA': 3, b'EVAL_RO': 3, b'EVALSHA_RO': 3,
+                 b'FCALL': 3, b'FCALL_RO': 3}
+
+#commands after which no SET before them can be dropped
+BARRIERS = set([b'FLUSHDB', b'FLUSHALL', b'SWAPDB'])
+
+#options of SET making it conditional or keeping the ttl of the key
+SET_CONDITIONS = set([b'NX', b'XX', b'KEEPTTL'])
+
+
+def command_key(name, args):
+    "Return the key of a command, or None if it has none"
+    if name in NO_KEY:
+        return None
+    position = KEY_POSITIONS.get(name, 1)
+    if position == 3 and (len(args) < 4 or bytes(args[2]) == b'0'):
+        #script without keys
+        return None
+    return bytes(args[position]) if len(args) > position else None
+
+
+def aof_files(path):
+    "Return the files of an AOF, the files of the manifest of an appendonlydir in order (base, then incr by seq), or path itself"
+    if not os.path.isdir(path):
+        return [path]
+    manifests = [name for name in os.listdir(path) if name.endswith('.manifest')]
+    if not manifests:
+        raise ValueError('no manifest in %s' % path)
+    base = []
+    incr = []
+    with open(os.path.join(path, manifests[0])) as f:
+        for line in f:
+            fields = line.split()
+            entry = dict(zip(fields[::2], fields[1::2]))
+            if entry.get('type') == 'b':
+                base.append(os.path.join(path, entry['file']))
+            elif entry.get('type') == 'i':
+                incr.append((int(entry.get('seq', 0)), os.path.join(path, entry['file'])))
+    return base + [name for seq, name in sorted(incr)]
+
+
+class RedisAofStats(object):
+    """
+    Analyze the commands of an AOF or of a stream of commands, writing the commands kept to output if any
+    """
+
+    # numbers of commands, and bytes, buffered to find the overwritten SETs with compact
+    window = 100000
+    window_bytes = 64 << 20
+
+    def __init__(self, prefix_delim=':', output=None, matches=None, excludes=None, compact=False):
+        self.prefix_delim = prefix_delim.encode('utf-8')
+        self.output = output
+        self.matches = matches or []
+        self.excludes = excludes or []
+        self.compact = compact
+        self.command_count = 0
+        self.total_size = 0
+        self.preamble_keys = 0
+        self.truncated = 0
+        self.names = defaultdict(int)
+        self.name_counts = defaultdict(int)
+        self.prefixes = defaultdict(int)
+        self.prefix_counts = defaultdict(int)
+        self.dbs = defaultdict(int)
+        self.db_counts = defaultdict(int)
+        self.db = b'0'
+        self.written = 0
+        self.filtered = 0
+        self.dropped = 0
+        # [frame, (db, key) of a SET, size] of the commands buffered, and the SETs buffered which may be dropped
+        self.buffered = collections.deque()
+        self.buffered_bytes = 0
+        self.pending = {}
+        self.max_key = 0
+        self.started = time.time()
+
+    def _record(self, name, key, size):
+        self.command_count += 1
+        self.total_size += size
+        self.names[name] += size
+        self.name_counts[name] += 1
+        self.dbs[self.db] += size
+        self.db_counts[self.db] += 1
+        if key is not None:
+            pos = key.rfind(self.prefix_delim)
+            if pos != -1:
+                self.prefixes[key[0:pos]] += size
+                self.prefix_counts[key[0:pos]] += 1
+
+    def _selected(self, key):
+        name = key.decode('utf-8', 'replace')
+        if self.matches and not [pattern for pattern in self.matches if fnmatch.fnmatchcase(name, pattern)]:
+            return False
+        return not [pattern for pattern in self.excludes if fnmatch.fnmatchcase(name, pattern)]
+
+    def process_command(self, args, frame):
+        name = bytes(args[0]).upper()
+        key = command_key(name, args)
+        self._record(name, key, len(frame))
+        if name == b'SELECT' and len(args) > 1:
+            self.db = bytes(args[1])
+        if self.output is None:
+            return
+        if key is not None and not self._selected(key):
+            self.filtered += 1
+            return
+        if not self.compact:
+            self.output.write(frame)
+            self.written += 1
+            return
+        self._buffer(name, args, bytes(frame))
+
+    def process_entry(self, db, key, rtype, payload, expire):
+        """
+        Record a key of the RDB preamble as the RESTORE command written for it to output
+        """
+        self.preamble_keys += 1
+        db = str(db).encode('utf-8')
+        if db != self.db:
+            self.process_command([b'SELECT', db], gen_redis_proto.gen_redis_proto('SELECT', db))
+        self.process_command([b'RESTORE', key, b'0', payload, b'REPLACE'],
+                             gen_redis_proto.gen_redis_proto(b'RESTORE', key, b'0', payload, b'REPLACE'))
+        if expire is not None:
+            expire = str(expire).encode('utf-8')
+            self.process_command([b'PEXPIREAT', key, expire], gen_redis_proto.gen_redis_proto(b'PEXPIREAT', key, expire))
+
+    def _buffer(self, name, args, frame):
+        """
+        Buffer a command, dropping the buffered SET of the keys it overwrites
+        """
+        if name in BARRIERS:
+            self.pending.clear()
+        else:
+            overwrites = name in (b'DEL', b'UNLINK') or (
+                name == b'SET' and not [arg for arg in args[3:] if bytes(arg).upper() in SET_CONDITIONS])
+            for i in range(1, len(args)):
+                if len(args[i]) > self.max_key:
+                    continue
+                entry = self.pending.pop((self.db, bytes(args[i])), None)
+                if entry is not None and overwrites and (name != b'SET' or i == 1):
+                    entry[0] = None
+        entry = [frame, None, len(frame)]
+        if name == b'SET' and len(args) > 2:
+            entry[1] = (self.db, bytes(args[1]))
+            self.pending[entry[1]] = entry
+            self.max_key = max(self.max_key, len(args[1]))
+        self.buffered.append(entry)
+        self.buffered_bytes += entry[2]
+        while len(self.buffered) > self.window or self.buffered_bytes > self.window_bytes:
+            self._flush_one()
+
+    def _flush_one(self):
+        entry = self.buffered.popleft()
+        frame, pkey, size = entry
+        self.buffered_bytes -= size
+        if pkey is not None and self.pending.get(pkey) is entry:
+            del self.pending[pkey]
+        if frame is None:
+            self.dropped += 1
+            return
+        self.output.write(frame)
+        self.written += 1
+
+    def finish(self):
+        """
+        Write the commands still buffered
+        """
+        while self.buffered:
+            self._flush_one()
+
+    def process_file(self, path):
+        """
+        Analyze an AOF file, its RDB preamble if any and then its commands decoded in place in a mmap of the file
+        """
+        with io.open(path, 'rb') as f:
+            offset = 0
+            if f.read(5) == b'REDIS':
+                f.seek(0)
+                stream = redis_rdb.Stream(f.read, gen_redis_proto.BUFFER_SIZE)
+                for entry in redis_rdb.read_entries(stream):
+                    self.process_entry(*entry)
+                offset = stream.tell()
+            length = os.fstat(f.fileno()).st_size
+            if offset >= length:
+                return
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            #memoryviews of the mmap only on python 3, where they slice it without copying
+            view = memoryview(m) if bytes is not str else None
+            end = offset
+            for args, end in gen_redis_proto.parse_commands(m, offset, view):
+                self.process_command(args, (m if view is None else view)[offset:end])
+                offset = end
+            args = None
+            self.truncated += length - offset
+            if view is not None:
+                view.release()
+            m.close()
+
+    def process_input(self, input):
+        """
+        Analyze a stream of commands read by chunks from the binary file input, with a RDB preamble if any
+        """
+        buf = input.read(5)
+        if buf == b'REDIS':
+            stream = redis_rdb.Stream(input.read, gen_redis_proto.BUFFER_SIZE)
+            stream.buf += buf
+            for entry in redis_rdb.read_entries(stream):
+                self.process_entry(*entry)
+            buf = bytes(stream.buf[stream.pos:])
+        for args, frame in gen_redis_proto.read_commands(input.read, buf):
+            if args is None:
+                self.truncated += len(frame)
+            else:
+                self.process_command(args, frame)
+
+    def _top_n(self, stat, n=30):
+        sorted_items = sorted(
+            stat.items(), key=lambda x: x[1], reverse=True)
+        return sorted_items[:n]
+
+    def humanize_bytes(self, size):
+        for x in ['bytes', 'KB', 'MB', 'GB', 'TB']:
+            if size < 1024.0:
+                return "%3.1f%s" % (size, x)
+            size /= 1024.0
+
+    def _pretty_print(self, result, title, counts=None):
+        print (title)
+        print ('=' * 40)
+        if not result:
+            print ('n/a\n')
+            return
+
+        names = [key.decode('utf-8', 'replace') if isinstance(key, bytes) else key for key, val in result]
+        max_key_len = max((len(name) for name in names))
+        for name, (key, val) in zip(names, result):
+            key_padding = max(max_key_len - len(name), 0) * ' '
+            if counts is not None:
+                val = '%s\t(%.2f%%)\t%d commands' % (
+                    self.humanize_bytes(val), (float(val) / max(self.total_size, 1)) * 100, counts[key])
+            print ('%s %s \t %s' % (name, key_padding, val))
+        print ('')
+
+    def _general_stats(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        stats = [
+            ("Commands Processed", self.command_count),
+            ("Bytes Processed", self.humanize_bytes(self.total_size)),
+            ("Keys of the RDB Preamble", self.preamble_keys),
+            ("Truncated Bytes", self.truncated),
+            ("Throughput", "%s/s" % self.humanize_bytes(self.total_size / elapsed)),
+        ]
+        if self.output is not None:
+            stats += [
+                ("Commands Written", self.written),
+                ("Commands Filtered", self.filtered),
+                ("Overwritten SETs Dropped", self.dropped),
+            ]
+        return stats
+
+    def print_stats(self):
+        self._pretty_print(self._general_stats(), 'Overall Stats')
+        self._pretty_print(
+            self._top_n(self.names), 'Heaviest Commands', self.name_counts)
+        self._pretty_print(
+            self._top_n(self.prefixes), 'Heaviest Prefixes', self.prefix_counts)
+        self._pretty_print(
+            self._top_n(self.dbs), 'Heaviest Dbs', self.db_counts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'input',
+        nargs='*',
+        help="AOF files or appendonlydir directories to parse; will read from stdin otherwise")
+    parser.add_argument(
+        '--prefix-delimiter',
+        type=str,
+        default=':',
+        help="String to split on for delimiting prefix and rest of key",
+        required=False)
+    parser.add_argument(
+        '--output',
+        help="File to write the commands kept to",
+        required=False)
+    parser.add_argument(
+        '--match',
+        action='append',
+        help="Glob pattern of the keys of the commands to keep, may be repeated",
+        required=False)
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        help="Glob pattern of the keys of the commands to drop, may be repeated",
+        required=False)
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help="Drop the SETs overwritten later in the stream")
+    parser.add_argument(
+        '--window',
+        type=int,
+        help="Numbers of commands buffered to find the overwritten SETs",
+        required=False)
+    args = parser.parse_args()
+    if args.compact and args.output is None:
+        parser.error('--compact requires --output')
+
+    output = None
+    if args.output is not None:
+        output = io.open(args.output, 'wb', buffering=gen_redis_proto.BUFFER_SIZE)
+    counter = RedisAofStats(args.prefix_delimiter, output, args.match, args.exclude, args.compact)
+    if args.window is not None:
+        counter.window = args.window
+    if args.input:
+        for path in args.input:
+            for name in aof_files(path):
+                counter.process_file(name)
+    else:
+        counter.process_input(io.open(sys.stdin.fileno(), 'rb', closefd=False))
+    if output is not None:
+        counter.finish()
+        output.close()
+    counter.print_stats()
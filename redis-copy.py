@@ -5,20 +5,64 @@ Redis Copy
 Redis Copy the keys in a source redis server into another target redis server.
 The script probably needs to be added to a cron job if the keys are a lot because it only copies a fix number of keys at a time
 and continue from there on the next run. It does this until there is no more keys to copy
+With --follow, it instead runs until interrupted, copying all the keys then the changes of the source as they happen.
+With --psync, it runs until interrupted as a replica of the source, restoring its snapshot then forwarding its write commands.
+With --rdb, it copies the keys of a snapshot file of the source instead, without connecting to the source.
 
 Usage: python redis-copy.py [options]
 
 Options:
   -l ..., --limit=...         optional numbers of keys to copy per run, if not defined 10000 is the default . e.g. 1000
+  --limit-bytes=...           optional estimated size in bytes of the keys to copy per run, on top of the keys limit,
+                              so a run has a predictable cost whatever the size of its keys, stopping after the batch reaching it . e.g. 1073741824
+  --slo=...                   optional p99 latency in milliseconds of the source to stay under: an AIMD governor (redis_governor.py)
+                              halves the batches, the keys in flight and the workers and pauses between them when PINGs
+                              or the commands of the source get slower . e.g. 5
   -s ..., --source=...        source redis server "ip:port" to copy keys from. e.g. 192.168.0.99:6379
   -t ..., --target=...        target redis server "ip:port" to copy keys to. e.g. 192.168.0.101:6379
   -d ..., --databases=...     comma separated list of redis databases to select when copying. e.g. 2,5
   -h, --help                  show this help
   -f, --flush                 flush target bucket on first run
   -p ..., --prefix=...        optional prefix: only migrate keys wirh this prefix, e.g. production_rw*
+  --match=...                 optional glob pattern of the keys to copy, may be repeated, a single pattern being matched
+                              by SCAN or KEYS on the server, several ones on each SCAN page . e.g. session:*
+  --exclude=...               optional glob pattern of the keys not to copy, may be repeated . e.g. session:tmp:*
+  --type=...                  optional type of the keys to copy, matched by SCAN on redis >= 6.0 . e.g. hash
+  --min-size=...              optional estimated size in bytes of the smallest keys to copy . e.g. 1024
+  --max-size=...              optional estimated size in bytes of the biggest keys to copy, checked before any value
+                              is read . e.g. 1048576
   --spass=...                 password for source redis server
   --tpass=...                 password for target redis server
   --clean                     clean all variables, temp lists created previously by the script
+  --scan                      walk the keyspace with SCAN instead of saving a temp keylist with KEYS,
+                              only the SCAN cursor is saved in the journal between runs (requires redis >= 2.8)
+  --dump                      copy the keys with pipelined DUMP/PTTL and RESTORE ... REPLACE instead of type by type,
+                              keeping encodings, millisecond ttls and all types (requires redis >= 3.0 on both servers)
+  -w ..., --workers=...       optional numbers of worker processes copying batches of keys in parallel, each with its own
+                              connections, if not defined 1 is the default (no pool) . e.g. 8
+  --async                     copy the keys with the asyncio engine of redis_async.py, keeping many keys in flight
+                              over high latency links (requires python >= 3.7 and redis-py >= 4.2)
+  --inflight=...              optional numbers of keys in flight on the source and on the target with --async,
+                              the target window shrinks when its write latency rises, if not defined 100 is the default
+  --follow                    keep running: copy all the keys, limit keys at a time, then replay the keys changed or deleted
+                              on the source to the target from its keyspace notifications, reporting the replication lag
+                              (requires notify-keyspace-events Eg$lshzxe or EA on the source)
+  --psync                     keep running: connect to the source as a replica, restore its snapshot (one BGSAVE, no reads
+                              per key) in the target then forward its write commands, for whole dbs (see redis_rdb.py)
+  --output=...                write the keys to a file of RESP commands instead of the target, appended to on each run and
+                              gzipped when its name ends with .gz: SELECT, then RESTORE with --dump or the typed writes,
+                              and the expire times as PEXPIREAT, to load at full speed in any target with redis-cli --pipe
+  --rdb=...                   copy the keys of a dump.rdb file of the source (gzipped when its name ends with .gz) instead of
+                              reading them from the source, which is never connected to: the file is parsed by chunks and its
+                              keys written with pipelined RESTORE, the dbs mapping and the filters applied, in one run
+                              (requires a target running the same or a newer redis version, see redis_rdb.py)
+  --journal=...               optional local directory of the checkpoint journals, temp keylists and lock file of the script,
+                              nothing being written to the source (see redis_journal.py), if not defined . is the default
+  --verify                    compare the target with the source instead of copying, walking both with SCAN in parallel:
+                              missing keys, values (DUMP or canonical digests), ttls and extra keys are written to the report
+                              mig_verify.report of the journal directory, and the keys to copy again saved as the temp keylists
+                              so the next run without --scan copies only them (see redis_verify.py)
+  --sample=...                optional fraction of the keys checked by --verify, if not defined all the keys are . e.g. 0.01
 
 Dependencies: redis (redis-py: sudo pip install redis)
 
@@ -42,6 +86,24 @@ Examples:
   --databases=2:2,5:1                                     copy all keys in db 2 and 5 from server 192.168.0.99:6379 to db 2 and db 1
                                                           in server 192.168.0.101:6379 with a limit of 1000 per script run
 
+  python redis-copy.py --scan \
+  --source=192.168.0.99:6379 \
+  --target=192.168.0.101:6379 \
+  --databases=2:2,5:1                                     copy all keys in db 2 and 5 without blocking the source with KEYS,
+                                                          resuming from the saved SCAN cursor on each script run
+
+  python redis-copy.py --dump \
+  --source=192.168.0.99:6379 \
+  --output=/backup/users.resp.gz \
+  --databases=2:2,5:1                                     export all keys in db 2 and 5 to a file loaded in db 2 and db 1 of
+                                                          any target with: zcat /backup/users.resp.gz | redis-cli --pipe
+
+  python redis-copy.py \
+  --rdb=/var/lib/redis/dump.rdb \
+  --target=192.168.0.101:6379 \
+  --databases=2:2,5:1                                     copy all keys in db 2 and 5 of a snapshot of the source to db 2 and db 1
+                                                          in server 192.168.0.101:6379, without any load on the source
+
 """
 
 __author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
@@ -55,9 +117,21 @@ import redis
 import time
 import sys
 import getopt
+import collections
+import gzip
+import multiprocessing
+import threading
+import os
 
+import gen_redis_proto
+import redis_batch
+import redis_filter
+import redis_governor
+import redis_journal
+import redis_verify
 
-class RedisCopy:
+
+class RedisCopy(redis_batch.KeyBatches):
     """A class for copying keys from one server to another.
     """
 
@@ -65,19 +139,83 @@ class RedisCopy:
     mprefix = 'mig:'
     keylistprefix = 'keylist:'
     hkeylistprefix = 'havekeylist:'
+    cursorprefix = 'cursor:'
+
+    # local directory of the checkpoint journals, temp keylists and lock file
+    journal_dir = '.'
 
     # numbers of keys to copy on each iteration
     limit = 10000
 
-    def __init__(self, source, target, dbs, spass, tpass):
+    # numbers of keys SCAN looks at on each call when walking the keyspace
+    scan_count = 1000
+
+    # numbers of elements of a hash, list, set or zset read and written at once
+    chunk_size = 1000
+
+    # numbers of keys read and written in one pipeline
+    batch_size = 500
+
+    # estimated size in bytes of the keys of a batch, and of a key copied alone by chunks in the big keys lane
+    batch_bytes = 1 << 20
+    big_key_bytes = 8 << 20
+
+    # estimated size in bytes of the keys to copy on each run, None for no limit
+    limit_bytes = None
+
+    # estimated size of an element of a collection when MEMORY USAGE is not available (redis < 4.0)
+    element_bytes = 64
+
+    # p99 latency in seconds of the source the governor keeps the copy under, None for no throttling
+    slo = None
+
+    # numbers of keys in flight on the source and on the target with the asyncio engine
+    inflight = 100
+
+    # seconds between two syncs of the changed keys in follow mode
+    follow_interval = 1.0
+
+    # keyspace notifications needed by the follow mode: keyevent (E) of all the key types
+    notify_flags = 'Eg$lshzxe'
+
+    # fraction of the keys checked by the verify mode, None for all the keys
+    sample = None
+
+    # difference in milliseconds allowed between the ttls of a key in the source and in the target,
+    # the ttls being copied in seconds by the type by type copy
+    ttl_tolerance = 2000
+
+    def __init__(self, source, target, dbs, spass, tpass, scan=False, dump=False, workers=1, asynchronous=False):
         self.source = source
         self.target = target
         self.dbs = dbs
         self.spass = spass
         self.tpass = tpass
+        self.scan = scan
+        self.dump = dump
+        self.workers = workers
+        self.asynchronous = asynchronous
+        self.keys_read = 0
+        self.memory_usage = True
+        self.governor = None
+        self.journals = {}
+        self.keyfilter = redis_filter.KeyFilter()
+        self.output = None
+
+    def journal_path(self, name):
+        """Function returning the path of the local file name of the script, e.g. the journal or the keylist of a server-db.
+        """
+        return os.path.join(self.journal_dir, (self.mprefix + name).replace(':', '_'))
+
+    def journal(self, servername):
+        """Function returning the checkpoint journal of a source server-db, or of the script for 'run'.
+        """
+        if servername not in self.journals:
+            self.journals[servername] = redis_journal.Journal(self.journal_path(servername + '.journal'))
+        return self.journals[servername]
 
-    def save_keylists(self, prefix="*"):
-        """Function to save the keys' names of the source redis server into a list for later usage.
+    def save_keylists(self):
+        """Function to save the keys' names of the source redis server into a local keylist for later usage.
         """
 
         for db in self.dbs:
@@ -88,28 +226,24 @@ class RedisCopy:
             r = redis.StrictRedis(
                 host=self.source['host'], port=self.source['port'], db=db, password=self.spass)
 
-            #returns the number of keys in the current database
-            dbsize = r.dbsize()
+            journal = self.journal(servername)
             #check whether we already have the list, if not get it
-            hkl = r.get(self.mprefix + self.hkeylistprefix + servername)
-            if hkl is None or int(hkl) != 1:
+            if journal.get('keys') is None:
                 print ("Saving the keys in %s to temp keylist...\n" % servername)
-                moved = 0
-                r.delete(self.mprefix + self.keylistprefix + servername)
-                #returns a list of keys matching pattern
-                for key in r.keys(prefix):
-                    moved += 1
-                    #push values onto the tail of the list name
-                    r.rpush(self.mprefix + self.keylistprefix + servername, key)
-                    if moved % self.limit == 0:
-                        print  ("%d keys of %s inserted in temp keylist at %s...\n" % (moved, servername, time.strftime("%Y-%m-%d %I:%M:%S")))
-                #set the value at key name to value
-                r.set(self.mprefix + self.hkeylistprefix + servername, 1)
-            print ("ALL %d keys of %s already inserted to temp keylist ...\n\n" % (dbsize - 1, servername))
+                keylist = redis_journal.KeyList(self.journal_path(servername + '.keylist'))
+                #returns a list of keys matching the filter
+                for key in self.keyfilter.keys(r):
+                    keylist.append(key)
+                    if keylist.length % self.limit == 0:
+                        print  ("%d keys of %s inserted in temp keylist at %s...\n" % (keylist.length, servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+                keylist.close()
+                journal.mset({'keys': keylist.length, 'keymoved': 0, 'keyoffset': 0})
+            print ("ALL %d keys of %s already inserted to temp keylist ...\n\n" % (journal.get('keys'), servername))
 
     def copy_db(self, limit=None):
         """Function to copy all the keys from the source into the new target.
         - limit : optional numbers of keys to copy per run
+        Return the numbers of keys read from the keylists or the SCAN cursors, 0 once all keys are copied.
         """
 
         #set the limit per run
@@ -121,6 +255,7 @@ class RedisCopy:
         if limit is not None:
             self.limit = limit
 
+        self.keys_read = 0
         for db in self.dbs:
             servername = self.source['host'] + ":" + str(
                 self.source['port']) + ":" + db[0]
@@ -129,78 +264,532 @@ class RedisCopy:
             #get redis handle for current source server-db
             r = redis.StrictRedis(
                 host=self.source['host'], port=self.source['port'], db=int(db[0]), password=self.spass)
-            moved = 0
-            # dbsize without run key, keylist key, havekeylist key, firstrun key
-            dbsize = r.dbsize() - 4
-            #get keys already moved
-            #return the value at key name, or None if the key doesn’t exist
-            keymoved = r.get(self.mprefix + "keymoved:" + servername)
-            keymoved = 0 if keymoved is None else int(keymoved)
-            #check if we already have all keys copied for current source server-db
-            if dbsize < keymoved:
-                print ("ALL %d keys from %s have already been copied.\n" % (
-                    dbsize, servername))
+            #get redis handle for corresponding target server-db, or the output file
+            if self.output is None:
+                rr = redis.StrictRedis(
+                    host=self.target['host'], port=self.target['port'], db=int(db[1]), password=self.tpass)
+            else:
+                rr = self.output.select(int(db[1]))
+            #the keys in flight are only throttled with the asyncio engine, the others copying one key at a time
+            self.governor = None if self.slo is None else redis_governor.Governor(
+                r, [rr] if self.output is None else [], self.slo, self.batch_size,
+                self.inflight if self.asynchronous else 1, self.workers)
+
+            if self.scan:
+                batches = self.scan_batches(r, servername)
+            else:
+                batches = self.keylist_batches(r, servername)
+            moved = self.copy_batches(r, rr, db, servername, batches)
+
+            print ("%d keys have been copied on %s at %s%s\n" % (
+                moved, servername, time.strftime("%Y-%m-%d %I:%M:%S"), self.throttle_state()))
+        if self.output is not None:
+            print ("%d commands written to %s at %s\n" % (
+                self.output.commands, self.output.path, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+        return self.keys_read
+
+    def copy_batches(self, r, rr, db, servername, batches):
+        """Function to copy the (keys, checkpoint) batches of a source server-db, in this process
+        or in a pool of self.workers processes each having its own source and target connections.
+        With self.asynchronous, the batches are copied by the asyncio engine instead.
+        Batches are completed in order, so a checkpoint is saved in the journal only when
+        all the keys before it are copied, whichever worker copied them.
+        Return the numbers of keys copied.
+        """
+        checkpoints = collections.deque()
+
+        def keys():
+            for batch, checkpoint in batches:
+                checkpoints.append(checkpoint)
+                yield batch
+
+        progress = {'moved': 0}
+
+        def batch_done(copied, checkpoint):
+            moved = progress['moved']
+            if (moved + copied) // 10000 > moved // 10000:
+                print ("%d keys have been copied on %s at %s...%s\n" % (
+                    moved + copied, servername, time.strftime("%Y-%m-%d %I:%M:%S"), self.throttle_state()))
+            progress['moved'] = moved + copied
+            if checkpoint:
+                if self.output is not None:
+                    self.output.sync()
+                self.journal(servername).mset(checkpoint)
+
+        if self.asynchronous:
+            self.async_copy_batches(db, servername, batches, batch_done)
+            return progress['moved']
+
+        pool = None
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers, init_copy_worker, (
+                self.source, self.target, db, self.spass, self.tpass, self.dump))
+            results = self.pool_results(pool, keys())
+        else:
+            results = (self.copy_keys(r, rr, batch, servername) for batch in keys())
+
+        try:
+            for copied in results:
+                batch_done(copied, checkpoints.popleft())
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        return progress['moved']
+
+    def pool_results(self, pool, batches):
+        """Generator returning the numbers of keys copied of each batch by the worker processes of pool, in order,
+        at most self.workers_limit() batches being copied at once so the governor shrinks and grows the pool.
+        """
+        pending = collections.deque()
+        for batch in batches:
+            while len(pending) >= self.workers_limit():
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(copy_worker, (batch,)))
+        while pending:
+            yield pending.popleft().get()
+
+    def async_copy_batches(self, db, servername, batches, batch_done):
+        """Function to copy the (keys, checkpoint) batches of a source server-db with the asyncio engine of redis_async,
+        keeping up to self.inflight keys in flight. The keys are copied with the steps of copy_key_steps or restore_key_steps.
+        """
+        import redis_async
+
+        ra = redis_async.connect(self.source, db[0], self.spass)
+        rra = redis_async.connect(self.target, db[1], self.tpass)
+        window = redis_async.AdaptiveWindow(self.inflight)
+
+        def copy_one(key):
+            steps = self.restore_key_steps if self.dump and not isinstance(key, BigKey) else self.copy_key_steps
+            return redis_async.run_steps(steps(key, servername), ra, rra, window)
+
+        redis_async.copy_batches(batches, copy_one, self.inflight_limit, batch_done, (ra, rra))
+
+    def copy_keys(self, r, rr, keys, servername):
+        """Function to copy a batch of keys from the source handle r to the target handle rr.
+        Return the numbers of keys copied.
+        """
+        if self.dump:
+            return self.restore_keys(r, rr, keys, servername)
+        return sum(1 for key in keys if self.copy_key(r, rr, key, servername))
+
+    def restore_keys(self, r, rr, keys, servername):
+        """Function to copy a batch of keys with DUMP and RESTORE, in one pipeline on each server.
+        The serialized values keep their encoding and their expire time in milliseconds, and types
+        without a per-type copy (streams, HyperLogLogs, modules...) are copied as well.
+        Keys rejected by the target (e.g. an older RDB version) are copied with copy_key instead.
+        Return the numbers of keys copied.
+        """
+        bookkeeping = self.bookkeeping_keys(servername)
+        copied = sum(1 for key in keys if isinstance(key, BigKey) and self.copy_key(r, rr, key, servername))
+        keys = [key for key in keys if key not in bookkeeping and not isinstance(key, BigKey)]
+
+        p = r.pipeline(transaction=False)
+        for key in keys:
+            p.dump(key)
+            p.pttl(key)
+        values = p.execute()
+
+        restored = []
+        pp = rr.pipeline(transaction=False)
+        for i, key in enumerate(keys):
+            payload, kttl = values[2 * i], values[2 * i + 1]
+            #key deleted in the meantime
+            if payload is None:
                 continue
+            kttl = 0 if kttl is None or int(kttl) < 0 else int(kttl)
+            pp.execute_command('RESTORE', key, kttl, payload, 'REPLACE')
+            restored.append(key)
+        results = pp.execute(raise_on_error=False)
 
-            print ("Started copy of %s keys from %d to %d at %s...\n" % (servername, keymoved, dbsize, time.strftime("%Y-%m-%d %I:%M:%S")))
+        for key, result in zip(restored, results):
+            if not isinstance(result, Exception):
+                copied += 1
+                continue
+            if self.dump and 'payload version' in str(result):
+                print ("Target rejects the DUMP payloads of the source (%s), copying the keys type by type...\n" % result)
+                self.dump = False
+            if self.copy_key(r, rr, key, servername):
+                copied += 1
 
-            #get redis handle for corresponding target server-db
-            rr = redis.StrictRedis(
-                host=self.target['host'], port=self.target['port'], db=int(db[1]), password=self.tpass)
+        return copied
+
+    def copy_key(self, r, rr, key, servername):
+        """Function to copy a key and its expire time from the source handle r to the target handle rr.
+        Return False if the key was not copied.
+        """
+        return redis_batch.run_steps(self.copy_key_steps(key, servername), r, rr)
+
+    def big_key(self, key):
+        """Function returning a key bigger than self.big_key_bytes as a BigKey, copied by chunks (see copy_key_steps),
+        so big keys never make a batch stall the source or the network. Streams and module keys have no copy by chunks
+        and are restored whole.
+        """
+        return BigKey(key)
+
+    def restore_key_steps(self, key, servername):
+        """Generator describing the copy of a key with DUMP, PTTL and RESTORE as steps (see copy_key_steps),
+        falling back to the steps of copy_key_steps when the target rejects the payload.
+        """
+        if key in self.bookkeeping_keys(servername):
+            return
+
+        payload = yield ('source', 'DUMP', key)
+        #key deleted in the meantime
+        if payload is None:
+            return
+        kttl = yield ('source', 'PTTL', key)
+        kttl = 0 if kttl is None or int(kttl) < 0 else int(kttl)
+        try:
+            yield ('target', 'RESTORE', key, kttl, payload, 'REPLACE')
+            return
+        except redis.ResponseError as e:
+            if self.dump and 'payload version' in str(e):
+                print ("Target rejects the DUMP payloads of the source (%s), copying the keys type by type...\n" % e)
+                self.dump = False
+
+        steps = self.copy_key_steps(key, servername)
+        reply = None
+        while True:
+            try:
+                step = steps.send(reply)
+            except StopIteration:
+                return
+            reply = yield step
+
+    def bookkeeping_keys(self, servername):
+        """Function returning the names of the temp variables older versions of the script stored in the source server-db,
+        never copied.
+        """
+        names = (self.mprefix + "run", self.mprefix + "firstrun",
+                 self.mprefix + "keymoved:" + servername,
+                 self.mprefix + self.keylistprefix + servername,
+                 self.mprefix + self.hkeylistprefix + servername,
+                 self.mprefix + self.cursorprefix + servername)
+        #compared with the raw key names, binary ones never being decoded
+        return tuple(name.encode('utf-8') for name in names)
+
+    def check_notifications(self, r):
+        """Function to check that the source publishes the keyspace notifications needed to follow its changes.
+        """
+        try:
+            flags = r.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        except redis.ResponseError as e:
+            print ("Can not check the keyspace notifications of the source (%s), make sure they are enabled with: %s\n" % (e, self.notify_flags))
+            return
+        flags = flags.replace('A', 'g$lshzxet')
+        if [flag for flag in self.notify_flags if flag not in flags]:
+            exit('Please --follow requires keyspace notifications on the source: CONFIG SET notify-keyspace-events ' + self.notify_flags)
+
+    def follow(self, limit=None):
+        """Function to copy all the keys, then keep the target in sync with the source until interrupted.
+        The keys written, expired or deleted on the source are collected from its keyspace notifications,
+        from before the bulk copy starts, and replayed to the target in batches every self.follow_interval
+        seconds, with the replication lag of each sync, so a cutover only needs a short write freeze.
+        """
+        self.changed = dict((db[0], {}) for db in self.dbs)
+        self.changed_lock = threading.Lock()
+        #keep the handle of the subscription around, its connection pool is closed with it
+        rs = redis.StrictRedis(
+            host=self.source['host'], port=self.source['port'], db=int(self.dbs[0][0]), password=self.spass)
+        pubsub = rs.pubsub()
+        pubsub.psubscribe(*['__keyevent@%s__:*' % db[0] for db in self.dbs])
+        self.following = True
+        watcher = threading.Thread(target=self.watch_keyspace, args=(pubsub,))
+        watcher.daemon = True
+        watcher.start()
+
+        #bulk copy, limit keys per db at a time
+        while self.copy_db(limit):
+            pass
+
+        print ("ALL keys copied, following the changes of the source at %s...\n" % time.strftime("%Y-%m-%d %I:%M:%S"))
+        handles = {}
+        for db in self.dbs:
+            servername = self.source['host'] + ":" + str(
+                self.source['port']) + ":" + db[0]
+            handles[db[0]] = (redis.StrictRedis(host=self.source['host'], port=self.source['port'], db=int(db[0]), password=self.spass),
+                              redis.StrictRedis(host=self.target['host'], port=self.target['port'], db=int(db[1]), password=self.tpass),
+                              servername)
+        try:
+            while True:
+                time.sleep(self.follow_interval)
+                for db in self.dbs:
+                    r, rr, servername = handles[db[0]]
+                    self.sync_changes(r, rr, db, servername)
+        except KeyboardInterrupt:
+            print ("Stopped following the changes of the source at %s.\n" % time.strftime("%Y-%m-%d %I:%M:%S"))
+        finally:
+            self.following = False
+            watcher.join()
+            pubsub.close()
+
+    def watch_keyspace(self, pubsub):
+        """Function run in a thread while following, collecting the keys changed in the source dbs
+        with the time of their first change since the last sync.
+        """
+        while self.following:
+            message = pubsub.get_message(timeout=1.0)
+            if message is None or message['type'] != 'pmessage':
+                continue
+            channel = message['channel']
+            if not isinstance(channel, str):
+                channel = channel.decode('utf-8')
+            #__keyevent@<db>__:<event>
+            db = channel[channel.index('@') + 1:channel.index('__:')]
+            with self.changed_lock:
+                if message['data'] not in self.changed[db]:
+                    self.changed[db][message['data']] = time.time()
+
+    def sync_changes(self, r, rr, db, servername):
+        """Function to replay the keys changed in a source server-db since the last sync to the target, in batches.
+        Keys that no longer exist in the source are deleted from the target.
+        """
+        with self.changed_lock:
+            changed, self.changed[db[0]] = self.changed[db[0]], {}
+        keys = [key for key in changed if self.keyfilter.match(key)
+                and key not in self.bookkeeping_keys(servername)]
+        if not keys:
+            return
+
+        synced = deleted = 0
+        lag = 0.0
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            p = r.pipeline(transaction=False)
+            for key in batch:
+                p.exists(key)
+            exist = p.execute()
+            gone = [key for key, e in zip(batch, exist) if not e]
+            if gone:
+                rr.delete(*gone)
+                deleted += len(gone)
+            synced += self.copy_keys(r, rr, [key for key, e in zip(batch, exist) if e], servername)
+            #age of the oldest change of the batch once it is on the target
+            lag = max(lag, time.time() - min(changed[key] for key in batch))
+
+        print ("%d keys synced and %d keys deleted on %s, replication lag %.3fs at %s\n" % (
+            synced, deleted, servername, lag, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+    def replicate(self):
+        """Function to copy the source as one of its replicas until interrupted: the source does one BGSAVE
+        and sends its snapshot, which is parsed as it arrives and written to the target with pipelined RESTORE,
+        then the write commands of the source are forwarded to the target, both with the dbs mapping applied.
+        MULTI and EXEC are not forwarded, the commands of a transaction being written in order.
+        """
+        import redis_rdb
+
+        source = self.source['host'] + ":" + str(self.source['port'])
+        mapping = dict((db[0], db[1]) for db in self.dbs)
+        targets = dict((db[1], redis.StrictRedis(
+            host=self.target['host'], port=self.target['port'], db=int(db[1]), password=self.tpass)) for db in self.dbs)
+        bookkeeping = dict((db[0], self.bookkeeping_keys(source + ":" + db[0])) for db in self.dbs)
+        pipes = {}
+
+        def execute():
+            for tdb, p in pipes.items():
+                for result in p.execute(raise_on_error=False):
+                    if not isinstance(result, Exception):
+                        continue
+                    if 'payload version' in str(result):
+                        exit('Target rejects the RDB payloads of the source (%s), --psync requires a target running the same or a newer redis version.' % result)
+                    print ("Error on db %s of the target: %s\n" % (tdb, result))
+            pipes.clear()
+
+        def queue(db, *args):
+            tdb = mapping[db]
+            if tdb not in pipes:
+                pipes[tdb] = targets[tdb].pipeline(transaction=False)
+            pipes[tdb].execute_command(*args)
 
-            #max index for lrange
-            newkeymoved = keymoved + \
-                self.limit if dbsize > keymoved + self.limit else dbsize
-
-            #return a slice of the list name between position start and end
-            for key in r.lrange(self.mprefix + self.keylistprefix + servername, keymoved, newkeymoved):
-                #get key type
-                ktype = r.type(key).decode('utf-8')
-                key = key.decode('utf-8')
-                #if undefined type go to next key
-                if ktype == 'none':
+        replica = redis_rdb.Replica(self.source, self.spass)
+        try:
+            print ("Asking %s a full resynchronization at %s...\n" % (source, time.strftime("%Y-%m-%d %I:%M:%S")))
+            replica.sync()
+            print ("Restoring the snapshot of %s (%d bytes) at %s...\n" % (
+                source, replica.length, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+            moved = 0
+            for db, key, rtype, value, expire in replica.snapshot():
+                db = str(db)
+                if db not in mapping or key in bookkeeping[db]:
                     continue
+                kttl = 0
+                if expire is not None:
+                    kttl = expire - int(time.time() * 1000)
+                    #already expired
+                    if kttl <= 0:
+                        continue
+                queue(db, 'RESTORE', key, kttl, redis_rdb.dump_payload(rtype, value, replica.rdb.version), 'REPLACE')
+                moved += 1
+                if moved % self.batch_size == 0:
+                    execute()
+                if moved % 10000 == 0:
+                    print ("%d keys have been restored from %s at %s...\n" % (
+                        moved, source, time.strftime("%Y-%m-%d %I:%M:%S")))
+            execute()
+            print ("%d keys have been restored from %s, following the commands of the source at %s...\n" % (
+                moved, source, time.strftime("%Y-%m-%d %I:%M:%S")))
 
-                #save key to target server-db
-                if ktype == 'string':
-                    if key == self.mprefix + "run":
+            db = None
+            forwarded = 0
+            reported = time.time()
+            for commands in replica.commands():
+                for args in commands:
+                    name = args[0].upper()
+                    if name == b'SELECT':
+                        db = args[1].decode('utf-8')
+                    elif name == b'FLUSHALL':
+                        for sdb in mapping:
+                            queue(sdb, 'FLUSHDB', *args[1:])
+                    elif name in (b'MULTI', b'EXEC') or db not in mapping:
                         continue
-                    rr.set(key, r.get(key))
-                elif ktype == 'hash':
-                    rr.hmset(key, r.hgetall(key))
-                elif ktype == 'list':
-                    if key == self.mprefix + "keylist:" + servername:
+                    elif len(args) > 1 and args[1] in bookkeeping[db]:
                         continue
-                    #value = r.lrange(key, 0, -1)
-                    #rr.rpush(key, *value)
-                    for k in r.lrange(key, 0, -1):
-                        rr.rpush(key, k)
-                elif ktype == 'set':
-                    #value = r.smembers(key)
-                    #rr.sadd(key, *value)
-                    for k in r.smembers(key):
-                        rr.sadd(key, k)
-                elif ktype == 'zset':
-                    #value = r.zrange(key, 0, -1, withscores=True)
-                    #rr.zadd(key, **dict(value))
-                    for k, v in r.zrange(key, 0, -1, withscores=True):
-                        rr.zadd(key, v, k)
-
-                # Handle keys with an expire time set
-                kttl = r.ttl(key)
-                kttl = -1 if kttl is None else int(kttl)
-                if kttl != -1:
-                    rr.expire(key, kttl)
+                    else:
+                        queue(db, *args)
+                        forwarded += 1
+                execute()
+                if forwarded and time.time() - reported >= self.follow_interval:
+                    print ("%d commands forwarded from %s, replication offset %d at %s\n" % (
+                        forwarded, source, replica.offset, time.strftime("%Y-%m-%d %I:%M:%S")))
+                    forwarded = 0
+                    reported = time.time()
+        except KeyboardInterrupt:
+            print ("Stopped replicating %s at %s.\n" % (source, time.strftime("%Y-%m-%d %I:%M:%S")))
+        finally:
+            replica.close()
 
-                moved += 1
+    def load_rdb(self, path):
+        """Function to copy the keys of the RDB file path, a snapshot of the source, without connecting to the source:
+        the file is parsed by chunks as it is read and its keys written to the target (or the output file) with pipelined
+        RESTORE ... REPLACE, the dbs mapping and the key filter applied. The whole file is copied in one run, a run
+        cut short being done again from the start. Keys already expired are skipped.
+        Return the numbers of keys copied.
+        """
+        import redis_rdb
 
-                if moved % 10000 == 0:
-                    print ("%d keys have been copied on %s at %s...\n" % (
-                        moved, servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+        mapping = dict((db[0], db[1]) for db in self.dbs)
+        targets = {}
+        pipes = {}
+
+        def execute():
+            for tdb, p in pipes.items():
+                for result in p.execute(raise_on_error=False):
+                    if not isinstance(result, Exception):
+                        continue
+                    if 'payload version' in str(result):
+                        exit('Target rejects the RDB payloads of the snapshot (%s), --rdb requires a target running the same or a newer redis version.' % result)
+                    print ("Error on db %s of the target: %s\n" % (tdb, result))
+            pipes.clear()
+            if self.output is not None:
+                self.output.sync()
+
+        print ("Copying the keys of the snapshot %s at %s...\n" % (path, time.strftime("%Y-%m-%d %I:%M:%S")))
+        moved = 0
+        for db, key, rtype, payload, expire in redis_rdb.read_file(path):
+            db = str(db)
+            if db not in mapping or not self.keyfilter.entry(key, redis_rdb.TYPES[rtype], len(payload)):
+                continue
+            kttl = 0
+            if expire is not None:
+                kttl = expire - int(time.time() * 1000)
+                #already expired
+                if kttl <= 0:
+                    continue
+            tdb = mapping[db]
+            if self.output is not None:
+                #the output writes a SELECT when the db changes
+                pipes[tdb] = self.output.select(int(tdb))
+            elif tdb not in pipes:
+                if tdb not in targets:
+                    targets[tdb] = redis.StrictRedis(
+                        host=self.target['host'], port=self.target['port'], db=int(tdb), password=self.tpass)
+                pipes[tdb] = targets[tdb].pipeline(transaction=False)
+            pipes[tdb].execute_command('RESTORE', key, kttl, payload, 'REPLACE')
+            moved += 1
+            if moved % self.batch_size == 0:
+                execute()
+            if moved % 10000 == 0:
+                print ("%d keys have been copied from %s at %s...\n" % (
+                    moved, path, time.strftime("%Y-%m-%d %I:%M:%S")))
+        execute()
+        print ("%d keys have been copied from %s at %s\n" % (moved, path, time.strftime("%Y-%m-%d %I:%M:%S")))
+        if self.output is not None:
+            print ("%d commands written to %s at %s\n" % (
+                self.output.commands, self.output.path, time.strftime("%Y-%m-%d %I:%M:%S")))
+        return moved
+
+    def verify(self):
+        """Function to compare the target with the source once the keys are copied, each source server-db and each
+        target server-db being walked with SCAN in its own thread: the keys of the source are compared with the target,
+        the keys of the target are checked on the source (see redis_verify). The mismatches are written to the report
+        of the journal directory, and the keys to copy again saved as the temp keylists of their source server-db.
+        Return the numbers of mismatches.
+        """
+        report = redis_verify.Report()
+        walks = []
+        for db in self.dbs:
+            servername = self.source['host'] + ":" + str(
+                self.source['port']) + ":" + db[0]
+            targetname = self.target['host'] + ":" + str(
+                self.target['port']) + ":" + db[1]
+            r = redis.StrictRedis(
+                host=self.source['host'], port=self.source['port'], db=int(db[0]), password=self.spass)
+            rr = redis.StrictRedis(
+                host=self.target['host'], port=self.target['port'], db=int(db[1]), password=self.tpass)
+            walks.append(threading.Thread(target=self.verify_source, args=(r, rr, servername, report)))
+            walks.append(threading.Thread(target=self.verify_target, args=(rr, r, targetname, report)))
+
+        print ("Verifying the target %s:%d at %s...\n" % (self.target['host'], self.target['port'], time.strftime("%Y-%m-%d %I:%M:%S")))
+        for walk in walks:
+            walk.daemon = True
+            walk.start()
+        for walk in walks:
+            walk.join()
 
-            r.set(self.mprefix + "keymoved:" + servername, newkeymoved)
-            print ("%d keys have been copied on %s at %s\n" % (
-                newkeymoved, servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+        report.write(self.journal_path('verify.report'))
+        for db in self.dbs:
+            servername = self.source['host'] + ":" + str(
+                self.source['port']) + ":" + db[0]
+            keys = report.keys(servername, redis_verify.RECOPY)
+            if keys:
+                keylist = redis_journal.KeyList(self.journal_path(servername + '.keylist'))
+                for key in keys:
+                    keylist.append(key)
+                keylist.close()
+                self.journal(servername).mset({'keys': keylist.length, 'keymoved': 0, 'keyoffset': 0})
+                print ("%d keys of %s to copy again saved to its temp keylist.\n" % (len(keys), servername))
+
+        print ("%d mismatches found at %s, report saved to %s:\n%s\n" % (
+            report.total(), time.strftime("%Y-%m-%d %I:%M:%S"), self.journal_path('verify.report'), report.summary()))
+        return report.total()
+
+    def verify_source(self, r, rr, servername, report):
+        """Function run in a thread, comparing the keys of a source server-db with the target, by pipelined batches.
+        """
+        bookkeeping = self.bookkeeping_keys(servername)
+        try:
+            for keys in redis_verify.scan_batches(r, self.keyfilter, self.scan_count, self.sample):
+                keys = [key for key in keys if key not in bookkeeping]
+                if self.keyfilter.sizes():
+                    keys = [key for key, key_bytes in zip(keys, self.key_sizes(r, keys)) if self.keyfilter.sized(key_bytes)]
+                for i in range(0, len(keys), self.batch_size):
+                    batch = keys[i:i + self.batch_size]
+                    report.add(servername, len(batch), redis_verify.compare_keys(r, rr, batch, self.ttl_tolerance))
+        except redis.RedisError as e:
+            report.fail(servername, e)
+
+    def verify_target(self, rr, r, targetname, report):
+        """Function run in a thread, checking that the keys of a target server-db exist in the source.
+        """
+        try:
+            for keys in redis_verify.scan_batches(rr, self.keyfilter, self.scan_count, self.sample):
+                report.add(targetname, len(keys), [(redis_verify.EXTRA, key) for key in redis_verify.missing_keys([r], keys)])
+        except redis.RedisError as e:
+            report.fail(targetname, e)
 
     def flush_target(self):
         """Function to flush the target server.
@@ -222,34 +811,137 @@ class RedisCopy:
         """
 
         print ("Cleaning all temp variables...\n")
-        for db in self.dbs:
+        for db in self.dbs if self.source is not None else []:
             servername = self.source['host'] + ":" + str(
                 self.source['port']) + ":" + db[0]
-            r = redis.StrictRedis(
-                host=self.source['host'], port=self.source['port'], db=int(db[0]), password=spass)
-            r.delete(self.mprefix + "keymoved:" + servername)
-            r.delete(self.mprefix + self.keylistprefix + servername)
-            r.delete(self.mprefix + self.hkeylistprefix + servername)
-            r.delete(self.mprefix + "firstrun")
-            r.delete(self.mprefix + "run")
+            redis_journal.remove(self.journal_path(servername + '.journal'))
+            redis_journal.remove(self.journal_path(servername + '.keylist'))
+        redis_journal.remove(self.journal_path('run.journal'))
+        redis_journal.remove(self.journal_path('verify.report'))
         print ("Done.\n")
 
 
-def main(source, target, databases, spass, tpass, limit=None, clean=False, flush=False, prefix="*"):
+class BigKey(bytes):
+    """A key bigger than RedisCopy.big_key_bytes, copied by chunks in a batch of its own.
+    """
+
+
+class RespOutput:
+    """A class writing the commands sent to the target to a file of RESP commands (see gen_redis_proto.py),
+    standing for the target handle and its pipelines. The expire times relative to now are written as PEXPIREAT,
+    so the keys expire when they do in the source whenever the file is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.raw = open(path, 'ab')
+        #each run appends a gzip member, the members of a file being read one after another by zcat
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='ab') if path.endswith('.gz') else self.raw
+        self.db = None
+        self.commands = 0
+        self.queued = 0
+
+    def select(self, db):
+        """Function returning the output as the handle of the target db, writing a SELECT when the db changes.
+        """
+        if db != self.db:
+            self.write('SELECT', db)
+            self.db = db
+        return self
+
+    def execute_command(self, *args):
+        name = args[0].upper()
+        if not isinstance(name, str):
+            name = name.decode('utf-8')
+        now = int(time.time() * 1000)
+        if name == 'EXPIRE':
+            self.write('PEXPIREAT', args[1], now + int(args[2]) * 1000)
+        elif name == 'RESTORE' and int(args[2]) > 0:
+            self.write('RESTORE', args[1], 0, *args[3:])
+            self.write('PEXPIREAT', args[1], now + int(args[2]))
+        else:
+            self.write(*args)
+        self.queued += 1
+        return b'OK'
+
+    def pipeline(self, transaction=True):
+        """Function returning the output itself, the commands of a pipeline being written as they are queued.
+        """
+        self.queued = 0
+        return self
+
+    def execute(self, raise_on_error=True):
+        results = [b'OK'] * self.queued
+        self.queued = 0
+        return results
+
+    def write(self, *args):
+        #the dbs, ttls, expire times and scores are numbers
+        self.file.write(gen_redis_proto.gen_redis_proto(*[arg if isinstance(arg, (bytes, str)) else str(arg) for arg in args]))
+        self.commands += 1
+
+    def sync(self):
+        """Function to flush the commands written so far to the disk, before their checkpoint is saved.
+        """
+        self.file.flush()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        if self.file is not self.raw:
+            self.file.close()
+        self.raw.close()
+
+
+#copy state of a worker process of the pool: (RedisCopy instance, source handle, target handle, servername)
+worker = None
+
+
+def init_copy_worker(source, target, db, spass, tpass, dump):
+    """Function run once in each worker process to open its own source and target connections.
+    """
+    global worker
+    servername = source['host'] + ":" + str(source['port']) + ":" + db[0]
+    r = redis.StrictRedis(host=source['host'], port=source['port'], db=int(db[0]), password=spass)
+    rr = redis.StrictRedis(host=target['host'], port=target['port'], db=int(db[1]), password=tpass)
+    worker = (RedisCopy(source, target, [db], spass, tpass, dump=dump), r, rr, servername)
+
+
+def copy_worker(keys):
+    """Function copying a batch of keys in a worker process.
+    """
+    mig, r, rr, servername = worker
+    return mig.copy_keys(r, rr, keys, servername)
+
+
+def main(source, target, databases, spass, tpass, limit=None, clean=False, flush=False, prefix="*", scan=False, dump=False, workers=1,
+         asynchronous=False, inflight=None, follow=False, psync=False, limit_bytes=None, slo=None, journal_dir=None, verify=False,
+         sample=None, matches=None, excludes=None, ktype=None, min_size=None, max_size=None, output=None, rdb=None):
     #getting source and target
-    if (source == target):
+    if (source == target and source is not None):
         exit('The 2 servers adresses are the same.')
-    so = source.split(':')
+    so = (source or '').split(':')
     if len(so) == 2:
         source_server = {'host': so[0], 'port': int(so[1])}
+    elif rdb is not None and source is None:
+        #the keys are read from the snapshot, the source is never connected to
+        source_server = None
     else:
         exit('Supplied source address is wrong.')
 
-    sn = target.split(':')
-    if len(sn) == 2:
-        target_server = {'host': sn[0], 'port': int(sn[1])}
+    if rdb is not None and (workers > 1 or asynchronous or follow or psync or verify):
+        exit('Please --rdb copies the keys of a snapshot, it can not be used with --workers, --async, --follow, --psync or --verify.')
+
+    if output is not None:
+        target_server = None
+        if workers > 1 or asynchronous or follow or psync or verify:
+            exit('Please --output writes the keys to a file, it can not be used with --workers, --async, --follow, --psync or --verify.')
     else:
-        exit('Supplied target address is wrong.')
+        sn = target.split(':')
+        if len(sn) == 2:
+            target_server = {'host': sn[0], 'port': int(sn[1])}
+        else:
+            exit('Supplied target address is wrong.')
 
     #getting the dbs
     dbs = [k.split(':') for k in databases.split(',')]
@@ -257,35 +949,76 @@ def main(source, target, databases, spass, tpass, limit=None, clean=False, flush
         exit('Supplied list of db is wrong.')
 
     try:
-        r = redis.StrictRedis(
+        r = None if source_server is None else redis.StrictRedis(
             host=source_server['host'], port=source_server['port'], db=int(dbs[0][0]), password=spass)
     except AttributeError as e:
         exit('Please this script requires redis-py >= 2.4.10, your current version is :' + redis.__version__)
 
-    mig = RedisCopy(source_server, target_server, dbs, spass, tpass)
+    if asynchronous:
+        try:
+            import redis_async
+        except (ImportError, SyntaxError):
+            exit('Please --async requires python >= 3.7 and redis-py >= 4.2, your current version is :' + redis.__version__)
+
+    matches = list(matches or [])
+    if prefix != "*":
+        matches.append(prefix)
+    keyfilter = redis_filter.KeyFilter(matches, excludes, ktype, min_size, max_size)
+    if psync and not keyfilter.everything():
+        exit('Please --psync copies whole databases, it can not be used with --prefix, --match, --exclude, --type or the sizes.')
+
+    mig = RedisCopy(source_server, target_server, dbs, spass, tpass, scan, dump, workers, asynchronous)
+    mig.keyfilter = keyfilter
+    if output is not None:
+        mig.output = RespOutput(output)
+    if inflight is not None:
+        mig.inflight = inflight
+    if limit_bytes is not None:
+        mig.limit_bytes = limit_bytes
+    if slo is not None:
+        mig.slo = slo / 1000.0
+    if journal_dir is not None:
+        mig.journal_dir = journal_dir
+    if sample is not None:
+        mig.sample = sample
+
+    #check if script already running, the lock being released when the process exits
+    lockfile = redis_journal.lock(mig.journal_path('run.lock'))
+    if lockfile is None:
+        exit('another process already running the script')
 
-    if clean == False:
-        #check if script already running
-        run = r.get(mig.mprefix + "run")
-        if run is not None and int(run) == 1:
-            exit('another process already running the script')
+    mismatches = 0
+    if verify:
+        mismatches = mig.verify()
+    elif clean == False:
+        if follow:
+            mig.check_notifications(r)
 
-        r.set(mig.mprefix + "run", 1)
-        mig.save_keylists(prefix)
+        if not scan and not psync and rdb is None:
+            mig.save_keylists()
 
-        firstrun = r.get(mig.mprefix + "firstrun")
-        firstrun = 0 if firstrun is None else int(firstrun)
-        if firstrun == 0:
-            if flush:
+        journal = mig.journal('run')
+        if not journal.get('firstrun'):
+            if flush and output is None:
                 mig.flush_target()
-            r.set(mig.mprefix + "firstrun", 1)
+            journal.mset({'firstrun': 1})
 
-        mig.copy_db(limit)
-        # setting script completion flag
-        r.set(mig.mprefix + "run", 0)
+        if rdb is not None:
+            mig.load_rdb(rdb)
+        elif psync:
+            mig.replicate()
+        elif follow:
+            mig.follow(limit)
+        else:
+            mig.copy_db(limit)
 
     else:
         mig.clean()
+    if mig.output is not None:
+        mig.output.close()
+    lockfile.close()
+    if mismatches:
+        sys.exit(1)
 
 def usage():
     print (__doc__)
@@ -294,12 +1027,32 @@ def usage():
 if __name__ == "__main__":
     clean = False
     flush = False
+    scan = False
+    dump = False
+    workers = 1
+    asynchronous = False
+    inflight = None
+    follow = False
+    psync = False
+    limit_bytes = None
+    slo = None
+    journal_dir = None
+    verify = False
+    sample = None
+    matches = []
+    excludes = []
+    ktype = None
+    min_size = max_size = None
+    output = target = None
+    rdb = source = None
     prefix = "*"
     spass = tpass = None
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hl:s:t:d:fp:", ["help", "limit=", "source=", "target=", \
-                                                                  "databases=", "clean", "flush", "prefix=", "spass=", "tpass="])
+        opts, args = getopt.getopt(sys.argv[1:], "hl:s:t:d:fp:w:", ["help", "limit=", "source=", "target=", \
+                                                                  "databases=", "clean", "flush", "prefix=", "spass=", "tpass=", "scan", "dump", "workers=", "async", "inflight=", "follow", "psync", \
+                                                                  "limit-bytes=", "slo=", "journal=", "verify", "sample=", "match=", "exclude=", "type=", "min-size=", \
+                                                                  "max-size=", "output=", "rdb="])
     except getopt.GetoptError:
         usage()
         sys.exit(2)
@@ -311,6 +1064,44 @@ if __name__ == "__main__":
             sys.exit()
         elif opt == "--clean":
             clean = True
+        elif opt == "--scan":
+            scan = True
+        elif opt == "--dump":
+            dump = True
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt == "--async":
+            asynchronous = True
+        elif opt == "--inflight":
+            inflight = int(arg)
+        elif opt == "--follow":
+            follow = True
+        elif opt == "--psync":
+            psync = True
+        elif opt == "--limit-bytes":
+            limit_bytes = int(arg)
+        elif opt == "--slo":
+            slo = float(arg)
+        elif opt == "--journal":
+            journal_dir = arg
+        elif opt == "--verify":
+            verify = True
+        elif opt == "--sample":
+            sample = float(arg)
+        elif opt == "--match":
+            matches.append(arg)
+        elif opt == "--exclude":
+            excludes.append(arg)
+        elif opt == "--type":
+            ktype = arg
+        elif opt == "--min-size":
+            min_size = int(arg)
+        elif opt == "--max-size":
+            max_size = int(arg)
+        elif opt == "--output":
+            output = arg
+        elif opt == "--rdb":
+            rdb = arg
         elif opt in ("-l", "--limit"):
             limit = arg
         elif opt in ("-s", "--source"):
@@ -334,6 +1125,7 @@ if __name__ == "__main__":
         limit = None
 
     try:
-        main(source, target, databases, spass, tpass, limit, clean, flush, prefix)
+        main(source, target, databases, spass, tpass, limit, clean, flush, prefix, scan, dump, workers, asynchronous, inflight, follow, psync, limit_bytes, slo, journal_dir, verify, sample,
+             matches, excludes, ktype, min_size, max_size, output, rdb)
     except NameError as e:
         usage()
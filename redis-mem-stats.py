@@ -9,6 +9,12 @@ A memory size analyzer that parses the output of the memory report of rdb <https
 At its core, RedisMemStats uses the output of the memory report of rdb, which echoes a csv row line for every key
 stored to a Redis instance.
 It parses these lines, and aggregates stats on the most memory consuming keys, prefixes, dbs and redis data structures.
+The sizes of the Heaviest Keys are summed by key name across the dbs, which counts every key of the dump;
+with --keys-by-db, only the heaviest keys of each db are kept, in bounded memory, and listed with their db.
+A csv file given as argument is split at line boundaries and its chunks parsed in a pool of processes, whose stats
+are merged into the same results as a single process.
+With --rdb, a dump.rdb is read directly through mmap, without rdb, the memory used by each key being estimated from
+the encodings and lengths of its value, whose bytes are skipped without being decoded (see redis_rdb.py).
 
 Usage: rdb -c memory <REDIS dump.rdb TO ANALYZE> | ./redis-mem-stats.py [options]
 
@@ -17,8 +23,25 @@ Usage: rdb -c memory <REDIS dump.rdb TO ANALYZE> | ./redis-mem-stats.py [options
       rdb -c memory <REDIS dump.rdb TO ANALYZE> > <OUTPUT CSV FILE>
       ./redis-mem-stats.py [options] <OUTPUT CSV FILE>
 
+      OR
+
+      ./redis-mem-stats.py [options] --rdb=<REDIS dump.rdb TO ANALYZE>
+
       options:
       --prefix-delimiter=...           String to split on for delimiting prefix and rest of key, if not provided `:` is the default . --prefix-delimiter=#
+      --prefix-counters=...            Number of prefixes counted, in bounded memory (Space-Saving), for dumps with too many
+                                       prefixes to count them all. The heaviest prefixes are kept, their sizes overestimated
+                                       by at most the Prefix Sizes Error of the Overall Stats . --prefix-counters=100000
+      --tree-depth=...                 Print the Prefix Tree, the sizes and numbers of keys of the prefixes level by level,
+                                       up to that number of segments . --tree-depth=3
+      --collapse-ids                   Collapse the segments of the Prefix Tree looking like ids (numbers, uuids and hex
+                                       strings) into *, so user:1:, user:2: ... are counted as user:*:
+      --keys-by-db                     List the Heaviest Keys of each db, followed by their db when the dump has several
+                                       dbs, keeping only the heaviest ones in memory, instead of summing their sizes by name
+      --workers=...                    Number of processes parsing the input file, by chunks of 64MB, if not provided
+                                       the number of cpus is the default . --workers=8
+      --rdb=...                        RDB file to analyze instead of the output of rdb (gzipped when its name ends with .gz,
+                                       decompressed in memory) . --rdb=/var/lib/redis/dump.rdb
 
 Examples:
   rdb -c memory /var/lib/redis/dump.rdb > /tmp/outfile.csv
@@ -28,8 +51,12 @@ Examples:
 
   rdb -c memory /var/lib/redis/dump.rdb | ./redis-mem-stats.py
 
+  or
 
-Dependencies: rdb (redis-rdb-tools: https://github.com/sripathikrishnan/redis-rdb-tools)
+  ./redis-mem-stats.py --rdb=/var/lib/redis/dump.rdb
+
+
+Dependencies: rdb (redis-rdb-tools: https://github.com/sripathikrishnan/redis-rdb-tools), except with --rdb
 
 """
 
@@ -40,48 +67,247 @@ __copyleft__ = "Copyleft (c) 2012-2013 Salimane Adjao Moustapha"
 __license__ = "MIT"
 
 import argparse
+import gzip
+import heapq
+import io
+import mmap
+import multiprocessing
+import os
+import re
 import sys
 from collections import defaultdict
 from itertools import imap
 
+import redis_rdb
+
+# size in bytes of the chunks of the input file parsed by each worker process
+CHUNK_SIZE = 64 << 20
+
+# types of the keys of a RDB file, named as in the memory report of rdb
+RDB_TYPES = dict((rtype, 'sortedset' if name == 'zset' else name) for rtype, name in redis_rdb.TYPES.iteritems())
+
+
+def file_chunks(path, size=CHUNK_SIZE):
+    """
+    Return the (start, end) offsets of the chunks of about size bytes of the file path, each ending after a newline
+    """
+    chunks = []
+    with io.open(path, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if not length:
+            return chunks
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < length:
+                end = m.find("\n", start + size - 1)
+                end = length if end < 0 else end + 1
+                chunks.append((start, end))
+                start = end
+        finally:
+            m.close()
+    return chunks
+
+
+def process_chunk(chunk):
+    """
+    Return the RedisMemStats of a (path, start, end, options...) chunk of a file, in a worker process
+    """
+    path, start, end, prefix_delim, prefix_counters, tree_depth, collapse_ids, keys_by_db = chunk
+    with io.open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split("\n")
+    #the chunk ends with a newline, unless it is the end of a file without one
+    if not lines[-1]:
+        lines.pop()
+    stats = RedisMemStats(prefix_delim, prefix_counters, tree_depth, collapse_ids, keys_by_db)
+    stats.process_input(lines)
+    return stats
+
+
+class TopKeys(object):
+    """
+    The k heaviest keys, in a min-heap of k (size, (key, db)), each key of a db being seen once
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def add(self, key, size):
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (size, key))
+        elif size >= self.heap[0][0] and (size, key) > self.heap[0]:
+            heapq.heapreplace(self.heap, (size, key))
+
+    def merge(self, other):
+        for size, key in other.heap:
+            self.add(key, size)
+
+    def iteritems(self):
+        return ((key, size) for size, key in self.heap)
+
+
+class SpaceSaving(object):
+    """
+    The heaviest prefixes in capacity counters (weighted Space-Saving): a new prefix takes the counter of the lightest one,
+    starting from its size, so a size is overestimated by at most the size of the lightest counter (error),
+    itself at most total size / capacity, and every prefix heavier than that is kept
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        # lazy min-heap of (count, prefix), the entries of a prefix whose count changed since being stale
+        self.heap = []
+        # maximum overestimation added by merges
+        self.merged = 0
+
+    def __setitem__(self, prefix, count):
+        self.counts[prefix] = count
+        heapq.heappush(self.heap, (count, prefix))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, p) for p, c in self.counts.iteritems()]
+            heapq.heapify(self.heap)
+
+    def __getitem__(self, prefix):
+        if prefix in self.counts:
+            return self.counts[prefix]
+        if len(self.counts) < self.capacity:
+            return 0
+        #evict the lightest prefix, the new one starting from its count
+        while True:
+            count, lightest = heapq.heappop(self.heap)
+            if self.counts.get(lightest) == count:
+                del self.counts[lightest]
+                return count
+
+    def error(self):
+        """
+        Maximum overestimation of the size of a prefix
+        """
+        if len(self.counts) < self.capacity:
+            return self.merged
+        return max(self.merged, min(self.counts.itervalues()))
+
+    def merge(self, other):
+        """
+        Merge the counters of other, a prefix missing from one side counting as its error
+        """
+        error, other_error = self.error(), other.error()
+        counts = dict((prefix, count + other.counts.get(prefix, other_error)) for prefix, count in self.counts.iteritems())
+        for prefix, count in other.counts.iteritems():
+            if prefix not in counts:
+                counts[prefix] = count + error
+        self.counts = dict(heapq.nlargest(self.capacity, counts.iteritems(), key=lambda x: x[1]))
+        self.heap = [(count, prefix) for prefix, count in self.counts.iteritems()]
+        heapq.heapify(self.heap)
+        self.merged = error + other_error
+
+    def iteritems(self):
+        return self.counts.iteritems()
+
+
+class PrefixTree(object):
+    """
+    Sizes and numbers of keys of the prefixes of the keys, level by level up to depth segments,
+    the segments looking like ids (numbers, uuids, hex strings) being collapsed into * when collapse is set
+    """
+
+    # number, uuid or hex string of at least 8 characters
+    ids = re.compile(r'^(?:[0-9]+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|'
+                     r'[0-9a-fA-F]{8,})$')
+
+    def __init__(self, delim, depth, collapse=False):
+        self.delim = delim
+        self.depth = depth
+        self.collapse = collapse
+        # node: [size, keys, {segment: node}]
+        self.root = [0, 0, {}]
+
+    def add(self, key, size):
+        segments = key.split(self.delim, self.depth)
+        #the last segment is the rest of the key, not a prefix
+        del segments[-1]
+        node = self.root
+        node[0] += size
+        node[1] += 1
+        for segment in segments:
+            if self.collapse and self.ids.match(segment):
+                segment = '*'
+            children = node[2]
+            if segment not in children:
+                children[segment] = [0, 0, {}]
+            node = children[segment]
+            node[0] += size
+            node[1] += 1
+
+    def merge(self, other, node=None, other_node=None):
+        if node is None:
+            node, other_node = self.root, other.root
+        node[0] += other_node[0]
+        node[1] += other_node[1]
+        for segment, other_child in other_node[2].iteritems():
+            if segment not in node[2]:
+                node[2][segment] = [0, 0, {}]
+            self.merge(other, node[2][segment], other_child)
+
+    def walk(self, n, node=None, level=0, path=''):
+        """
+        Generator of (level, prefix, size, keys) of the nodes under node, depth first, the n heaviest children
+        of each node in order, then one (level, None, size, keys) for the other ones
+        """
+        if node is None:
+            node = self.root
+        children = sorted(node[2].iteritems(), key=lambda x: (x[1][0], x[0]), reverse=True)
+        for segment, child in children[:n]:
+            prefix = path + segment + self.delim
+            yield level, prefix, child[0], child[1]
+            for item in self.walk(n, child, level + 1, prefix):
+                yield item
+        others = [child for _, child in children[n:]]
+        if others:
+            yield level, None, sum(child[0] for child in others), sum(child[1] for child in others)
+
 
 class RedisMemStats(object):
     """
     Analyze the output of the memory report of rdb
     """
 
-    def __init__(self, prefix_delim=':'):
+    # numbers of keys and prefixes printed
+    top = 30
+
+    def __init__(self, prefix_delim=':', prefix_counters=None, tree_depth=None, collapse_ids=False, keys_by_db=False):
+        self.prefix_counters = prefix_counters
+        self.tree_depth = tree_depth
+        self.collapse_ids = collapse_ids
+        self.keys_by_db = keys_by_db
         self.line_count = 0
+        self.key_count = 0
         self.skipped_lines = 0
         self.total_size = 0
         self.dbs = defaultdict(int)
         self.types = defaultdict(int)
-        self.keys = defaultdict(int)
-        self.prefixes = defaultdict(int)
-        self.sizes = []
+        self.keys = TopKeys(self.top) if keys_by_db else defaultdict(int)
+        self.prefixes = defaultdict(int) if prefix_counters is None else SpaceSaving(prefix_counters)
         self._cached_sorts = {}
         self.prefix_delim = prefix_delim
+        self.tree = None if tree_depth is None else PrefixTree(prefix_delim, tree_depth, collapse_ids)
 
-    def _record_size(self, entry):
-        size = int(entry['size'])
+    def _record_size(self, db, ktype, key, size):
         self.total_size += size
-        self.dbs[entry['db']] += size
-        self.types[entry['type']] += size
-        self.keys[entry['key']] += size
-        pos = entry['key'].rfind(self.prefix_delim)
+        self.dbs[db] += size
+        self.types[ktype] += size
+        if self.keys_by_db:
+            self.keys.add((key, db), size)
+        else:
+            self.keys[key] += size
+        pos = key.rfind(self.prefix_delim)
         if pos is not -1:
-            self.prefixes[entry['key'][0:pos]] += size
-        # self.sizes.append((entry['size'], entry))
-
-    def _record_columns(self, sizes):
-        for size, entry in sizes:
-            mem = int(size)
-            self.dbs[entry['db']] += mem
-            self.types[entry['type']] += mem
-            self.keys[entry['key']] += mem
-            pos = entry['key'].rfind(self.prefix_delim)
-            if pos is not -1:
-                self.prefixes[entry['key'][0:pos]] += mem
+            self.prefixes[key[0:pos]] += size
+        if self.tree is not None:
+            self.tree.add(key, size)
 
     def _get_or_sort_list(self, ls):
         key = id(ls)
@@ -91,17 +317,52 @@ class RedisMemStats(object):
         return self._cached_sorts[key]
 
     def _general_stats(self):
-        return (
-            ("Lines Processed", self.line_count),
+        stats = (
+            ("Keys Processed", self.key_count) if self.key_count else ("Lines Processed", self.line_count),
         )
+        if isinstance(self.prefixes, SpaceSaving):
+            stats += (("Prefix Sizes Error", self.prefixes.error()),)
+        return stats
 
     def process_entry(self, entry):
-        self._record_size(entry)
-
-    def _top_n(self, stat, n=30):
-        sorted_items = sorted(
-            stat.iteritems(), key=lambda x: x[1], reverse=True)
-        return sorted_items[:n]
+        self._record_size(entry['db'], entry['type'], entry['key'], int(entry['size']))
+
+    def merge(self, other):
+        """
+        Add the stats of other, gathered from another part of the input
+        """
+        self.line_count += other.line_count
+        self.key_count += other.key_count
+        self.skipped_lines += other.skipped_lines
+        self.total_size += other.total_size
+        for db, size in other.dbs.iteritems():
+            self.dbs[db] += size
+        for ktype, size in other.types.iteritems():
+            self.types[ktype] += size
+        if self.keys_by_db:
+            self.keys.merge(other.keys)
+        else:
+            for key, size in other.keys.iteritems():
+                self.keys[key] += size
+        if isinstance(self.prefixes, SpaceSaving):
+            self.prefixes.merge(other.prefixes)
+        else:
+            for prefix, size in other.prefixes.iteritems():
+                self.prefixes[prefix] += size
+        if self.tree is not None:
+            self.tree.merge(other.tree)
+
+    def _top_n(self, stat, n=top):
+        return heapq.nlargest(n, stat.iteritems(), key=lambda x: (x[1], x[0]))
+
+    def _key_names(self, top):
+        """
+        Name the heaviest (key, db), followed by their db when the dump has several dbs, with --keys-by-db
+        """
+        if not self.keys_by_db:
+            return top
+        many = len(self.dbs) > 1
+        return [(key + ' (db %s)' % db if many else key, size) for (key, db), size in top]
 
     def humanize_bytes(self, size):
         for x in ['bytes', 'KB', 'MB', 'GB', 'TB']:
@@ -128,13 +389,32 @@ class RedisMemStats(object):
             print key, key_padding, '\t', val
         print
 
+    def _print_tree(self, title):
+        print title
+        print '=' * 40
+        rows = [('  ' * level + (prefix if prefix is not None else '(others)'), self.humanize_bytes(size),
+                 (float(size) / self.total_size) * 100 if self.total_size else 0.0, keys)
+                for level, prefix, size, keys in self.tree.walk(self.top)]
+        if not rows:
+            print 'n/a\n'
+            return
+
+        max_key_len = max((len(x[0]) for x in rows))
+        max_val_len = max((len(x[1]) for x in rows))
+        for key, val_h, percentage, keys in rows:
+            key_padding = max(max_key_len - len(key), 0) * ' '
+            val_padding = max(max_val_len - len(val_h), 0) * ' '
+            print key, key_padding, '\t', '%s%s\t(%.2f%%)\t%d keys' % (val_h, val_padding, percentage, keys)
+        print
+
     def print_stats(self):
         self._pretty_print(self._general_stats(), 'Overall Stats')
-        # self._record_columns(self.sizes)
         self._pretty_print(
             self._top_n(self.prefixes), 'Heaviest Prefixes', percentages=True)
+        if self.tree is not None:
+            self._print_tree('Prefix Tree')
         self._pretty_print(
-            self._top_n(self.keys), 'Heaviest Keys', percentages=True)
+            self._key_names(self._top_n(self.keys)), 'Heaviest Keys', percentages=True)
         self._pretty_print(
             self._top_n(self.dbs), 'Heaviest Dbs', percentages=True)
         self._pretty_print(
@@ -151,11 +431,55 @@ class RedisMemStats(object):
                 except ValueError as e:
                     self.skipped_lines += 1
                     continue
-                self.process_entry({'db': parts[0], 'type': parts[1], 'key': parts[2].replace('"', ''), 'size': parts[3]})
+                self._record_size(parts[0], parts[1], parts[2].replace('"', ''), size)
             else:
                 self.skipped_lines += 1
                 continue
 
+    def process_rdb(self, path):
+        """
+        Parse the RDB file path through mmap (gzipped when its name ends with .gz, decompressed in memory),
+        estimating the memory used by each key from the encodings and lengths of its value
+        """
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as f:
+                buf = f.read()
+            m = None
+        else:
+            f = io.open(path, 'rb')
+            try:
+                m = buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                f.close()
+        try:
+            for db, key, rtype, size, expire in redis_rdb.memory_entries(buf):
+                self.key_count += 1
+                self._record_size(str(db), RDB_TYPES[rtype], key, size)
+        finally:
+            if m is not None:
+                m.close()
+
+    def process_file(self, path, workers):
+        """
+        Parse the file path by chunks in workers processes, merging the stats of the chunks in order
+        """
+        chunks = [(path, start, end, self.prefix_delim, self.prefix_counters, self.tree_depth, self.collapse_ids,
+                   self.keys_by_db) for start, end in file_chunks(path)]
+        if workers < 2 or len(chunks) < 2:
+            for chunk in chunks:
+                self.merge(process_chunk(chunk))
+            return
+        pool = multiprocessing.Pool(min(workers, len(chunks)))
+        try:
+            for stats in pool.imap(process_chunk, chunks):
+                self.merge(stats)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
     def gen_redis_proto(self, *cmd):
         proto = ""
         proto += "*" + str(len(cmd)) + "\r\n"
@@ -189,7 +513,54 @@ if __name__ == '__main__':
         default=':',
         help="String to split on for delimiting prefix and rest of key",
         required=False)
+    parser.add_argument(
+        '--prefix-counters',
+        type=int,
+        default=None,
+        help="Number of prefixes counted, in bounded memory; all of them are counted otherwise",
+        required=False)
+    parser.add_argument(
+        '--tree-depth',
+        type=int,
+        default=None,
+        help="Number of levels of prefixes of the prefix tree to print",
+        required=False)
+    parser.add_argument(
+        '--collapse-ids',
+        action='store_true',
+        help="Collapse the numbers, uuids and hex strings of the prefix tree into *",
+        required=False)
+    parser.add_argument(
+        '--keys-by-db',
+        action='store_true',
+        help="List the heaviest keys of each db, in bounded memory, instead of summing their sizes by name",
+        required=False)
+    parser.add_argument(
+        '--rdb',
+        type=str,
+        default=None,
+        help="RDB file to parse instead of the output of the memory report of rdb",
+        required=False)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of processes parsing the chunks of the input file",
+        required=False)
     args = parser.parse_args()
-    counter = RedisMemStats(prefix_delim=args.prefix_delimiter)
-    counter.process_input(args.input)
+    if args.tree_depth is not None and args.tree_depth < 1:
+        parser.error("--tree-depth must be at least 1")
+    if args.prefix_counters is not None and args.prefix_counters < RedisMemStats.top:
+        parser.error("--prefix-counters must be at least %d" % RedisMemStats.top)
+    counter = RedisMemStats(prefix_delim=args.prefix_delimiter, prefix_counters=args.prefix_counters,
+                            tree_depth=args.tree_depth, collapse_ids=args.collapse_ids, keys_by_db=args.keys_by_db)
+    if args.rdb is not None:
+        if args.input is not sys.stdin:
+            parser.error("--rdb is incompatible with an input file")
+        counter.process_rdb(args.rdb)
+    elif args.input is sys.stdin:
+        counter.process_input(args.input)
+    else:
+        args.input.close()
+        counter.process_file(args.input.name, args.workers)
     counter.print_stats()
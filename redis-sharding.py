@@ -7,16 +7,56 @@ Reshard the keys in a number of source redis servers into another number of targ
 in order to scale an application.
 The script probably needs to be added to a cron job if the keys are a lot because it only reshards a fix number of keys at a time
 and continue from there on the next run. It does this until there is no more keys to reshard
+With --rebalance, the sources are the nodes of the current cluster and only the keys whose node changes in the
+targets cluster are moved, then deleted from their old node.
+With --rdb, the keys are read from snapshot files of the sources instead, without connecting to the sources.
 
 Usage: python redis-sharding.py [options]
 
 Options:
   -l ..., --limit=...         optional numbers of keys to reshard per run, if not defined 10000 is the default . e.g. 1000
+  --limit-bytes=...           optional estimated size in bytes of the keys to reshard per run, on top of the keys limit,
+                              so a run has a predictable cost whatever the size of its keys, stopping after the batch reaching it . e.g. 1073741824
+  --slo=...                   optional p99 latency in milliseconds of the source to stay under: an AIMD governor (redis_governor.py)
+                              halves the batches and the keys in flight and pauses between them when PINGs
+                              or the commands of the source get slower . e.g. 5
   -s ..., --sources=...       comma separated list of source redis servers "ip:port" to fetch keys from. e.g. 192.168.0.99:6379,192.168.0.100:6379
   -t ..., --targets=...       comma separated list target redis servers "node_i#ip:port" to reshard the keys to. e.g. node_1#192.168.0.101:6379,node_2#192.168.0.102:6379,node_3#192.168.0.103:6379
   -d ..., --databases=...     comma separated list of redis databases to select when resharding. e.g. 2,5
+  --match=...                 optional glob pattern of the keys to reshard, may be repeated, a single pattern being matched
+                              by SCAN or KEYS on the server, several ones on each SCAN page . e.g. session:*
+  --exclude=...               optional glob pattern of the keys not to reshard, may be repeated . e.g. session:tmp:*
+  --type=...                  optional type of the keys to reshard, matched by SCAN on redis >= 6.0 . e.g. hash
+  --min-size=...              optional estimated size in bytes of the smallest keys to reshard . e.g. 1024
+  --max-size=...              optional estimated size in bytes of the biggest keys to reshard, checked before any value
+                              is read . e.g. 1048576
   -h, --help                  show this help
   --clean                     clean all variables, temp lists created previously by the script
+  --scan                      walk the keyspace with SCAN instead of saving a temp keylist with KEYS,
+                              only the SCAN cursor is saved in the journal between runs (requires redis >= 2.8)
+  --async                     reshard the keys with the asyncio engine of redis_async.py, keeping many keys in flight
+                              over high latency links (requires python >= 3.7 and redis-py >= 4.2)
+  --inflight=...              optional numbers of keys in flight on each source and on each target node with --async,
+                              a node window shrinks when its write latency rises, if not defined 100 is the default
+  --partitioner=...           optional scheme mapping the keys to the nodes: modulo, ketama or slots (see redis_partition.py),
+                              if not defined modulo is the default . e.g. ketama
+  --rebalance                 the sources are the nodes of the current cluster (same partitioner, before adding or removing
+                              nodes): move only the keys whose node changes in the targets cluster and delete them from their
+                              old node, walking the keyspace with SCAN and without flushing the targets (stop the writes first)
+  -w ..., --workers=...       optional numbers of worker processes resharding the source server-dbs in parallel, one each at a time
+                              with its own connections, reporting the keys/s per source and per node, if not defined 1 is the default . e.g. 6
+  --rdb=...                   comma separated list of dump.rdb files of the sources (gzipped when their name ends with .gz) to
+                              reshard instead of the sources, which are never connected to: each file is parsed by chunks and
+                              its keys written to their node with pipelined RESTORE, the filters applied, in one run
+                              (requires nodes running the same or a newer redis version, see redis_rdb.py)
+  --journal=...               optional local directory of the checkpoint journals, temp keylists and lock file of the script,
+                              nothing being written to the sources (see redis_journal.py), if not defined . is the default
+  --verify                    compare the targets cluster with the sources instead of resharding, walking all of them with SCAN
+                              in parallel: missing keys, values (DUMP or canonical digests), ttls, extra keys and keys on another
+                              node than the one of the partitioner are written to the report rsk_verify.report of the journal
+                              directory, and the keys to reshard again saved as the temp keylists so the next run without
+                              --scan reshards only them (see redis_verify.py)
+  --sample=...                optional fraction of the keys checked by --verify, if not defined all the keys are . e.g. 0.01
 
 Dependencies: redis (redis-py: sudo pip install redis)
 
@@ -31,6 +71,9 @@ config = {
   'node_2':{'host':'192.168.0.102', 'port':6379},
   'node_3':{'host':'192.168.0.103', 'port':6379},
 }
+That is the modulo partitioner, which moves most of the keys when a node is added. The ketama and slots partitioners
+only move about 1/N of them: a ketama ring of the node names, or the 16384 slots of Redis Cluster (crc16 of the key
+or of its {hash tag}), your client library has to use the same one.
 
 
 
@@ -53,6 +96,21 @@ Examples:
   --targets="node_1#192.168.0.101:6379,node_2#192.168.0.102:6379,node_3#192.168.0.103:6379" \
   --databases=2,5
 
+  python redis-sharding.py --scan \
+  --sources=192.168.0.99:6379,192.168.0.100:6379 \
+  --targets="node_1#192.168.0.101:6379,node_2#192.168.0.102:6379,node_3#192.168.0.103:6379" \
+  --databases=2,5
+
+  python redis-sharding.py --rebalance --partitioner=ketama \
+  --sources=192.168.0.101:6379,192.168.0.102:6379,192.168.0.103:6379 \
+  --targets="node_1#192.168.0.101:6379,node_2#192.168.0.102:6379,node_3#192.168.0.103:6379,node_4#192.168.0.104:6379" \
+  --databases=2,5
+
+  python redis-sharding.py \
+  --rdb=/backup/redis-99.rdb,/backup/redis-100.rdb.gz \
+  --targets="node_1#192.168.0.101:6379,node_2#192.168.0.102:6379,node_3#192.168.0.103:6379" \
+  --databases=2,5
+
 """
 
 __author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
@@ -64,37 +122,123 @@ __license__ = "MIT"
 
 import redis
 import time
-import binascii
 import sys
 import getopt
+import multiprocessing
+import os
+import threading
+
+import redis_batch
+import redis_filter
+import redis_governor
+import redis_journal
+import redis_partition
+import redis_verify
 
 
-class RedisSharding:
+class RedisSharding(redis_batch.KeyBatches):
     """A class for resharding the keys in a number of source redis servers into another number of target cluster of redis servers
     """
 
+    # words of the progress output of the batches (see redis_batch)
+    action = 'resharding'
+    done = 'resharded'
+
     #some key prefix for this script
     shardprefix = 'rsk:'
     keylistprefix = 'keylist:'
     hkeylistprefix = 'havekeylist:'
+    cursorprefix = 'cursor:'
 
-    # hold the redis handle of the targets cluster
-    targets_redis = {}
+    # local directory of the checkpoint journals, temp keylists and lock file
+    journal_dir = '.'
 
     # numbers of keys to resharding on each iteration
     limit = 10000
 
-    def __init__(self, sources, targets, dbs):
+    # numbers of keys SCAN looks at on each call when walking the keyspace
+    scan_count = 1000
+
+    # numbers of elements of a hash, list, set or zset read and written at once
+    chunk_size = 1000
+
+    # numbers of keys between two checkpoints
+    batch_size = 500
+
+    # estimated size in bytes of the keys of a batch, and of a key resharded alone in the big keys lane
+    batch_bytes = 1 << 20
+    big_key_bytes = 8 << 20
+
+    # estimated size in bytes of the keys to reshard on each run, None for no limit
+    limit_bytes = None
+
+    # estimated size of an element of a collection when MEMORY USAGE is not available (redis < 4.0)
+    element_bytes = 64
+
+    # p99 latency in seconds of the source the governor keeps the resharding under, None for no throttling
+    slo = None
+
+    # numbers of keys in flight on the source and on each target with the asyncio engine
+    inflight = 100
+
+    # numbers of commands and bytes buffered for a node before its pipeline is sent
+    pipeline_size = 1000
+    pipeline_bytes = 1 << 20
+
+    # seconds between two progress reports of the worker processes
+    progress_interval = 5.0
+
+    # fraction of the keys checked by the verify mode, None for all the keys
+    sample = None
+
+    # difference in milliseconds allowed between the ttls of a key in a source and in its node,
+    # the ttls being copied in seconds
+    ttl_tolerance = 2000
+
+    def __init__(self, sources, targets, dbs, scan=False, asynchronous=False, partitioner='modulo', rebalance=False, workers=1):
         self.sources = sources
         self.targets = targets
         self.len_targets = len(targets)
         self.dbs = dbs
+        #the sources being emptied while they are walked, only their SCAN cursor is reliable
+        self.scan = scan or rebalance
+        self.asynchronous = asynchronous
+        self.partitioner_name = partitioner
+        self.partitioner = redis_partition.partitioner(partitioner, list(targets))
+        self.rebalance = rebalance
+        self.workers = workers
+        self.keys_read = 0
+        self.memory_usage = True
+        #numbers of keys whose writes to the new cluster failed
+        self.failed = 0
+        self.governor = None
+        self.journals = {}
+        self.keyfilter = redis_filter.KeyFilter()
+        self.owners = self.source_nodes() if rebalance else {}
+        #keys written to each node since the last progress report, sent to the progress queue by the worker processes
+        self.node_moved = {}
+        self.node_totals = {}
+        self.progress = None
+        # hold the redis handles of the targets cluster, each worker process having its own
+        self.targets_redis = {}
         for node in self.targets:
             for db in self.dbs:
                 self.targets_redis[node + '_' + str(db)] = redis.StrictRedis(host=self.targets[node]['host'], port=self.targets[node]['port'], db=db)
 
+    def journal_path(self, name):
+        """Function returning the path of the local file name of the script, e.g. the journal or the keylist of a server-db.
+        """
+        return os.path.join(self.journal_dir, (self.shardprefix + name).replace(':', '_'))
+
+    def journal(self, servername):
+        """Function returning the checkpoint journal of a source server-db, or of the script for 'run'.
+        """
+        if servername not in self.journals:
+            self.journals[servername] = redis_journal.Journal(self.journal_path(servername + '.journal'))
+        return self.journals[servername]
+
     def save_keylists(self):
-        """Function for each server in the sources, save all its keys' names into a list for later usage.
+        """Function for each server in the sources, save all its keys' names into a local keylist for later usage.
         """
 
         for server in self.sources:
@@ -104,25 +248,19 @@ class RedisSharding:
                 #get redis handle for server-db
                 r = redis.StrictRedis(
                     host=server['host'], port=server['port'], db=db)
-                dbsize = r.dbsize()
+                journal = self.journal(servername)
                 #check whether we already have the list, if not get it
-                hkl = r.get(
-                    self.shardprefix + self.hkeylistprefix + servername)
-                if hkl is None or int(hkl) != 1:
-                    print "Saving the keys in %s to temp keylist...\n" % servername
-                    moved = 0
-                    r.delete(
-                        self.shardprefix + self.keylistprefix + servername)
-                    for key in r.keys('*'):
-                        moved += 1
-                        r.rpush(self.shardprefix +
-                                self.keylistprefix + servername, key)
-                        if moved % self.limit == 0:
-                            print  "%d keys of %s inserted in temp keylist at %s...\n" % (moved, servername, time.strftime("%Y-%m-%d %I:%M:%S"))
-
-                    r.set(self.shardprefix +
-                          self.hkeylistprefix + servername, 1)
-                print "ALL %d keys of %s already inserted to temp keylist ...\n\n" % (dbsize - 1, servername)
+                if journal.get('keys') is None:
+                    print ("Saving the keys in %s to temp keylist...\n" % servername)
+                    keylist = redis_journal.KeyList(self.journal_path(servername + '.keylist'))
+                    for key in self.keyfilter.keys(r):
+                        keylist.append(key)
+                        if keylist.length % self.limit == 0:
+                            print ("%d keys of %s inserted in temp keylist at %s...\n" % (keylist.length, servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+                    keylist.close()
+                    journal.mset({'keys': keylist.length, 'keymoved': 0, 'keyoffset': 0})
+                print ("ALL %d keys of %s already inserted to temp keylist ...\n\n" % (journal.get('keys'), servername))
 
     def reshard_db(self, limit=None):
         """Function for each server in the sources, reshard all its keys into the new target cluster.
@@ -138,79 +276,444 @@ class RedisSharding:
         if limit is not None:
             self.limit = limit
 
+        if self.workers > 1:
+            self.parallel_reshard()
+            return
+
+        for server in self.sources:
+            for db in self.dbs:
+                self.reshard_server(server, db)
+
+    def reshard_server(self, server, db):
+        """Function to reshard the next self.limit keys of a source server-db into the new target cluster.
+        Return the numbers of keys resharded.
+        """
+        servername = server['host'] + ":" + str(
+            server['port']) + ":" + str(db)
+        print ("Processing keys resharding of server %s at %s...\n" % (
+            servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+        #get redis handle for current source server-db
+        r = redis.StrictRedis(
+            host=server['host'], port=server['port'], db=db)
+        #the keys in flight are only throttled with the asyncio engine, the others copying one key at a time
+        self.governor = None if self.slo is None else redis_governor.Governor(
+            r, [self.targets_redis[node + '_' + str(db)] for node in self.targets], self.slo, self.batch_size,
+            self.inflight if self.asynchronous else 1)
+
+        if self.scan:
+            batches = self.scan_batches(r, servername)
+        else:
+            batches = self.keylist_batches(r, servername)
+        moved = self.reshard_batches(r, server, db, servername, batches)
+
+        print ("%d keys have been resharded on %s at %s%s\n" % (moved, servername, time.strftime("%Y-%m-%d %I:%M:%S"), self.throttle_state()))
+        return moved
+
+    def parallel_reshard(self):
+        """Function to reshard the source server-dbs in a pool of self.workers processes, one source server-db per process
+        at a time, each process having its own source and target connections and saving the checkpoints of its source in its journal.
+        The keys resharded per source and written per node, and their rates, are reported every self.progress_interval seconds.
+        """
+        progress = multiprocessing.Queue()
+        pool = multiprocessing.Pool(self.workers, init_reshard_worker, (
+            self.sources, self.targets, self.dbs, self.scan, self.asynchronous, self.partitioner_name, self.rebalance,
+            self.inflight, self.limit, self.limit_bytes, self.slo, self.journal_dir, self.keyfilter, progress))
+        try:
+            results = [pool.apply_async(reshard_worker, (server, db)) for server in self.sources for db in self.dbs]
+            sources = {}
+            nodes = {}
+            last = ({}, {})
+            reported = started = time.time()
+            while not all(result.ready() for result in results):
+                time.sleep(0.1)
+                while not progress.empty():
+                    servername, moved, node_moved = progress.get()
+                    sources[servername] = sources.get(servername, 0) + moved
+                    for node in node_moved:
+                        nodes[node] = nodes.get(node, 0) + node_moved[node]
+                if time.time() - reported >= self.progress_interval:
+                    print_progress(sources, nodes, last, time.time() - reported)
+                    last = (dict(sources), dict(nodes))
+                    reported = time.time()
+
+            #the queue may lag behind, the totals come from the workers
+            sources = {}
+            nodes = {}
+            for result in results:
+                servername, moved, node_moved, failed = result.get()
+                sources[servername] = moved
+                self.failed += failed
+                for node in node_moved:
+                    nodes[node] = nodes.get(node, 0) + node_moved[node]
+            print_progress(sources, nodes, ({}, {}), time.time() - started)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def reshard_batches(self, r, server, db, servername, batches):
+        """Function to reshard the (keys, checkpoint) batches of a source server-db, a batch of pipelined keys at a time
+        or with the asyncio engine of redis_async when self.asynchronous is set.
+        A checkpoint is saved in the journal once its batch and all the ones before it are resharded.
+        Return the numbers of keys resharded.
+        """
+        progress = {'moved': 0}
+
+        def batch_done(copied, checkpoint):
+            moved = progress['moved']
+            if (moved + copied) // 10000 > moved // 10000:
+                print ("%d keys have been resharded on %s at %s...%s\n" % (
+                    moved + copied, servername, time.strftime("%Y-%m-%d %I:%M:%S"), self.throttle_state()))
+            progress['moved'] = moved + copied
+            if checkpoint:
+                self.journal(servername).mset(checkpoint)
+            if self.progress is not None:
+                self.progress.put((servername, copied, self.node_moved))
+                for node in self.node_moved:
+                    self.node_totals[node] = self.node_totals.get(node, 0) + self.node_moved[node]
+                self.node_moved = {}
+
+        if self.asynchronous:
+            self.async_reshard_batches(server, db, servername, batches, batch_done)
+        else:
+            for keys, checkpoint in batches:
+                failed = self.failed
+                copied = self.reshard_keys(r, keys, db, servername)
+                if self.failed > failed:
+                    #the next run starts again from the last checkpoint
+                    batch_done(copied, None)
+                    print ("Stopped resharding %s at %s, the checkpoint of the failed batch is not saved.\n" % (
+                        servername, time.strftime("%Y-%m-%d %I:%M:%S")))
+                    break
+                batch_done(copied, checkpoint)
+
+        return progress['moved']
+
+    def async_reshard_batches(self, server, db, servername, batches, batch_done):
+        """Function to reshard the (keys, checkpoint) batches of a source server-db with the asyncio engine of redis_async,
+        keeping up to self.inflight keys in flight on the source and on each node of the new cluster.
+        """
+        import redis_async
+
+        ra = redis_async.connect(server, db)
+        targets = {}
+        windows = {}
+        for node in self.targets:
+            targets[node] = redis_async.connect(self.targets[node], db)
+            windows[node] = redis_async.AdaptiveWindow(self.inflight)
+
+        def reshard_one(key):
+            node = self.key_node(key)
+            return redis_async.count_key(redis_async.run_steps(self.key_steps(key, servername, node), ra, targets[node], windows[node]),
+                                         self.node_moved, node)
+
+        redis_async.copy_batches(batches, reshard_one, self.inflight_limit, batch_done, [ra] + list(targets.values()))
+
+    def key_node(self, key):
+        """Function returning the name of the node of the new cluster holding a key.
+        """
+        #calculate reshard node of key
+        return self.partitioner.node(key)
+
+    def source_nodes(self):
+        """Function returning the names of the nodes of the new cluster that are also sources, by "ip:port" of source,
+        the servers being matched by their run_id so an other address of the same server is not taken for another one.
+        """
+        run_ids = {}
+        for node in self.targets:
+            run_ids[redis.StrictRedis(host=self.targets[node]['host'], port=self.targets[node]['port']).info()['run_id']] = node
+        owners = {}
+        for server in self.sources:
+            run_id = redis.StrictRedis(host=server['host'], port=server['port']).info()['run_id']
+            if run_id in run_ids:
+                owners[server['host'] + ":" + str(server['port'])] = run_ids[run_id]
+        return owners
+
+    def reshard_keys(self, r, keys, db, servername):
+        """Function to reshard a batch of keys from the source handle r, running the steps of all the keys side by side:
+        the source commands of each round go in one pipeline, and the writes are buffered in one pipeline per node,
+        sent every self.pipeline_size commands or self.pipeline_bytes bytes, so a batch takes a handful of round trips
+        instead of a few per key. A DEL on the source (rebalance) waits for the buffered writes to be sent.
+        An error of a buffered write is thrown into the steps of its key at its next step, as run_steps does, so the key
+        is never deleted from the source; the keys failing are counted in self.failed and not in the keys resharded.
+        Return the numbers of keys resharded.
+        """
+        pipes = {}
+
+        def flush(node):
+            pipe = pipes.pop(node)
+            for item, result in zip(pipe['items'], pipe['pipe'].execute(raise_on_error=False)):
+                if isinstance(result, Exception) and item['failed'] is None:
+                    item['failed'] = result
+
+        def write(item, args):
+            node = item['node']
+            if node not in pipes:
+                pipes[node] = {'pipe': self.targets_redis[node + '_' + str(db)].pipeline(transaction=False), 'count': 0, 'bytes': 0,
+                               'items': []}
+            pipe = pipes[node]
+            pipe['pipe'].execute_command(*args)
+            pipe['items'].append(item)
+            pipe['count'] += 1
+            pipe['bytes'] += sum(len(a) if isinstance(a, bytes) else len(str(a)) for a in args)
+            if pipe['count'] >= self.pipeline_size or pipe['bytes'] >= self.pipeline_bytes:
+                flush(node)
+
+        items = []
+        for key in keys:
+            node = self.key_node(key)
+            items.append({'key': key, 'steps': self.key_steps(key, servername, node), 'node': node, 'reply': None, 'error': None,
+                          'failed': None, 'wrote': False})
+
+        active = items
+        while active:
+            #run each key up to its next source command
+            reads = []
+            for item in active:
+                while True:
+                    if item['failed'] is not None:
+                        #a write of the key failed since its last step
+                        item['error'], item['failed'] = item['failed'], None
+                    try:
+                        if item['error'] is not None:
+                            step = item['steps'].throw(item['error'])
+                        else:
+                            step = item['steps'].send(item['reply'])
+                    except StopIteration:
+                        break
+                    except redis.ResponseError as e:
+                        #not handled by the steps, the key is not resharded
+                        item['failed'] = e
+                        break
+                    item['reply'] = item['error'] = None
+                    if step[0] == 'source':
+                        reads.append((item, step))
+                        break
+                    item['wrote'] = True
+                    write(item, step[1:])
+
+            active = [item for item, step in reads]
+            if [step for item, step in reads if step[1] == 'DEL']:
+                for node in list(pipes):
+                    flush(node)
+                #never delete a key whose writes failed, its error is thrown into its steps instead
+                reads = [(item, step) for item, step in reads if item['failed'] is None]
+            p = r.pipeline(transaction=False)
+            for item, step in reads:
+                p.execute_command(*step[1:])
+            for (item, step), reply in zip(reads, p.execute(raise_on_error=False) if reads else []):
+                if isinstance(reply, redis.ResponseError):
+                    item['error'] = reply
+                else:
+                    item['reply'] = reply
+
+        for node in list(pipes):
+            flush(node)
+        resharded = 0
+        failed = [item for item in items if item['failed'] is not None]
+        for item in items:
+            if item['wrote'] and item['failed'] is None:
+                resharded += 1
+                self.node_moved[item['node']] = self.node_moved.get(item['node'], 0) + 1
+        if failed:
+            self.failed += len(failed)
+            print ("%d keys of %s failed on the new cluster, e.g. %r on %s: %s\n" % (
+                len(failed), servername, failed[0]['key'], failed[0]['node'], failed[0]['failed']))
+        return resharded
+
+    def reshard_key(self, r, key, db, servername):
+        """Function to reshard a key and its expire time from the source handle r into its node of the new cluster.
+        Return False if the key was not resharded.
+        """
+        #get redis handle for corresponding target server-db
+        node = self.key_node(key)
+        rr = self.targets_redis[node + '_' + str(db)]
+        return redis_batch.run_steps(self.key_steps(key, servername, node), r, rr)
+
+    def key_steps(self, key, servername, node):
+        """Function returning the steps of a key going to node: the steps of copy_key_steps,
+        or of move_key_steps when rebalancing.
+        """
+        if self.rebalance:
+            return self.move_key_steps(key, servername, node)
+        return self.copy_key_steps(key, servername)
+
+    def move_key_steps(self, key, servername, node):
+        """Generator describing the move of a key of a node of the current cluster to its node in the new one,
+        as the steps of copy_key_steps followed by the deletion of the key in the source.
+        Keys staying on the same node are not moved.
+        """
+        if self.owners.get(servername[:servername.rfind(':')]) == node:
+            return
+        steps = self.copy_key_steps(key, servername)
+        reply = None
+        moved = False
+        while True:
+            try:
+                step = steps.send(reply)
+            except StopIteration:
+                break
+            moved = moved or step[0] == 'target'
+            reply = yield step
+        if moved:
+            yield ('source', 'DEL', key)
+
+    def bookkeeping_keys(self, servername):
+        """Function returning the names of the temp variables older versions of the script stored in the source server-db,
+        never resharded.
+        """
+        names = (self.shardprefix + "run", self.shardprefix + "firstrun",
+                 self.shardprefix + "keymoved:" + servername,
+                 self.shardprefix + self.keylistprefix + servername,
+                 self.shardprefix + self.hkeylistprefix + servername,
+                 self.shardprefix + self.cursorprefix + servername)
+        #compared with the raw key names, binary ones never being decoded
+        return tuple(name.encode('utf-8') for name in names)
+
+    def verify(self):
+        """Function to compare the targets cluster with the sources once the keys are resharded, each source server-db and
+        each node server-db being walked with SCAN in its own thread: the keys of the sources are compared with their node,
+        the keys of the nodes are checked on the sources and on the partitioner (see redis_verify). When rebalancing,
+        the sources being the nodes, only the node of each key is checked. The mismatches are written to the report
+        of the journal directory, and the keys to reshard again saved as the temp keylists of their source server-db.
+        Return the numbers of mismatches.
+        """
+        report = redis_verify.Report()
+        walks = []
+        for db in self.dbs:
+            if not self.rebalance:
+                for server in self.sources:
+                    walks.append(threading.Thread(target=self.verify_source, args=(server, db, report)))
+            for node in self.targets:
+                walks.append(threading.Thread(target=self.verify_node, args=(node, db, report)))
+
+        print ("Verifying the targets cluster at %s...\n" % time.strftime("%Y-%m-%d %I:%M:%S"))
+        for walk in walks:
+            walk.daemon = True
+            walk.start()
+        for walk in walks:
+            walk.join()
+
+        report.write(self.journal_path('verify.report'))
         for server in self.sources:
             for db in self.dbs:
                 servername = server['host'] + ":" + str(
                     server['port']) + ":" + str(db)
-                print "Processing keys resharding of server %s at %s...\n" % (
-                    servername, time.strftime("%Y-%m-%d %I:%M:%S"))
-                #get redis handle for current source server-db
-                r = redis.StrictRedis(
-                    host=server['host'], port=server['port'], db=db)
-                moved = 0
-                dbsize = r.dbsize() - 1
-                #get keys already moved
-                keymoved = r.get(self.shardprefix + "keymoved:" + servername)
-                keymoved = 0 if keymoved is None else int(keymoved)
-                #check if we already have all keys resharded for current source server-db
-                if dbsize <= keymoved:
-                    print "ALL %d keys from %s have already been resharded.\n" % (dbsize, servername)
-                    #move to next source server-db in iteration
+                keys = report.keys(servername, redis_verify.RECOPY)
+                if keys:
+                    keylist = redis_journal.KeyList(self.journal_path(servername + '.keylist'))
+                    for key in keys:
+                        keylist.append(key)
+                    keylist.close()
+                    self.journal(servername).mset({'keys': keylist.length, 'keymoved': 0, 'keyoffset': 0})
+                    print ("%d keys of %s to reshard again saved to its temp keylist.\n" % (len(keys), servername))
+
+        print ("%d mismatches found at %s, report saved to %s:\n%s\n" % (
+            report.total(), time.strftime("%Y-%m-%d %I:%M:%S"), self.journal_path('verify.report'), report.summary()))
+        return report.total()
+
+    def verify_source(self, server, db, report):
+        """Function run in a thread, comparing the keys of a source server-db with their node, by pipelined batches.
+        """
+        servername = server['host'] + ":" + str(
+            server['port']) + ":" + str(db)
+        r = redis.StrictRedis(
+            host=server['host'], port=server['port'], db=db)
+        bookkeeping = self.bookkeeping_keys(servername)
+        try:
+            for keys in redis_verify.scan_batches(r, self.keyfilter, self.scan_count, self.sample):
+                if self.keyfilter.sizes():
+                    keys = [key for key, key_bytes in zip(keys, self.key_sizes(r, keys)) if self.keyfilter.sized(key_bytes)]
+                nodes = {}
+                for key in keys:
+                    if key not in bookkeeping:
+                        nodes.setdefault(self.key_node(key), []).append(key)
+                for node in nodes:
+                    report.add(servername, len(nodes[node]), redis_verify.compare_keys(
+                        r, self.targets_redis[node + '_' + str(db)], nodes[node], self.ttl_tolerance))
+        except redis.RedisError as e:
+            report.fail(servername, e)
+
+    def verify_node(self, node, db, report):
+        """Function run in a thread, checking that the keys of a node server-db belong to it and exist in a source.
+        """
+        nodename = node + "#" + self.targets[node]['host'] + ":" + str(
+            self.targets[node]['port']) + ":" + str(db)
+        rr = redis.StrictRedis(
+            host=self.targets[node]['host'], port=self.targets[node]['port'], db=db)
+        sources = [redis.StrictRedis(host=server['host'], port=server['port'], db=db) for server in self.sources]
+        try:
+            for keys in redis_verify.scan_batches(rr, self.keyfilter, self.scan_count, self.sample):
+                mismatches = [(redis_verify.MISPLACED, key) for key in keys if self.key_node(key) != node]
+                if not self.rebalance:
+                    placed = [key for key in keys if self.key_node(key) == node]
+                    mismatches.extend((redis_verify.EXTRA, key) for key in redis_verify.missing_keys(sources, placed))
+                report.add(nodename, len(keys), mismatches)
+        except redis.RedisError as e:
+            report.fail(nodename, e)
+
+    def reshard_rdb(self, path):
+        """Function to reshard the keys of the RDB file path, a snapshot of a source, without connecting to the source:
+        the file is parsed by chunks as it is read and its keys written to their node of the new cluster with RESTORE ... REPLACE,
+        buffered in one pipeline per node and db sent every self.pipeline_size commands or self.pipeline_bytes bytes, the key
+        filter applied. The whole file is resharded in one run, a run cut short being done again from the start.
+        Keys already expired are skipped. The keys rejected by their node are counted in self.failed.
+        Return the numbers of keys resharded.
+        """
+        import redis_rdb
+
+        pipes = {}
+        counts = {'resharded': 0, 'failed': 0}
+        node_moved = {}
+
+        def flush(handle):
+            pipe = pipes.pop(handle)
+            for (key, node), result in zip(pipe['keys'], pipe['pipe'].execute(raise_on_error=False)):
+                if not isinstance(result, Exception):
+                    counts['resharded'] += 1
+                    node_moved[node] = node_moved.get(node, 0) + 1
                     continue
-
-                print "Started resharding of %s keys from %d to %d at %s...\n" % (servername, keymoved, dbsize, time.strftime("%Y-%m-%d %I:%M:%S"))
-                #max index for lrange
-                newkeymoved = keymoved + \
-                    self.limit if dbsize > keymoved + self.limit else dbsize
-
-                for key in r.lrange(self.shardprefix + self.keylistprefix + servername, keymoved, newkeymoved):
-                    #calculate reshard node of key
-                    node = str((abs(binascii.crc32(
-                        key) & 0xffffffff) % self.len_targets) + 1)
-                    #get key type
-                    ktype = r.type(key)
-                    #if undefined type go to next key
-                    if ktype == 'none':
-                        continue
-
-                    #get redis handle for corresponding target server-db
-                    rr = self.targets_redis['node_' + node + '_' + str(db)]
-                    #save key to new cluster server-db
-                    if ktype == 'string':
-                        rr.set(key, r.get(key))
-                    elif ktype == 'hash':
-                        rr.hmset(key, r.hgetall(key))
-                    elif ktype == 'list':
-                        if key == self.shardprefix + "keylist:" + servername:
-                            continue
-                        #value = r.lrange(key, 0, -1)
-                        #rr.rpush(key, *value)
-                        for k in r.lrange(key, 0, -1):
-                            rr.rpush(key, k)
-                    elif ktype == 'set':
-                        #value = r.smembers(key)
-                        #rr.sadd(key, *value)
-                        for k in r.smembers(key):
-                            rr.sadd(key, k)
-                    elif ktype == 'zset':
-                        #value = r.zrange(key, 0, -1, withscores=True)
-                        #rr.zadd(key, **dict(value))
-                        for k, v in r.zrange(key, 0, -1, withscores=True):
-                            rr.zadd(key, v, k)
-
-                    # Handle keys with an expire time set
-                    kttl = r.ttl(key)
-                    kttl = -1 if kttl is None else int(kttl)
-                    if kttl != -1:
-                        rr.expire(key, kttl)
-
-                    moved += 1
-
-                    if moved % 10000 == 0:
-                        print "%d keys have been resharded on %s at %s...\n" % (moved, servername, time.strftime("%Y-%m-%d %I:%M:%S"))
-
-                r.set(self.shardprefix + "keymoved:" + servername, newkeymoved)
-                print "%d keys have been resharded on %s at %s\n" % (newkeymoved, servername, time.strftime("%Y-%m-%d %I:%M:%S"))
+                if 'payload version' in str(result):
+                    exit('%s rejects the RDB payloads of the snapshot (%s), --rdb requires nodes running the same or a newer redis version.' % (
+                        handle, result))
+                if not counts['failed']:
+                    print ("Error on %s of the new cluster for %r: %s\n" % (handle, key, result))
+                counts['failed'] += 1
+
+        print ("Processing keys resharding of snapshot %s at %s...\n" % (path, time.strftime("%Y-%m-%d %I:%M:%S")))
+        queued = 0
+        for db, key, rtype, payload, expire in redis_rdb.read_file(path):
+            if db not in self.dbs or not self.keyfilter.entry(key, redis_rdb.TYPES[rtype], len(payload)):
+                continue
+            kttl = 0
+            if expire is not None:
+                kttl = expire - int(time.time() * 1000)
+                #already expired
+                if kttl <= 0:
+                    continue
+            node = self.key_node(key)
+            handle = node + '_' + str(db)
+            if handle not in pipes:
+                pipes[handle] = {'pipe': self.targets_redis[handle].pipeline(transaction=False), 'count': 0, 'bytes': 0, 'keys': []}
+            pipe = pipes[handle]
+            pipe['pipe'].execute_command('RESTORE', key, kttl, payload, 'REPLACE')
+            pipe['keys'].append((key, node))
+            pipe['count'] += 1
+            pipe['bytes'] += len(key) + len(payload)
+            if pipe['count'] >= self.pipeline_size or pipe['bytes'] >= self.pipeline_bytes:
+                flush(handle)
+            queued += 1
+            if queued % 10000 == 0:
+                print ("%d keys have been resharded from %s at %s...\n" % (counts['resharded'], path, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+        for handle in list(pipes):
+            flush(handle)
+        print ("%d keys have been resharded from %s at %s (%s)\n" % (
+            counts['resharded'], path, time.strftime("%Y-%m-%d %I:%M:%S"),
+            ', '.join('%s: %d' % (node, node_moved[node]) for node in sorted(node_moved))))
+        if counts['failed']:
+            self.failed += counts['failed']
+            print ("%d keys of %s failed on the new cluster.\n" % (counts['failed'], path))
+        return counts['resharded']
 
     def flush_targets(self):
         """Function to flush all targets server in the new cluster.
@@ -221,35 +724,80 @@ class RedisSharding:
             db = handle[handle.rfind('_') + 1:]
             servername = self.targets[server]['host'] + ":" + \
                 str(self.targets[server]['port']) + ":" + db
-            print "Flushing server %s at %s...\n" % (
-                servername, time.strftime("%Y-%m-%d %I:%M:%S"))
+            print ("Flushing server %s at %s...\n" % (
+                servername, time.strftime("%Y-%m-%d %I:%M:%S")))
             r = self.targets_redis[handle]
             r.flushdb()
-            print "Flushed server %s at %s...\n" % (
-                servername, time.strftime("%Y-%m-%d %I:%M:%S"))
+            print ("Flushed server %s at %s...\n" % (
+                servername, time.strftime("%Y-%m-%d %I:%M:%S")))
 
     def clean(self):
         """Function to clean all variables, temp lists created previously by the script.
         """
 
-        print "Cleaning all temp variables...\n"
+        print ("Cleaning all temp variables...\n")
         for server in self.sources:
             for db in self.dbs:
                 servername = server['host'] + ":" + str(
                     server['port']) + ":" + str(db)
-                r = redis.StrictRedis(
-                    host=server['host'], port=server['port'], db=db)
-                r.delete(self.shardprefix + "keymoved:" + servername)
-                r.delete(self.shardprefix + self.keylistprefix + servername)
-                r.delete(self.shardprefix + self.hkeylistprefix + servername)
-                r.delete(self.shardprefix + "firstrun")
-                r.delete(self.shardprefix + 'run')
-        print "Done.\n"
+                redis_journal.remove(self.journal_path(servername + '.journal'))
+                redis_journal.remove(self.journal_path(servername + '.keylist'))
+        redis_journal.remove(self.journal_path('run.journal'))
+        redis_journal.remove(self.journal_path('verify.report'))
+        print ("Done.\n")
+
+
+#RedisSharding instance of a worker process of the pool
+worker = None
+
+
+def init_reshard_worker(sources, targets, dbs, scan, asynchronous, partitioner, rebalance, inflight, limit, limit_bytes, slo, journal_dir,
+                        keyfilter, progress):
+    """Function run once in each worker process to open its own target connections.
+    """
+    global worker
+    worker = RedisSharding(sources, targets, dbs, scan, asynchronous, partitioner, rebalance)
+    worker.inflight = inflight
+    worker.limit = limit
+    worker.limit_bytes = limit_bytes
+    worker.slo = slo
+    worker.journal_dir = journal_dir
+    worker.keyfilter = keyfilter
+    worker.progress = progress
+
+
+def reshard_worker(server, db):
+    """Function resharding a source server-db in a worker process.
+    Return (servername, numbers of keys resharded, numbers of keys written per node, numbers of keys failed).
+    """
+    servername = server['host'] + ":" + str(server['port']) + ":" + str(db)
+    worker.node_totals = {}
+    worker.failed = 0
+    moved = worker.reshard_server(server, db)
+    return servername, moved, worker.node_totals, worker.failed
+
 
+def print_progress(sources, nodes, last, elapsed):
+    """Function printing the keys resharded per source and written per node, with their rates since the last report.
+    """
+    print ("Progress at %s:" % time.strftime("%Y-%m-%d %I:%M:%S"))
+    for name, counts, previous in (('source', sources, last[0]), ('node', nodes, last[1])):
+        for key in sorted(counts, key=redis_partition.node_order):
+            print ("  %s %s: %d keys, %.1f keys/s" % (name, key, counts[key], (counts[key] - previous.get(key, 0)) / max(elapsed, 0.001)))
+    print ("")
 
-def main(sources, targets, databases, limit=None, clean=False):
+
+def main(sources, targets, databases, limit=None, clean=False, scan=False, asynchronous=False, inflight=None, partitioner='modulo',
+         rebalance=False, workers=1, limit_bytes=None, slo=None, journal_dir=None, verify=False, sample=None, matches=None,
+         excludes=None, ktype=None, min_size=None, max_size=None, rdb=None):
     sources_cluster = []
-    for k in sources.split(','):
+    #with --rdb, the keys are read from the snapshots, the sources are never connected to
+    rdb_files = rdb.split(',') if rdb is not None else []
+    if rdb_files and (rebalance or verify or workers > 1 or asynchronous):
+        exit('Please --rdb reshards the keys of snapshots, it can not be used with --rebalance, --verify, --workers or --async.')
+    if sources is None:
+        sources = '' if not rdb_files else None
+    for k in sources.split(',') if sources is not None else []:
         so = k.split(':')
         if len(so) == 2:
             sources_cluster.append({'host': so[0], 'port': int(so[1])})
@@ -278,42 +826,90 @@ def main(sources, targets, databases, limit=None, clean=False):
 
     try:
         r = redis.StrictRedis(host=sources_cluster[0]['host'],
-                              port=sources_cluster[0]['port'], db=dbs[0])
+                              port=sources_cluster[0]['port'], db=dbs[0]) if sources_cluster else None
     except AttributeError as e:
         exit('Please this script requires redis-py >= 2.4.10, your current version is :' + redis.__version__)
 
-    rsd = RedisSharding(sources_cluster, targets_cluster, dbs)
-
-    if clean == False:
-        #check if script already running
-        run = r.get(rsd.shardprefix + "run")
-        if run is not None and int(run) == 1:
-            exit('another process already running the script')
-        r.set(rsd.shardprefix + 'run', 1)
-
-        rsd.save_keylists()
-
-        firstrun = r.get(rsd.shardprefix + "firstrun")
-        firstrun = 0 if firstrun is None else int(firstrun)
-        if firstrun == 0:
-            rsd.flush_targets()
-            r.set(rsd.shardprefix + "firstrun", 1)
-
-        rsd.reshard_db(limit)
+    if asynchronous:
+        try:
+            import redis_async
+        except (ImportError, SyntaxError):
+            exit('Please --async requires python >= 3.7 and redis-py >= 4.2, your current version is :' + redis.__version__)
+
+    if partitioner not in redis_partition.PARTITIONERS:
+        exit('Supplied partitioner is wrong, use one of: ' + ', '.join(sorted(redis_partition.PARTITIONERS)))
+
+    rsd = RedisSharding(sources_cluster, targets_cluster, dbs, scan, asynchronous, partitioner, rebalance, workers)
+    if inflight is not None:
+        rsd.inflight = inflight
+    if limit_bytes is not None:
+        rsd.limit_bytes = limit_bytes
+    if slo is not None:
+        rsd.slo = slo / 1000.0
+    if journal_dir is not None:
+        rsd.journal_dir = journal_dir
+    if sample is not None:
+        rsd.sample = sample
+    rsd.keyfilter = redis_filter.KeyFilter(matches, excludes, ktype, min_size, max_size)
+
+    #check if script already running, the lock being released when the process exits
+    lockfile = redis_journal.lock(rsd.journal_path('run.lock'))
+    if lockfile is None:
+        exit('another process already running the script')
+
+    mismatches = 0
+    if verify:
+        mismatches = rsd.verify()
+    elif clean == False:
+        if not rsd.scan and not rdb_files:
+            rsd.save_keylists()
+
+        journal = rsd.journal('run')
+        if not journal.get('firstrun'):
+            #when rebalancing, the targets hold the keys
+            if not rebalance:
+                rsd.flush_targets()
+            journal.mset({'firstrun': 1})
+
+        if rdb_files:
+            for path in rdb_files:
+                rsd.reshard_rdb(path)
+        else:
+            rsd.reshard_db(limit)
     else:
         rsd.clean()
 
-    r.set(rsd.shardprefix + 'run', 0)
+    lockfile.close()
+    if mismatches or rsd.failed:
+        sys.exit(1)
 
 
 def usage():
-    print __doc__
+    print (__doc__)
 
 
 if __name__ == "__main__":
     clean = False
+    scan = False
+    asynchronous = False
+    inflight = None
+    partitioner = 'modulo'
+    rebalance = False
+    workers = 1
+    limit_bytes = None
+    slo = None
+    journal_dir = None
+    verify = False
+    sample = None
+    matches = []
+    excludes = []
+    ktype = None
+    min_size = max_size = None
+    sources = rdb = None
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hl:s:t:d:", ["help", "limit=", "sources=", "targets=", "databases=", "clean"])
+        opts, args = getopt.getopt(sys.argv[1:], "hl:s:t:d:w:", ["help", "limit=", "sources=", "targets=", "databases=", "clean", "scan", "async", "inflight=",
+                                                              "partitioner=", "rebalance", "workers=", "limit-bytes=", "slo=", "journal=", "verify", "sample=", "match=", "exclude=", "type=",
+                                                              "min-size=", "max-size=", "rdb="])
     except getopt.GetoptError:
         usage()
         sys.exit(2)
@@ -323,6 +919,40 @@ if __name__ == "__main__":
             sys.exit()
         elif opt == "--clean":
             clean = True
+        elif opt == "--scan":
+            scan = True
+        elif opt == "--async":
+            asynchronous = True
+        elif opt == "--inflight":
+            inflight = int(arg)
+        elif opt == "--partitioner":
+            partitioner = arg
+        elif opt == "--rebalance":
+            rebalance = True
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt == "--limit-bytes":
+            limit_bytes = int(arg)
+        elif opt == "--slo":
+            slo = float(arg)
+        elif opt == "--journal":
+            journal_dir = arg
+        elif opt == "--verify":
+            verify = True
+        elif opt == "--sample":
+            sample = float(arg)
+        elif opt == "--match":
+            matches.append(arg)
+        elif opt == "--exclude":
+            excludes.append(arg)
+        elif opt == "--type":
+            ktype = arg
+        elif opt == "--min-size":
+            min_size = int(arg)
+        elif opt == "--max-size":
+            max_size = int(arg)
+        elif opt == "--rdb":
+            rdb = arg
         elif opt in ("-l", "--limit"):
             limit = arg
         elif opt in ("-s", "--sources"):
@@ -338,6 +968,7 @@ if __name__ == "__main__":
         limit = None
 
     try:
-        main(sources, targets, databases, limit, clean)
+        main(sources, targets, databases, limit, clean, scan, asynchronous, inflight, partitioner, rebalance, workers, limit_bytes, slo, journal_dir, verify, sample,
+             matches, excludes, ktype, min_size, max_size, rdb)
     except NameError as e:
         usage()
@@ -0,0 +1,184 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Async
+
+asyncio engine of redis-copy.py and redis-sharding.py (--async option).
+
+The scripts describe the copy of a key as a generator of ('source' or 'target', command, args...) steps
+receiving the reply of each command. This module runs these same steps with asyncio connections,
+keeping many keys in flight at once instead of waiting one round trip per command, which matters when
+the servers are far away from each other.
+
+- keys in flight per source are bounded by the --inflight option, halved and grown back by the governor with --slo
+- commands in flight per target are bounded by an AdaptiveWindow, shrinking when the write latency of the
+  target rises and growing back when it recovers, so a slow target slows down the reads on the source
+
+Dependencies: python >= 3.7, redis (redis-py >= 4.2: sudo pip install redis)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import asyncio
+import collections
+import time
+
+import redis
+import redis.asyncio
+
+
+class AdaptiveWindow:
+    """A class bounding the numbers of commands in flight on a server.
+    The window is halved when a command takes more than latency_factor times the best latency seen so far,
+    at most once per window of replies, and grows by one after each window of fast replies.
+    """
+
+    # a reply slower than latency_factor times the best one shrinks the window
+    latency_factor = 3
+
+    # latencies below this floor, in seconds, never shrink the window
+    min_latency = 0.001
+
+    def __init__(self, size):
+        self.max_size = size
+        self.size = size
+        self.in_flight = 0
+        self.best = None
+        self.replies = 0
+        self.cond = None
+
+    async def acquire(self):
+        """Function waiting for a free slot in the window.
+        """
+        #created in the running loop, see asyncio.Condition on python < 3.10
+        if self.cond is None:
+            self.cond = asyncio.Condition()
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.size)
+            self.in_flight += 1
+
+    async def release(self, latency):
+        """Function freeing a slot and resizing the window from the latency of the command.
+        """
+        async with self.cond:
+            self.in_flight -= 1
+            self.replies += 1
+            if self.best is None or latency < self.best:
+                self.best = latency
+            if latency > self.latency_factor * max(self.best, self.min_latency):
+                if self.replies >= self.size:
+                    self.size = max(1, self.size // 2)
+                    self.replies = 0
+            elif self.replies >= self.size:
+                self.size = min(self.max_size, self.size + 1)
+                self.replies = 0
+            self.cond.notify_all()
+
+
+def connect(server, db, password=None):
+    """Function returning an asyncio redis handle for a {'host':..., 'port':...} server and a db.
+    """
+    return redis.asyncio.StrictRedis(host=server['host'], port=server['port'], db=int(db), password=password)
+
+
+async def run_steps(steps, source, target, window):
+    """Function running a steps generator with the asyncio handles source and target,
+    the target commands going through the AdaptiveWindow of the target.
+    Errors of the server are thrown into the generator, which may handle them.
+    Return True if a command was sent to the target.
+    """
+    reply = error = None
+    wrote = False
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(reply)
+        except StopIteration:
+            return wrote
+        reply = error = None
+        try:
+            if step[0] == 'source':
+                reply = await source.execute_command(*step[1:])
+                continue
+            wrote = True
+            await window.acquire()
+            start = time.time()
+            try:
+                reply = await target.execute_command(*step[1:])
+            finally:
+                await window.release(time.time() - start)
+        except redis.ResponseError as e:
+            error = e
+
+
+async def count_key(copy, counts, name):
+    """Function awaiting the copy of a key, counted in counts[name] if the key was copied.
+    """
+    copied = await copy
+    if copied:
+        counts[name] = counts.get(name, 0) + 1
+    return copied
+
+
+async def _copy_batches(batches, copy_one, inflight, on_batch):
+    #the limit is read before each key, so the governor resizes the keys in flight while they are copied
+    limit = inflight if callable(inflight) else (lambda: inflight)
+    slots = asyncio.Condition()
+    in_flight = [0]
+    pending = collections.deque()
+
+    async def copy(key):
+        try:
+            return await copy_one(key)
+        finally:
+            async with slots:
+                in_flight[0] -= 1
+                slots.notify_all()
+
+    loop = asyncio.get_event_loop()
+    batches = iter(batches)
+    end = object()
+    while True:
+        #the batches are read and sized with blocking commands, and paused by the governor, in a thread of the
+        #default executor so the keys in flight keep being copied meanwhile
+        batch = await loop.run_in_executor(None, next, batches, end)
+        if batch is end:
+            break
+        keys, checkpoint = batch
+        tasks = []
+        for key in keys:
+            async with slots:
+                await slots.wait_for(lambda: in_flight[0] < max(1, limit()))
+                in_flight[0] += 1
+            tasks.append(asyncio.ensure_future(copy(key)))
+        pending.append((asyncio.gather(*tasks), checkpoint))
+        #report the completed batches, in order
+        while pending and pending[0][0].done():
+            done, checkpoint = pending.popleft()
+            on_batch(sum(done.result()), checkpoint)
+
+    while pending:
+        done, checkpoint = pending.popleft()
+        on_batch(sum(await done), checkpoint)
+
+
+async def _run(batches, copy_one, inflight, on_batch, handles):
+    try:
+        await _copy_batches(batches, copy_one, inflight, on_batch)
+    finally:
+        for handle in handles:
+            await (handle.aclose() if hasattr(handle, 'aclose') else handle.close())
+
+
+def copy_batches(batches, copy_one, inflight, on_batch, handles=()):
+    """Function copying the (keys, checkpoint) batches of the scripts in an event loop.
+    - copy_one : coroutine function copying a key, returning True if it was copied
+    - inflight : maximum numbers of keys in flight, or a function returning it (see redis_governor)
+    - on_batch : function called with (numbers of keys copied, checkpoint) for each batch, in the order of the batches
+    The batches are pulled in a thread, one at a time, never blocking the event loop.
+    - handles : asyncio redis handles to close at the end
+    """
+    asyncio.run(_run(batches, copy_one, inflight, on_batch, handles))
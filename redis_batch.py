@@ -0,0 +1,327 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Batch
+
+Batches of keys of redis-copy.py and redis-sharding.py: the keys of a source server-db are read from the temp keylist
+or walked with SCAN, sized and split into (keys, checkpoint) batches, and each key is copied by the same steps
+whichever engine runs them.
+
+- KeyBatches : mixin of RedisCopy and RedisSharding returning the batches of a run from the checkpoints of the journal,
+               of at most batch_size keys and batch_bytes estimated bytes (pipelined MEMORY USAGE, or the lengths
+               of the values before redis 4.0), a key bigger than big_key_bytes being alone in its batch.
+               It also describes the copy of a key as ('source' or 'target', command, args...) steps, run by run_steps
+               with blocking handles or by redis_async with asyncio handles
+- run_steps  : runs the steps of a key with a blocking source handle and a blocking target handle
+
+Dependencies: redis (redis-py: sudo pip install redis)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import binascii
+import time
+
+import redis
+
+import redis_journal
+
+
+#commands returning the length of a value by type, for the estimated sizes of the keys
+length_commands = {'string': 'STRLEN', 'list': 'LLEN', 'set': 'SCARD', 'zset': 'ZCARD', 'hash': 'HLEN', 'stream': 'XLEN'}
+
+
+class KeyBatches:
+    """A class splitting the keys of the source server-dbs of a script into batches and copying them by steps.
+    The script provides journal(), journal_path(), bookkeeping_keys(), keyfilter, governor, memory_usage,
+    keys_read and the limit, limit_bytes, scan_count, chunk_size, batch_size, batch_bytes, big_key_bytes,
+    element_bytes, inflight and workers of a run.
+    """
+
+    # words of the progress output: "Started <action> of ...", "... have already been <done>."
+    action = 'copy'
+    done = 'copied'
+
+    def big_key(self, key):
+        """Function returning the key bigger than big_key_bytes as it is put in its batch of its own.
+        """
+        return key
+
+    def keylist_batches(self, r, servername):
+        """Generator returning the next self.limit keys of the temp keylist of the source server-db,
+        by (keys, checkpoint) batches of self.batch_size keys, checkpoint being the variables to save
+        in the journal once the batch and all the ones before it are copied.
+        """
+        journal = self.journal(servername)
+        total = journal.get('keys', 0)
+        #get keys already moved, and where the next ones start in the keylist
+        keymoved = journal.get('keymoved', 0)
+        offset = journal.get('keyoffset', 0)
+        #check if we already have all keys copied for current source server-db
+        if total <= keymoved:
+            print ("ALL %d keys from %s have already been %s.\n" % (total, servername, self.done))
+            return
+
+        print ("Started %s of %s keys from %d to %d at %s...\n" % (self.action, servername, keymoved, total, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+        keys = redis_journal.read_keys(self.journal_path(servername + '.keylist'), offset, self.limit)
+        size = 0
+        for (batch, batch_bytes, read), last in with_last(self.sized_batches(r, keys)):
+            #the keys dropped by the size filter are read past as well
+            self.keys_read += len(read)
+            keymoved += len(read)
+            offset += redis_journal.keys_bytes(read)
+            size += batch_bytes
+            self.throttle()
+            yield batch, {'keymoved': keymoved, 'keyoffset': offset}
+            if self.limit_bytes is not None and size >= self.limit_bytes:
+                #the run stops here, the next one starts after this batch
+                return
+
+    def scan_batches(self, r, servername):
+        """Generator walking the keyspace of the source server-db with SCAN, from the cursor saved by the previous run,
+        by (keys, checkpoint) batches of self.batch_size keys. Only the SCAN cursor of the last batch of a page is saved,
+        so no keylist is built. As SCAN returns whole pages, at least self.limit keys are returned unless the keyspace is exhausted.
+        A run reaching self.limit_bytes stops after the batch reaching it, saving the cursor of its page with the keys
+        of the page already read, which the next run skips when it scans the page again.
+        """
+        journal = self.journal(servername)
+        #a cursor of -1 means the previous runs already walked the whole keyspace
+        cursor = journal.get('cursor', 0)
+        keymoved = journal.get('keymoved', 0)
+        if cursor == -1:
+            print ("ALL %d keys from %s have already been %s.\n" % (keymoved, servername, self.done))
+            return
+        #keys of the page of cursor read by the previous run, stopped in the middle of it
+        pagedone = [binascii.unhexlify(key) for key in journal.get('pagedone') or []]
+
+        print ("Started %s of %s keys from cursor %d at %s...\n" % (self.action, servername, cursor, time.strftime("%Y-%m-%d %I:%M:%S")))
+
+        scanned = 0
+        size = 0
+        while scanned < self.limit and (self.limit_bytes is None or size < self.limit_bytes):
+            page = cursor
+            cursor, keys = self.keyfilter.scan(r, page, self.scan_count)
+            if pagedone:
+                done = set(pagedone)
+                keys = [key for key in keys if key not in done]
+            scanned += len(keys)
+            read = pagedone
+            pagedone = []
+            for (batch, batch_bytes, batch_read), last in with_last(self.sized_batches(r, keys)):
+                size += batch_bytes
+                self.keys_read += len(batch_read)
+                keymoved += len(batch_read)
+                read.extend(batch_read)
+                self.throttle()
+                if last:
+                    #checkpoint once the whole page is copied
+                    yield batch, {'cursor': cursor if cursor != 0 else -1, 'keymoved': keymoved, 'pagedone': None}
+                elif self.limit_bytes is not None and size >= self.limit_bytes:
+                    #the run stops in the middle of the page
+                    yield batch, {'cursor': page, 'keymoved': keymoved,
+                                  'pagedone': [binascii.hexlify(key).decode('ascii') for key in read]}
+                    return
+                else:
+                    yield batch, None
+            if cursor == 0:
+                break
+
+    def sized_batches(self, r, keys):
+        """Generator splitting keys, in order, into (keys, estimated bytes, keys read) batches of at most self.batch_size keys
+        and self.batch_bytes bytes, keys read being the keys the batch accounts for, with the ones dropped before it.
+        A key bigger than self.big_key_bytes is alone in its batch (see big_key), copied by chunks without the other keys
+        waiting on it. The keys out of the size thresholds of the filter are dropped before any value is read.
+        The last batch is returned even if empty, for its checkpoint.
+        """
+        batch = []
+        read = []
+        size = 0
+        for key, key_bytes in zip(keys, self.key_sizes(r, keys)):
+            if not self.keyfilter.sized(key_bytes):
+                read.append(key)
+                continue
+            batch_size = self.batch_size if self.governor is None else self.governor.batch_size
+            if key_bytes > self.big_key_bytes:
+                if batch:
+                    yield batch, size, read
+                    batch, read, size = [], [], 0
+                yield [self.big_key(key)], key_bytes, read + [key]
+                read = []
+                continue
+            if batch and (len(batch) >= batch_size or size + key_bytes > self.batch_bytes):
+                yield batch, size, read
+                batch, read, size = [], [], 0
+            batch.append(key)
+            read.append(key)
+            size += key_bytes
+        yield batch, size, read
+
+    def throttle(self):
+        """Function called before each batch, pausing the copy when the source is over its latency SLO (see redis_governor).
+        """
+        if self.governor is not None:
+            self.governor.throttle()
+
+    def throttle_state(self):
+        """Function returning the state of the governor for the progress output, if any.
+        """
+        return "" if self.governor is None else " (%s)" % self.governor.state()
+
+    def inflight_limit(self):
+        """Function returning the numbers of keys in flight of the asyncio engine, as resized by the governor if any.
+        """
+        return self.inflight if self.governor is None else self.governor.inflight
+
+    def workers_limit(self):
+        """Function returning the numbers of worker processes copying a batch at once, as resized by the governor if any.
+        """
+        return self.workers if self.governor is None else self.governor.workers
+
+    def key_sizes(self, r, keys):
+        """Function returning the estimated sizes in bytes of keys, from a pipeline of MEMORY USAGE,
+        or before redis 4.0 from the lengths of the values (STRLEN, or element_bytes times LLEN, HLEN, SCARD...).
+        """
+        if not keys:
+            return []
+        if self.memory_usage:
+            p = r.pipeline(transaction=False)
+            for key in keys:
+                p.execute_command('MEMORY', 'USAGE', key, 'SAMPLES', 5)
+            sizes = p.execute(raise_on_error=False)
+            if not [size for size in sizes if isinstance(size, redis.ResponseError)]:
+                return [int(size or 0) for size in sizes]
+            self.memory_usage = False
+
+        p = r.pipeline(transaction=False)
+        for key in keys:
+            p.type(key)
+        ktypes = [ktype if isinstance(ktype, str) else ktype.decode('utf-8') for ktype in p.execute()]
+        p = r.pipeline(transaction=False)
+        for key, ktype in zip(keys, ktypes):
+            p.execute_command(length_commands.get(ktype, 'EXISTS'), key)
+        return [int(length or 0) * (1 if ktype == 'string' else self.element_bytes)
+                for ktype, length in zip(ktypes, p.execute(raise_on_error=False))]
+
+    def copy_key_steps(self, key, servername):
+        """Generator describing the copy of a key and its expire time as ('source' or 'target', command, args...)
+        steps, each yield receiving the reply of its command. The steps are run by run_steps with blocking handles,
+        or by redis_async with asyncio handles, so both engines share the same type dispatch.
+        """
+        #never copy the temp variables of the script
+        if key in self.bookkeeping_keys(servername):
+            return
+
+        #get key type
+        ktype = yield ('source', 'TYPE', key)
+        if not isinstance(ktype, str):
+            ktype = ktype.decode('utf-8')
+        #if undefined type go to next key
+        if ktype == 'none':
+            return
+
+        #save key to target server-db
+        #collections are read and written by chunks of chunk_size elements
+        #so big keys never stall the source nor fill the memory of the script,
+        #the key of the target being deleted first, so members deleted in the source and keys
+        #returned more than once by SCAN never leave stale or duplicated elements behind
+        if ktype == 'string':
+            value = yield ('source', 'GET', key)
+            if value is None:
+                return
+            yield ('target', 'SET', key, value)
+        elif ktype == 'hash':
+            yield ('target', 'DEL', key)
+            cursor = 0
+            while True:
+                cursor, chunk = yield ('source', 'HSCAN', key, cursor, 'COUNT', self.chunk_size)
+                if chunk:
+                    yield ('target', 'HMSET', key) + tuple(v for item in chunk.items() for v in item)
+                if int(cursor) == 0:
+                    break
+        elif ktype == 'list':
+            yield ('target', 'DEL', key)
+            start = 0
+            while True:
+                chunk = yield ('source', 'LRANGE', key, start, start + self.chunk_size - 1)
+                if chunk:
+                    yield ('target', 'RPUSH', key) + tuple(chunk)
+                if len(chunk) < self.chunk_size:
+                    break
+                start += self.chunk_size
+        elif ktype == 'set':
+            yield ('target', 'DEL', key)
+            cursor = 0
+            while True:
+                cursor, chunk = yield ('source', 'SSCAN', key, cursor, 'COUNT', self.chunk_size)
+                if chunk:
+                    yield ('target', 'SADD', key) + tuple(chunk)
+                if int(cursor) == 0:
+                    break
+        elif ktype == 'zset':
+            yield ('target', 'DEL', key)
+            cursor = 0
+            while True:
+                cursor, chunk = yield ('source', 'ZSCAN', key, cursor, 'COUNT', self.chunk_size)
+                if chunk:
+                    #ZADD key score member [score member ...]
+                    yield ('target', 'ZADD', key) + tuple(v for k, score in chunk for v in (score, k))
+                if int(cursor) == 0:
+                    break
+        else:
+            #streams, modules... have no copy by chunks, they are copied whole with their expire time
+            payload = yield ('source', 'DUMP', key)
+            #key deleted in the meantime
+            if payload is None:
+                return
+            kttl = yield ('source', 'PTTL', key)
+            kttl = 0 if kttl is None or int(kttl) < 0 else int(kttl)
+            yield ('target', 'RESTORE', key, kttl, payload, 'REPLACE')
+            return
+
+        # Handle keys with an expire time set
+        kttl = yield ('source', 'TTL', key)
+        kttl = -1 if kttl is None else int(kttl)
+        if kttl != -1:
+            yield ('target', 'EXPIRE', key, kttl)
+        else:
+            #the key of the target may have an expire time the source no longer has
+            yield ('target', 'PERSIST', key)
+
+
+def with_last(items):
+    """Generator returning (item, True if it is the last one) for each item of items.
+    """
+    items = iter(items)
+    try:
+        previous = next(items)
+    except StopIteration:
+        return
+    for item in items:
+        yield previous, False
+        previous = item
+    yield previous, True
+
+
+def run_steps(steps, r, rr):
+    """Function running the steps of a KeyBatches steps generator with the blocking handles r (source) and rr (target).
+    Errors of the server are thrown into the generator, which may handle them.
+    Return True if a command was sent to the target.
+    """
+    reply = error = None
+    wrote = False
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(reply)
+        except StopIteration:
+            return wrote
+        reply = error = None
+        wrote = wrote or step[0] == 'target'
+        try:
+            reply = (r if step[0] == 'source' else rr).execute_command(*step[1:])
+        except redis.ResponseError as e:
+            error = e
@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Filter
+
+Key filters of redis-copy.py and redis-sharding.py (--match, --exclude, --type, --min-size and --max-size options),
+selecting the keys to copy or reshard so the other keys only cost a SCAN entry.
+
+- a single --match pattern is pushed to SCAN ... MATCH (or KEYS), several patterns are matched on each SCAN page
+- --type is pushed to SCAN ... TYPE (redis >= 6.0), before redis 6.0 or with KEYS it is checked with a pipeline of TYPE
+- --exclude patterns are matched on each SCAN page
+- the patterns matched by the script follow the glob rules of redis (stringmatchlen): the keys are matched as bytes,
+  with *, ?, [abc], [^abc] and [a-z] classes and \\ escapes, also inside the classes
+- --min-size and --max-size are checked against the estimated sizes of the keys (pipelined MEMORY USAGE)
+  read to size the batches, before any value is read
+- with --rdb, the keys of the snapshot are matched as they are parsed, their sizes being the ones of their serialized values
+
+Dependencies: redis (redis-py: sudo pip install redis)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import re
+
+import redis
+
+
+def glob_pattern(pattern):
+    """Function returning the compiled regular expression of a glob pattern of redis (KEYS, SCAN ... MATCH), matching
+    the keys as bytes like stringmatchlen: * matches any bytes and ? any byte, a class is read as redis reads it
+    (^ negation, reversed ranges, escapes, unterminated class) and \\ escapes the next byte.
+    """
+    if not isinstance(pattern, bytes):
+        #the bytes of a command line argument which is not utf-8
+        pattern = pattern.encode('utf-8', 'surrogateescape')
+    regex = []
+    p = 0
+    while p < len(pattern):
+        c = pattern[p:p + 1]
+        if c == b'*':
+            regex.append(b'.*')
+        elif c == b'?':
+            regex.append(b'.')
+        elif c == b'[':
+            p += 1
+            negate = pattern[p:p + 1] == b'^'
+            if negate:
+                p += 1
+            items = []
+            #up to the closing ] or the end of the pattern
+            while p < len(pattern):
+                c = pattern[p:p + 1]
+                if c == b'\\' and p + 1 < len(pattern):
+                    p += 1
+                    items.append(re.escape(pattern[p:p + 1]))
+                elif c == b']':
+                    break
+                elif p + 2 < len(pattern) and pattern[p + 1:p + 2] == b'-':
+                    start, end = sorted((c, pattern[p + 2:p + 3]))
+                    items.append(re.escape(start) + b'-' + re.escape(end))
+                    p += 2
+                else:
+                    items.append(re.escape(c))
+                p += 1
+            if items:
+                regex.append(b'[' + (b'^' if negate else b'') + b''.join(items) + b']')
+            else:
+                #an empty class matches no byte, any byte when negated
+                regex.append(b'.' if negate else b'(?!)')
+        else:
+            if c == b'\\' and p + 1 < len(pattern):
+                p += 1
+            regex.append(re.escape(pattern[p:p + 1]))
+        p += 1
+    if pattern not in (b'', b'*'):
+        #stringmatchlen matches no pattern with the empty key, only KEYS * and SCAN without MATCH return it
+        regex.insert(0, b'(?=.)')
+    return re.compile(b''.join(regex), re.DOTALL)
+
+
+class KeyFilter:
+    """A class selecting keys by glob patterns, exclusion patterns, type and estimated size in bytes.
+    """
+
+    def __init__(self, matches=None, excludes=None, ktype=None, min_bytes=None, max_bytes=None):
+        self.matches = matches or ['*']
+        self.excludes = excludes or []
+        self.match_patterns = [glob_pattern(pattern) for pattern in self.matches]
+        self.exclude_patterns = [glob_pattern(pattern) for pattern in self.excludes]
+        self.ktype = ktype
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        #SCAN ... TYPE is available, until a server rejects it
+        self.scan_type = ktype is not None
+
+    def everything(self):
+        """Function returning True if the filter selects all the keys.
+        """
+        return self.matches == ['*'] and not self.excludes and self.ktype is None and not self.sizes()
+
+    def sizes(self):
+        """Function returning True if the filter checks the sizes of the keys.
+        """
+        return self.min_bytes is not None or self.max_bytes is not None
+
+    def match(self, key, patterns=True):
+        """Function returning True if key matches one of the patterns (unless patterns is False,
+        the server having matched them) and none of the exclusion patterns, as the server would (see glob_pattern).
+        """
+        if patterns and not [pattern for pattern in self.match_patterns if pattern.fullmatch(key)]:
+            return False
+        return not [pattern for pattern in self.exclude_patterns if pattern.fullmatch(key)]
+
+    def sized(self, key_bytes):
+        """Function returning True if the estimated size in bytes of a key is within the size thresholds.
+        """
+        return (self.min_bytes is None or key_bytes >= self.min_bytes) and (self.max_bytes is None or key_bytes <= self.max_bytes)
+
+    def entry(self, key, ktype, key_bytes):
+        """Function returning True if a key read from a snapshot, of type ktype and size key_bytes, matches the filter.
+        """
+        return (self.ktype is None or ktype == self.ktype) and self.sized(key_bytes) and self.match(key)
+
+    def select(self, r, keys, matched=False, typed=False):
+        """Function returning the keys of r matching the filter, in order. Unless typed, the server having
+        filtered the type, the types are read with one pipeline of TYPE.
+        """
+        keys = [key for key in keys if self.match(key, not matched)]
+        if self.ktype is None or typed or not keys:
+            return keys
+        p = r.pipeline(transaction=False)
+        for key in keys:
+            p.type(key)
+        ktypes = [ktype if isinstance(ktype, str) else ktype.decode('utf-8') for ktype in p.execute()]
+        return [key for key, ktype in zip(keys, ktypes) if ktype == self.ktype]
+
+    def scan(self, r, cursor, count):
+        """Function returning (next cursor, selected keys) of one SCAN call on r from cursor, the pattern
+        and the type being pushed to the server when it can filter them.
+        """
+        args = ['SCAN', cursor, 'COUNT', count]
+        matched = len(self.matches) == 1
+        if matched:
+            args += ['MATCH', self.matches[0]]
+        typed = self.scan_type
+        if typed:
+            args += ['TYPE', self.ktype]
+        try:
+            cursor, keys = r.execute_command(*args)
+        except redis.ResponseError:
+            if not typed:
+                raise
+            #redis < 6.0, the types are checked with TYPE
+            self.scan_type = False
+            return self.scan(r, cursor, count)
+        return int(cursor), self.select(r, keys, matched, typed)
+
+    def keys(self, r):
+        """Function returning the selected keys of r with KEYS, one call per pattern.
+        """
+        keys = []
+        seen = set()
+        for pattern in self.matches:
+            for key in r.keys(pattern):
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+        return self.select(r, keys, matched=True)
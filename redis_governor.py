@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Governor
+
+AIMD governor of redis-copy.py and redis-sharding.py (--slo option), throttling a copy running against
+a live production master so the p99 latency of the source stays under an SLO.
+
+Before each batch, the governor times a PING on the source, which waits behind the commands of the
+other clients of the server, and every sample_interval seconds it reads INFO stats and INFO commandstats
+of both ends (instantaneous_ops_per_sec and the mean usec per call since the last sample). The mean usec per call
+of the source, which all its clients pay, is a latency sample as well as the PINGs.
+- p99 of the last window samples above the SLO: the batch size, the keys in flight of the asyncio engine and the
+  worker processes copying at once are halved and the pause between batches doubled, at most once per cooldown samples
+  and only while the last cooldown samples are still over the SLO
+- p99 under the SLO: they grow and the pause shrinks by a step, back to their configured values
+
+Dependencies: redis (redis-py: sudo pip install redis)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import time
+
+
+class Governor:
+    """A class throttling the batches of keys read from a source redis handle and written to target redis handles.
+    """
+
+    # numbers of latency samples of the source the p99 is computed on
+    window = 50
+
+    # numbers of new samples after a decrease before the next decision
+    cooldown = 10
+
+    # seconds between two INFO samples of the servers
+    sample_interval = 1.0
+
+    # smallest batch size, and growth of the batch size per batch under the SLO
+    min_batch = 10
+    batch_step = 10
+
+    # growth per batch under the SLO of the keys in flight and of the worker processes copying at once
+    inflight_step = 1
+    workers_step = 1
+
+    # pause in seconds between two batches: first pause, growth step under the SLO, longest pause
+    min_pause = 0.01
+    pause_step = 0.002
+    max_pause = 5.0
+
+    def __init__(self, source, targets, slo, batch_size, inflight=1, workers=1):
+        self.source = source
+        self.targets = targets
+        self.slo = slo
+        self.max_batch = batch_size
+        self.batch_size = batch_size
+        self.max_inflight = inflight
+        self.inflight = inflight
+        self.max_workers = workers
+        self.workers = workers
+        self.pause = 0.0
+        self.latencies = []
+        #samples taken since the last decrease, the rolling window keeping the older ones
+        self.fresh = self.cooldown
+        self.throttled = 0
+        self.sampled = 0
+        self.stats = {}
+
+    def throttle(self):
+        """Function called before each batch: sleep for the current pause, then measure the source and adjust
+        the batch size, the keys in flight, the worker processes and the pause. Return the batch size.
+        """
+        if self.pause:
+            time.sleep(self.pause)
+        start = time.time()
+        self.source.ping()
+        self.add_latency(time.time() - start)
+        if time.time() - self.sampled >= self.sample_interval:
+            self.sample()
+
+        if self.fresh < self.cooldown:
+            #wait for samples taken at the new rate before deciding again
+            return self.batch_size
+        if self.p99() > self.slo:
+            if max(self.latencies[-self.cooldown:]) <= self.slo:
+                #the slow samples are older than the last decrease, hold until they leave the window
+                return self.batch_size
+            #multiplicative decrease
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            self.inflight = max(1, self.inflight // 2)
+            self.workers = max(1, self.workers // 2)
+            self.pause = min(self.max_pause, max(self.min_pause, self.pause * 2))
+            self.fresh = 0
+            self.throttled += 1
+        else:
+            #additive increase
+            self.batch_size = min(self.max_batch, self.batch_size + self.batch_step)
+            self.inflight = min(self.max_inflight, self.inflight + self.inflight_step)
+            self.workers = min(self.max_workers, self.workers + self.workers_step)
+            self.pause = max(0.0, self.pause - self.pause_step)
+        return self.batch_size
+
+    def add_latency(self, latency):
+        """Function adding a latency sample in seconds to the rolling window.
+        """
+        self.latencies = (self.latencies + [latency])[-self.window:]
+        self.fresh += 1
+
+    def p99(self):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[int(0.99 * (len(latencies) - 1))]
+
+    def sample(self):
+        """Function reading the ops/s and the mean usec per call of the servers since the last sample.
+        """
+        self.sampled = time.time()
+        for name, handles in (('source', [self.source]), ('target', self.targets)):
+            ops = calls = usec = 0
+            for handle in handles:
+                ops += int(handle.info('stats').get('instantaneous_ops_per_sec', 0))
+                for stat in handle.info('commandstats').values():
+                    calls += int(stat.get('calls', 0))
+                    usec += int(stat.get('usec', 0))
+            last = self.stats.get(name, (0, calls, usec, 0.0))
+            per_call = float(usec - last[2]) / (calls - last[1]) if calls > last[1] else last[3]
+            self.stats[name] = (ops, calls, usec, per_call)
+            if name == 'source' and calls > last[1]:
+                #the commands of all the clients of the source since the last sample
+                self.add_latency(per_call / 1000000.0)
+
+    def state(self):
+        """Function returning the throttle state, for the progress output.
+        """
+        state = "batch %d keys, pause %.3fs, source p99 %.2fms (slo %.2fms), throttled %d times" % (
+            self.batch_size, self.pause, self.p99() * 1000, self.slo * 1000, self.throttled)
+        if self.max_inflight > 1:
+            state += ", %d keys in flight" % self.inflight
+        if self.max_workers > 1:
+            state += ", %d workers" % self.workers
+        for name in ('source', 'target'):
+            if name in self.stats:
+                state += ", %s %d ops/s %.1fus/call" % (name, self.stats[name][0], self.stats[name][3])
+        return state
@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Journal
+
+Local checkpoint journal of redis-copy.py and redis-sharding.py (--journal option), so the source servers
+are never written to by the scripts: no temp keylists, cursors, counters or run flags in their dbs.
+
+- Journal : the checkpoint variables of a source server-db (SCAN cursor, keys moved, offset in the keylist...),
+            each completed batch appending one json line fsync'd before the script goes on. The file is compacted
+            to one line when it is opened, so a resume only reads the last values
+- KeyList : the keys saved with KEYS, one hex encoded key per line in a local file, read back from the byte offset
+            saved in the journal
+- lock    : an exclusive lock on a local file, released by the system when the process exits,
+            so a crashed run never leaves the scripts locked
+
+Dependencies: none (fcntl, so a unix system)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import binascii
+import fcntl
+import json
+import os
+
+
+class Journal:
+    """A class holding checkpoint variables in a local append-only file of json lines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.values.update(json.loads(line))
+                    except ValueError:
+                        #last line cut by a crash while it was written, its batch is moved again
+                        break
+        self.values = dict((name, value) for name, value in self.values.items() if value is not None)
+
+        #compact the journal to its last values
+        with open(path + '.tmp', 'w') as f:
+            f.write(json.dumps(self.values) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+        self.file = open(path, 'a')
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def mset(self, values):
+        """Function to save values, a dict of variables, once they are on disk. A value of None deletes its variable.
+        """
+        self.file.write(json.dumps(values) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        for name, value in values.items():
+            if value is None:
+                self.values.pop(name, None)
+            else:
+                self.values[name] = value
+
+    def close(self):
+        self.file.close()
+
+
+class KeyList:
+    """A class writing keys to a local keylist file, renamed in place once complete,
+    so a keylist cut by a crash is saved again by the next run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+        self.length = 0
+
+    def append(self, key):
+        self.file.write(binascii.hexlify(key) + b'\n')
+        self.length += 1
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.rename(self.path + '.tmp', self.path)
+
+
+def read_keys(path, offset, count):
+    """Function returning up to count keys of the keylist file path, from the byte offset of a key.
+    """
+    keys = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if len(keys) >= count:
+                break
+            keys.append(binascii.unhexlify(line.rstrip(b'\n')))
+    return keys
+
+
+def keys_bytes(keys):
+    """Function returning the size in bytes of keys in a keylist file, to move its offset past them.
+    """
+    return sum(2 * len(key) + 1 for key in keys)
+
+
+def lock(path):
+    """Function taking an exclusive lock on the file path, holding the pid of the process.
+    Return the open lock file, to close once done, or None if another process holds the lock.
+    """
+    lockfile = open(path, 'a')
+    try:
+        fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        lockfile.close()
+        return None
+    lockfile.truncate(0)
+    lockfile.write('%d\n' % os.getpid())
+    lockfile.flush()
+    return lockfile
+
+
+def remove(path):
+    """Function to remove the local file path and its temp file, if any.
+    """
+    for name in (path, path + '.tmp'):
+        if os.path.exists(name):
+            os.remove(name)
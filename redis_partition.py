@@ -0,0 +1,141 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Partition
+
+Partitioners of redis-sharding.py (--partitioner option), returning the symbolic node name "node_i"
+of the new cluster holding a key.
+
+- modulo : crc32(key) % len(nodes), the historical scheme of the script and of rediscluster-py,
+           adding a node moves most of the keys
+- ketama : ketama consistent hash ring with virtual nodes (libketama points), adding a node moves
+           about 1/N of the keys
+- slots  : the 16384 hash slots of Redis Cluster, crc16 of the key or of its {hash tag}, the slots being
+           given to the nodes as if they joined one after another in the order of their names, each new node
+           taking its share from every other node, so adding a node moves about 1/N of the keys
+
+The points of the ring and the slots only depend on the node names, not on their host or port.
+
+Dependencies: python >= 3.4
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import abc
+import binascii
+import bisect
+import hashlib
+import re
+import struct
+
+
+def node_order(name):
+    """Function returning the sort key of a node name, node_2 being before node_10.
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def crc16(data):
+    """Function returning the crc16 (XMODEM) of data, as used by Redis Cluster.
+    """
+    crc = 0
+    for b in bytearray(data):
+        crc ^= b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) & 0xffff if crc & 0x8000 else (crc << 1) & 0xffff
+    return crc
+
+
+def hash_tag(key):
+    """Function returning the part of a key hashed by Redis Cluster: the {hash tag} if any, else the key.
+    """
+    start = key.find(b'{')
+    if start >= 0:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+class Partitioner(abc.ABC):
+    """An abstract class mapping the keys to the names of the nodes of a cluster, the subclasses defining node.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = sorted(nodes, key=node_order)
+
+    @abc.abstractmethod
+    def node(self, key):
+        """Function returning the name of the node holding a key.
+        """
+
+
+class ModuloPartitioner(Partitioner):
+
+    def node(self, key):
+        return 'node_' + str((abs(binascii.crc32(key) & 0xffffffff) % len(self.nodes)) + 1)
+
+
+class KetamaPartitioner(Partitioner):
+
+    # md5 digests per node, each giving 4 points of the ring
+    digests = 40
+
+    def __init__(self, nodes):
+        Partitioner.__init__(self, nodes)
+        ring = []
+        for name in self.nodes:
+            for i in range(self.digests):
+                digest = hashlib.md5(('%s-%d' % (name, i)).encode('utf-8')).digest()
+                for point in struct.unpack('<4I', digest):
+                    ring.append((point, name))
+        ring.sort()
+        self.points = [point for point, name in ring]
+        self.names = [name for point, name in ring]
+
+    def node(self, key):
+        point = struct.unpack('<I', hashlib.md5(key).digest()[:4])[0]
+        i = bisect.bisect_left(self.points, point)
+        return self.names[i if i < len(self.points) else 0]
+
+
+class SlotPartitioner(Partitioner):
+
+    # numbers of hash slots of Redis Cluster
+    slots = 16384
+
+    def __init__(self, nodes):
+        Partitioner.__init__(self, nodes)
+        self.slot_nodes = [self.nodes[0]] * self.slots
+        owned = {self.nodes[0]: list(range(self.slots))}
+        for n, name in enumerate(self.nodes[1:], 2):
+            #each node gives its last slots above its new share to the joining node
+            owned[name] = []
+            for other in self.nodes[:n - 1]:
+                share = self.slots // n + (1 if self.nodes.index(other) < self.slots % n else 0)
+                while len(owned[other]) > share:
+                    owned[name].append(owned[other].pop())
+        for name in owned:
+            for slot in owned[name]:
+                self.slot_nodes[slot] = name
+
+    def key_slot(self, key):
+        return crc16(hash_tag(key)) % self.slots
+
+    def node(self, key):
+        return self.slot_nodes[self.key_slot(key)]
+
+
+PARTITIONERS = {'modulo': ModuloPartitioner, 'ketama': KetamaPartitioner, 'slots': SlotPartitioner}
+
+
+def partitioner(name, nodes):
+    """Function returning the partitioner called name for the given node names.
+    """
+    if name not in PARTITIONERS:
+        raise ValueError('unknown partitioner %s, use one of: %s' % (name, ', '.join(sorted(PARTITIONERS))))
+    return PARTITIONERS[name](nodes)
@@ -0,0 +1,721 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis RDB
+
+RDB stream parser and replication client of redis-copy.py (--psync and --rdb options) and redis-sharding.py (--rdb option).
+
+The parser reads a RDB snapshot as a stream, from a socket or a file, and returns each key with the raw
+serialized bytes of its value, which are the same in a RDB file and in a DUMP payload: dump_payload only
+appends the RDB version and the CRC64 footer, so the keys can be written with RESTORE without being decoded.
+
+Replica connects to a redis server as one of its replicas (PSYNC, or SYNC before redis 2.8): the server
+does one BGSAVE and sends the snapshot, then keeps sending the write commands it runs, acknowledged every
+ack_interval seconds with REPLCONF ACK so the server does not drop the connection.
+
+- the values of modules (module type 7 and module aux fields) are skipped by the opcodes of the module API,
+  the first module type 6 of redis 4.0 release candidates, which only its module can read, is not supported
+- hashes with field expire times (types 22 to 25 of redis >= 7.4) are read with their expire times
+- Stream, RDBParser and dump_payload only need python 2.7 or 3 and no redis client
+- read_file parses a dump.rdb file (gzipped when its name ends with .gz) by chunks, never loading it whole,
+  so a snapshot is copied or resharded without any load on the server it was taken from
+- memory_entries estimates the memory used by each key of a snapshot in a buffer (a mmap of the file) for
+  redis-mem-stats.py (--rdb option), from the encodings and lengths of the values, skipping their bytes
+  without decoding them
+
+Dependencies: none
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import gzip
+import math
+import socket
+import struct
+import time
+
+
+#redis data structure of each RDB value type
+TYPES = {0: 'string', 1: 'list', 2: 'set', 3: 'zset', 4: 'hash', 5: 'zset', 6: 'module', 7: 'module',
+         9: 'hash', 10: 'list', 11: 'set', 12: 'zset', 13: 'hash', 14: 'list',
+         15: 'stream', 16: 'hash', 17: 'zset', 18: 'list', 19: 'stream', 20: 'set', 21: 'stream',
+         22: 'hash', 23: 'hash', 24: 'hash', 25: 'hash'}
+
+#opcodes of the values of the modules (RDB_MODULE_OPCODE_*), saved by the module API
+MODULE_EOF, MODULE_SINT, MODULE_UINT, MODULE_FLOAT, MODULE_DOUBLE, MODULE_STRING = range(6)
+
+#CRC64 Jones (reflected polynomial) used by redis for the RDB files and DUMP payloads
+CRC64_POLY = 0x95ac9329ac4bc9b5
+
+
+def crc64_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC64_POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC64_TABLE = crc64_table()
+
+
+def crc64(data, crc=0):
+    """Function returning the redis CRC64 of data.
+    """
+    table = CRC64_TABLE
+    for b in bytearray(data):
+        crc = table[(crc ^ b) & 0xff] ^ (crc >> 8)
+    return crc
+
+
+def dump_payload(rtype, value, version):
+    """Function returning the DUMP payload, as taken by RESTORE, of a RDB value of type rtype
+    serialized by a server of RDB version version.
+    """
+    data = struct.pack('B', rtype) + value + struct.pack('<H', version)
+    return data + struct.pack('<Q', crc64(data))
+
+
+def lzf_decompress(data, length):
+    """Function to decompress the LZF compressed strings of the RDB files.
+    """
+    data = bytearray(data)
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:
+            #literal run of ctrl + 1 bytes
+            out += data[i:i + ctrl + 1]
+            i += ctrl + 1
+            continue
+        #back reference of size + 2 bytes
+        size = ctrl >> 5
+        if size == 7:
+            size += data[i]
+            i += 1
+        ref = len(out) - ((ctrl & 0x1f) << 8) - data[i] - 1
+        i += 1
+        for _ in range(size + 2):
+            out.append(out[ref])
+            ref += 1
+    if len(out) != length:
+        raise ValueError('corrupted LZF string: %d bytes instead of %d' % (len(out), length))
+    return bytes(out)
+
+
+class Stream:
+    """A class buffering the reads of a read function (socket.recv or file.read).
+    While capture is a list, the bytes read are appended to it.
+    """
+
+    def __init__(self, read, size=65536):
+        self.recv = read
+        self.size = size
+        self.buf = bytearray()
+        self.pos = 0
+        self.dropped = 0
+        self.capture = None
+
+    def fill(self):
+        """Function appending the next bytes of the read function to the buffer.
+        """
+        data = self.recv(self.size)
+        if not data:
+            raise EOFError('connection closed or end of file')
+        if self.pos:
+            del self.buf[:self.pos]
+            self.dropped += self.pos
+            self.pos = 0
+        self.buf += data
+
+    def tell(self):
+        """Function returning the numbers of bytes read so far.
+        """
+        return self.dropped + self.pos
+
+    def read(self, n):
+        while len(self.buf) - self.pos < n:
+            self.fill()
+        data = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        if self.capture is not None:
+            self.capture.append(data)
+        return data
+
+    def readline(self):
+        """Function returning the next line, without its \\r\\n.
+        """
+        while True:
+            end = self.buf.find(b'\r\n', self.pos)
+            if end >= 0:
+                break
+            self.fill()
+        line = bytes(self.buf[self.pos:end])
+        self.pos = end + 2
+        return line
+
+
+class RDBParser:
+    """A class parsing a RDB snapshot from a Stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.version = None
+
+    def read_byte(self):
+        return bytearray(self.stream.read(1))[0]
+
+    def read_length(self):
+        """Function returning (length, encoded), encoded being True for the special encodings of strings.
+        """
+        b = self.read_byte()
+        kind = b >> 6
+        if kind == 0:
+            return b & 0x3f, False
+        if kind == 1:
+            return ((b & 0x3f) << 8) | self.read_byte(), False
+        if b == 0x80:
+            return struct.unpack('>I', self.stream.read(4))[0], False
+        if b == 0x81:
+            return struct.unpack('>Q', self.stream.read(8))[0], False
+        if kind == 3:
+            return b & 0x3f, True
+        raise ValueError('unknown RDB length encoding %d' % b)
+
+    def read_string(self, decode=True):
+        """Function returning the next string, integers and LZF strings being decoded unless decode is False.
+        """
+        length, encoded = self.read_length()
+        if not encoded:
+            return self.stream.read(length)
+        if length in (0, 1, 2):
+            data = self.stream.read(1 << length)
+            return str(struct.unpack(('<b', '<h', '<i')[length], data)[0]).encode() if decode else data
+        if length == 3:
+            clen = self.read_length()[0]
+            ulen = self.read_length()[0]
+            data = self.stream.read(clen)
+            return lzf_decompress(data, ulen) if decode else data
+        raise ValueError('unknown RDB string encoding %d' % length)
+
+    def skip_strings(self, n):
+        for _ in range(n):
+            self.read_string(False)
+
+    def skip_value(self, rtype):
+        """Function to read a value of type rtype without decoding it.
+        """
+        if rtype == 0 or rtype in (9, 10, 11, 12, 13, 16, 17, 20, 23):
+            #plain string or one ziplist, listpack, intset or zipmap blob
+            self.read_string(False)
+        elif rtype == 25:
+            #min expire time of the fields, and the listpack of field, value, expire time triplets
+            self.stream.read(8)
+            self.read_string(False)
+        elif rtype in (22, 24):
+            if rtype == 24:
+                #min expire time of the fields, the ones of the fields being relative to it
+                self.stream.read(8)
+            for _ in range(self.read_length()[0]):
+                #expire time, field, value
+                self.read_length()
+                self.skip_strings(2)
+        elif rtype == 7:
+            self.skip_module()
+        elif rtype in (1, 2, 14):
+            self.skip_strings(self.read_length()[0])
+        elif rtype == 4:
+            self.skip_strings(2 * self.read_length()[0])
+        elif rtype == 3:
+            for _ in range(self.read_length()[0]):
+                self.read_string(False)
+                #score as a string, 253 254 255 being nan, inf and -inf
+                length = self.read_byte()
+                if length < 253:
+                    self.stream.read(length)
+        elif rtype == 5:
+            for _ in range(self.read_length()[0]):
+                self.read_string(False)
+                self.stream.read(8)
+        elif rtype == 18:
+            for _ in range(self.read_length()[0]):
+                self.read_length()
+                self.read_string(False)
+        elif rtype in (15, 19, 21):
+            self.skip_stream(rtype)
+        else:
+            raise ValueError('unsupported RDB type %d' % rtype)
+
+    def skip_module(self):
+        """Function to read a module value: its module id and its opcodes.
+        """
+        self.read_length()
+        self.skip_module_opcodes()
+
+    def skip_module_opcodes(self):
+        """Function to read the opcodes of a module value, up to its MODULE_EOF.
+        """
+        while True:
+            opcode = self.read_length()[0]
+            if opcode == MODULE_EOF:
+                return
+            if opcode in (MODULE_SINT, MODULE_UINT):
+                self.read_length()
+            elif opcode == MODULE_FLOAT:
+                self.stream.read(4)
+            elif opcode == MODULE_DOUBLE:
+                self.stream.read(8)
+            elif opcode == MODULE_STRING:
+                self.read_string(False)
+            else:
+                raise ValueError('unknown RDB module opcode %d' % opcode)
+
+    def skip_stream(self, rtype):
+        self.skip_strings(2 * self.read_length()[0])
+        #length, last id
+        for _ in range(3):
+            self.read_length()
+        if rtype >= 19:
+            #first id, max deleted id, entries added
+            for _ in range(5):
+                self.read_length()
+        for _ in range(self.read_length()[0]):
+            #consumer group: name, last id, entries read
+            self.read_string(False)
+            self.read_length()
+            self.read_length()
+            if rtype >= 19:
+                self.read_length()
+            for _ in range(self.read_length()[0]):
+                #pending entry: id, delivery time, delivery count
+                self.stream.read(24)
+                self.read_length()
+            for _ in range(self.read_length()[0]):
+                #consumer: name, seen time, active time, pending ids
+                self.read_string(False)
+                self.stream.read(16 if rtype >= 21 else 8)
+                self.stream.read(16 * self.read_length()[0])
+
+    def read_value(self, rtype):
+        """Function returning the raw serialized bytes of the next value, of type rtype.
+        """
+        self.stream.capture = []
+        try:
+            self.skip_value(rtype)
+            return b''.join(self.stream.capture)
+        finally:
+            self.stream.capture = None
+
+    def entries(self):
+        """Generator returning (db, key, rtype, value, expire) for each key of the snapshot, value being the raw
+        serialized bytes of the value of type rtype (see read_value), and expire the expire time in milliseconds or None.
+        """
+        magic = self.stream.read(9)
+        if magic[:5] != b'REDIS':
+            raise ValueError('not a RDB snapshot')
+        self.version = int(magic[5:])
+
+        db = 0
+        expire = None
+        while True:
+            op = self.read_byte()
+            if op in TYPES:
+                key = self.read_string()
+                try:
+                    value = self.read_value(op)
+                except ValueError as e:
+                    raise ValueError('%s, reading the key %r of db %d' % (e, key, db))
+                yield db, key, op, value, expire
+                expire = None
+            elif op == 0xFF:
+                #end of the snapshot and its checksum
+                if self.version >= 5:
+                    self.stream.read(8)
+                return
+            elif op == 0xFE:
+                db = self.read_length()[0]
+            elif op == 0xFD:
+                expire = struct.unpack('<I', self.stream.read(4))[0] * 1000
+            elif op == 0xFC:
+                expire = struct.unpack('<Q', self.stream.read(8))[0]
+            elif op == 0xFB:
+                #sizes of the db and of its expires
+                self.read_length()
+                self.read_length()
+            elif op == 0xFA:
+                #aux field
+                self.skip_strings(2)
+            elif op == 0xF9:
+                #LFU frequency of the next key
+                self.stream.read(1)
+            elif op == 0xF8:
+                #LRU idle time of the next key
+                self.read_length()
+            elif op == 0xF7:
+                #module aux field: module id, when opcode and when, then the opcodes of its value
+                self.read_length()
+                self.read_length()
+                self.read_length()
+                self.skip_module_opcodes()
+            elif op == 0xF5:
+                #function library
+                self.read_string(False)
+            elif op == 0xF4:
+                #cluster slot sizes
+                for _ in range(3):
+                    self.read_length()
+            else:
+                raise ValueError('unsupported RDB type or opcode %d' % op)
+
+
+def read_file(path, size=1 << 20):
+    """Generator returning (db, key, rtype, payload, expire) for each key of the RDB file path, read by chunks of size bytes,
+    payload being the DUMP payload of the value, as taken by RESTORE, and expire the expire time in milliseconds or None.
+    """
+    f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    try:
+        for entry in read_entries(Stream(f.read, size)):
+            yield entry
+    finally:
+        f.close()
+
+
+def read_entries(stream):
+    """Generator returning the keys of the RDB snapshot of stream as read_file, the stream being left at the end
+    of the snapshot, e.g. at the first command of an AOF with a RDB preamble.
+    """
+    rdb = RDBParser(stream)
+    for db, key, rtype, value, expire in rdb.entries():
+        yield db, key, rtype, dump_payload(rtype, value, rdb.version), expire
+
+
+class Buffer:
+    """A class reading a buffer (bytes or a mmap) as a Stream, without copying it.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+        self.capture = None
+
+    def tell(self):
+        return self.pos
+
+    def read(self, n):
+        data = self.buf[self.pos:self.pos + n]
+        if len(data) < n:
+            raise EOFError('end of file')
+        self.pos += n
+        return data
+
+    def skip(self, n):
+        if self.pos + n > len(self.buf):
+            raise EOFError('end of file')
+        self.pos += n
+
+
+def malloc_size(n):
+    """Function returning the bytes allocated by jemalloc for n bytes: multiples of 16 up to 128 bytes,
+    then 4 size classes per power of 2.
+    """
+    if n <= 8:
+        return 8
+    if n <= 128:
+        return (n + 15) & ~15
+    step = 1 << ((n - 1).bit_length() - 3)
+    return (n + step - 1) & ~(step - 1)
+
+
+def sds_size(length):
+    """Function returning the memory used by a sds string of length bytes, with its header and terminating null.
+    """
+    if length < 256:
+        header = 3
+    elif length < 65536:
+        header = 5
+    else:
+        header = 9
+    return malloc_size(header + length + 1)
+
+
+def dict_size(n):
+    """Function returning the memory used by a hash table of n entries, without its keys and values.
+    """
+    return malloc_size(56) + 8 * max(4, 1 << max(n - 1, 0).bit_length()) + n * DICT_ENTRY
+
+#memory used by a robj, a hash table entry, a skiplist node (1.33 levels on average) and a quicklist node
+ROBJ = malloc_size(16)
+DICT_ENTRY = malloc_size(24)
+SKIPLIST_NODE = malloc_size(24 + 16 * 2)
+QUICKLIST = malloc_size(40)
+QUICKLIST_NODE = malloc_size(32)
+
+#the strings of up to 44 bytes are allocated with their robj
+EMBSTR_MAX = 44
+
+#bytes of the entries of a quicklist node, for the lists of RDB files written before quicklists
+QUICKLIST_FILL = 8192
+
+
+class MemoryParser(RDBParser):
+    """A class estimating the memory used by the values of a RDB snapshot from a Buffer,
+    from the encodings and lengths of their strings, which are skipped without being read.
+    """
+
+    def read_length_string(self):
+        """Function returning (length in memory, integer) of the next string, integer being True for the strings
+        encoded as integers, whose length is the one of their decimal representation.
+        """
+        length, encoded = self.read_length()
+        if not encoded:
+            self.stream.skip(length)
+            return length, False
+        if length in (0, 1, 2):
+            data = self.stream.read(1 << length)
+            return len(str(struct.unpack(('<b', '<h', '<i')[length], data)[0])), True
+        if length == 3:
+            clen = self.read_length()[0]
+            ulen = self.read_length()[0]
+            self.stream.skip(clen)
+            return ulen, False
+        raise ValueError('unknown RDB string encoding %d' % length)
+
+    def read_strings_size(self, n):
+        return sum(sds_size(self.read_length_string()[0]) for _ in range(n))
+
+    def read_value(self, rtype):
+        """Function returning the estimated memory used by the next value, of type rtype, without its key.
+        """
+        if rtype == 0:
+            length, integer = self.read_length_string()
+            if integer:
+                #the integer is stored in the pointer of its robj
+                return ROBJ
+            if length <= EMBSTR_MAX:
+                return malloc_size(16 + 3 + length + 1)
+            return ROBJ + sds_size(length)
+        if rtype in (9, 10, 11, 12, 13, 16, 17, 20, 23, 25):
+            if rtype == 25:
+                #min expire time of the fields
+                self.stream.skip(8)
+            #one ziplist, listpack, intset or zipmap blob
+            return ROBJ + malloc_size(self.read_length_string()[0])
+        if rtype in (14, 18):
+            n = self.read_length()[0]
+            size = ROBJ + QUICKLIST + n * QUICKLIST_NODE
+            for _ in range(n):
+                if rtype == 18:
+                    #container: plain element or listpack
+                    self.read_length()
+                size += malloc_size(self.read_length_string()[0])
+            return size
+        if rtype == 1:
+            n = self.read_length()[0]
+            entries = sum(self.read_length_string()[0] + 2 for _ in range(n))
+            return ROBJ + QUICKLIST + int(math.ceil(entries / float(QUICKLIST_FILL))) * QUICKLIST_NODE + malloc_size(entries + 7)
+        if rtype == 2:
+            n = self.read_length()[0]
+            return ROBJ + dict_size(n) + self.read_strings_size(n)
+        if rtype == 4:
+            n = self.read_length()[0]
+            return ROBJ + dict_size(n) + self.read_strings_size(2 * n)
+        if rtype in (22, 24):
+            if rtype == 24:
+                self.stream.skip(8)
+            n = self.read_length()[0]
+            #the hash, its expire metadata, and the expire time stored with each field
+            size = ROBJ + dict_size(n) + malloc_size(40)
+            for _ in range(n):
+                self.read_length()
+                size += 8 + self.read_strings_size(2)
+            return size
+        if rtype in (3, 5):
+            n = self.read_length()[0]
+            size = ROBJ + malloc_size(16) + dict_size(n) + n * SKIPLIST_NODE
+            for _ in range(n):
+                size += sds_size(self.read_length_string()[0])
+                if rtype == 5:
+                    self.stream.skip(8)
+                    continue
+                #score as a string, 253 254 255 being nan, inf and -inf
+                length = self.read_byte()
+                if length < 253:
+                    self.stream.skip(length)
+            return size
+        #streams and modules: their listpacks, radix trees or data take about their serialized size
+        start = self.stream.tell()
+        self.skip_value(rtype)
+        return ROBJ + self.stream.tell() - start
+
+
+def key_memory(key, expire):
+    """Function returning the memory used by a key in the keyspace of its db, without its value:
+    its hash table entry and bucket, its sds name and its entry in the expires of the db.
+    """
+    return DICT_ENTRY + 8 + sds_size(len(key)) + (DICT_ENTRY + 8 if expire is not None else 0)
+
+
+def memory_entries(buf):
+    """Generator returning (db, key, rtype, size, expire) for each key of the RDB snapshot in buf (bytes or a mmap),
+    size being the estimated memory used by the key and its value, and expire the expire time in milliseconds or None.
+    """
+    rdb = MemoryParser(Buffer(buf))
+    for db, key, rtype, size, expire in rdb.entries():
+        yield db, key, rtype, size + key_memory(key, expire), expire
+
+
+class ReplicationError(Exception):
+    pass
+
+
+def pack_command(*args):
+    """Function returning the redis protocol of a command.
+    """
+    out = [('*%d\r\n' % len(args)).encode()]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('utf-8')
+        out.append(('$%d\r\n' % len(arg)).encode())
+        out.append(arg)
+        out.append(b'\r\n')
+    return b''.join(out)
+
+
+def parse_command(buf, pos):
+    """Function parsing the command starting at pos in buf.
+    Return (args, end) or None if buf does not hold the whole command yet.
+    """
+    if pos >= len(buf):
+        return None
+    if buf[pos:pos + 1] != b'*':
+        raise ReplicationError('unexpected replication stream: %r' % bytes(buf[pos:pos + 32]))
+    eol = buf.find(b'\r\n', pos)
+    if eol < 0:
+        return None
+    n = int(bytes(buf[pos + 1:eol]))
+    pos = eol + 2
+    args = []
+    for _ in range(n):
+        eol = buf.find(b'\r\n', pos)
+        if eol < 0:
+            return None
+        start = eol + 2
+        end = start + int(bytes(buf[pos + 1:eol]))
+        if end + 2 > len(buf):
+            return None
+        args.append(bytes(buf[start:end]))
+        pos = end + 2
+    return args, pos
+
+
+class Replica:
+    """A class connecting to a {'host':..., 'port':...} redis server as one of its replicas.
+    """
+
+    # seconds between two REPLCONF ACK sent to the server
+    ack_interval = 1.0
+
+    def __init__(self, server, password=None):
+        self.sock = socket.create_connection((server['host'], server['port']))
+        self.stream = Stream(self.sock.recv)
+        self.rdb = None
+        self.length = 0
+        self.replid = None
+        #replication offset, -1 when the server does not support PSYNC
+        self.offset = -1
+        self.acked = 0
+        if password:
+            self.call('AUTH', password)
+
+    def send(self, *args):
+        self.sock.sendall(pack_command(*args))
+
+    def call(self, *args):
+        """Function sending a command and returning its status reply.
+        """
+        self.send(*args)
+        reply = self.stream.readline()
+        if reply.startswith(b'-'):
+            raise ReplicationError(reply[1:].decode('utf-8', 'replace'))
+        return reply
+
+    def sync(self):
+        """Function asking the server a full resynchronization, the snapshot being read by snapshot().
+        """
+        try:
+            reply = self.call('PSYNC', '?', '-1')
+            if reply.startswith(b'+FULLRESYNC'):
+                self.replid, offset = reply.split()[1:3]
+                self.offset = int(offset)
+        except ReplicationError:
+            #redis < 2.8
+            self.send('SYNC')
+        #the snapshot is a bulk, preceded by newlines keeping the connection alive while the server saves it
+        while True:
+            c = self.stream.read(1)
+            if c == b'$':
+                break
+            if c != b'\n':
+                raise ReplicationError('unexpected reply to PSYNC: %r' % c)
+        self.length = int(self.stream.readline())
+        self.rdb = RDBParser(self.stream)
+
+    def snapshot(self):
+        """Generator returning the keys of the snapshot as RDBParser.entries.
+        """
+        start = self.stream.tell()
+        for entry in self.rdb.entries():
+            yield entry
+        rest = start + self.length - self.stream.tell()
+        if rest > 0:
+            self.stream.read(rest)
+
+    def commands(self):
+        """Generator returning the lists of commands received from the server after the snapshot,
+        as lists of arguments, at least every ack_interval seconds. Pings and REPLCONF GETACK are handled here.
+        """
+        self.ack()
+        self.sock.settimeout(self.ack_interval)
+        while True:
+            commands = []
+            while True:
+                parsed = parse_command(self.stream.buf, self.stream.pos)
+                if parsed is None:
+                    break
+                args, end = parsed
+                if self.offset >= 0:
+                    self.offset += end - self.stream.pos
+                self.stream.pos = end
+                name = args[0].upper()
+                if name == b'PING':
+                    continue
+                if name == b'REPLCONF':
+                    if len(args) > 1 and args[1].upper() == b'GETACK':
+                        self.ack()
+                    continue
+                commands.append(args)
+            yield commands
+            if time.time() - self.acked >= self.ack_interval:
+                self.ack()
+            try:
+                self.stream.fill()
+            except socket.timeout:
+                pass
+
+    def ack(self):
+        """Function sending the replication offset to the server.
+        """
+        if self.offset >= 0:
+            self.send('REPLCONF', 'ACK', self.offset)
+        self.acked = time.time()
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,234 @@
+# -*- coding: UTF-8 -*-
+"""
+Redis Verify
+
+Consistency checks of redis-copy.py and redis-sharding.py (--verify option), comparing the source with the target
+once the keys are copied or resharded. Both sides are walked with SCAN at the same time, by batches of keys read
+in pipelines.
+
+- keys of the source are compared with the target: missing keys, values and ttls. The values are compared by
+  a digest of their DUMP payload without its RDB version and checksum, and when the digests differ (another encoding,
+  another version) by a canonical digest of their type and elements, so a target running another version can be checked
+- keys of the target are checked on the source: extra keys, and with redis-sharding.py keys on another node than the
+  one of the partitioner (misplaced)
+- --sample only checks a fraction of the keys, the same ones on both sides, chosen by the crc32 of the key
+
+The report has one line per mismatch: kind, server-db and hex encoded key. The keys to copy again are also saved
+as the temp keylist of their source server-db, so the next run of the script without --scan copies only them.
+
+Dependencies: redis (redis-py: sudo pip install redis)
+"""
+
+__author__ = "Salimane Adjao Moustapha (salimane@gmail.com)"
+__version__ = "$Revision: 1.0 $"
+__date__ = "$Date: 2026/10/18 12:57:19 $"
+__copyleft__ = "Copyleft (c) 2026 Salimane Adjao Moustapha"
+__license__ = "MIT"
+
+
+import binascii
+import hashlib
+import threading
+
+
+#kinds of mismatches
+MISSING = 'missing'
+VALUE = 'value'
+TTL = 'ttl'
+EXTRA = 'extra'
+MISPLACED = 'misplaced'
+
+#mismatches fixed by copying the key again from its source
+RECOPY = (MISSING, VALUE, TTL)
+
+
+def sampled(key, sample):
+    """Function returning True if key is in the sample, a fraction of the keys between 0 and 1.
+    """
+    return sample is None or (binascii.crc32(key) & 0xffffffff) < sample * 0x100000000
+
+
+def scan_batches(r, keyfilter, count=1000, sample=None):
+    """Generator walking the keyspace of r with SCAN, returning the sampled keys of each page selected by keyfilter
+    (see redis_filter).
+    """
+    cursor = 0
+    while True:
+        cursor, keys = keyfilter.scan(r, cursor, count)
+        keys = [key for key in keys if sampled(key, sample)]
+        if keys:
+            yield keys
+        if cursor == 0:
+            return
+
+
+def dump_digests(r, keys):
+    """Function returning the (digest of the DUMP payload, pttl) of keys from one pipeline,
+    the digest being None when the key does not exist.
+    """
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.dump(key)
+        p.pttl(key)
+    values = p.execute()
+    #the last 10 bytes of a payload are its RDB version and its crc64
+    return [(None if values[2 * i] is None else hashlib.sha1(values[2 * i][:-10]).hexdigest(), values[2 * i + 1])
+            for i in range(len(keys))]
+
+
+def canonical_digests(r, keys):
+    """Function returning the digests of the type and the elements of keys, sorted when their order does not matter,
+    from two pipelines, the digest being None when the key does not exist.
+    """
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.type(key)
+    ktypes = [ktype if isinstance(ktype, str) else ktype.decode('utf-8') for ktype in p.execute()]
+
+    p = r.pipeline(transaction=False)
+    for key, ktype in zip(keys, ktypes):
+        if ktype == 'string':
+            p.get(key)
+        elif ktype == 'hash':
+            p.hgetall(key)
+        elif ktype == 'list':
+            p.lrange(key, 0, -1)
+        elif ktype == 'set':
+            p.smembers(key)
+        elif ktype == 'zset':
+            p.zrange(key, 0, -1, withscores=True)
+        elif ktype == 'stream':
+            p.execute_command('XRANGE', key, '-', '+')
+        else:
+            p.dump(key)
+    digests = []
+    for ktype, value in zip(ktypes, p.execute(raise_on_error=False)):
+        if ktype == 'none' or value is None:
+            digests.append(None)
+            continue
+        if ktype == 'hash':
+            value = sorted(value.items())
+        elif ktype == 'set':
+            value = sorted(value)
+        digests.append(hashlib.sha1(repr((ktype, value)).encode('utf-8')).hexdigest())
+    return digests
+
+
+def compare_keys(r, rr, keys, ttl_tolerance):
+    """Function comparing keys in the source handle r with the target handle rr.
+    - ttl_tolerance : difference in milliseconds allowed between the ttls of a key
+    Return the list of (kind, key) mismatches, keys deleted from the source in the meantime being ignored.
+    """
+    source = dump_digests(r, keys)
+    target = dump_digests(rr, keys)
+    mismatches = []
+    recheck = []
+    for key, (digest, pttl), (tdigest, tpttl) in zip(keys, source, target):
+        if digest is None:
+            continue
+        if tdigest is None:
+            mismatches.append((MISSING, key))
+        elif digest != tdigest:
+            recheck.append(key)
+        elif not ttl_matches(pttl, tpttl, ttl_tolerance):
+            mismatches.append((TTL, key))
+
+    if recheck:
+        ttls = dict((key, (pttl, tpttl)) for key, (digest, pttl), (tdigest, tpttl) in zip(keys, source, target))
+        for key, digest, tdigest in zip(recheck, canonical_digests(r, recheck), canonical_digests(rr, recheck)):
+            if digest is None:
+                continue
+            if digest != tdigest:
+                mismatches.append((VALUE, key))
+            elif not ttl_matches(ttls[key][0], ttls[key][1], ttl_tolerance):
+                mismatches.append((TTL, key))
+    return mismatches
+
+
+def ttl_matches(pttl, tpttl, ttl_tolerance):
+    """Function returning True if the pttls of a key in the source and in the target match, within ttl_tolerance ms.
+    """
+    pttl = -1 if pttl is None else int(pttl)
+    tpttl = -1 if tpttl is None else int(tpttl)
+    if pttl < 0 or tpttl < 0:
+        return pttl == tpttl
+    return abs(pttl - tpttl) <= ttl_tolerance
+
+
+def missing_keys(handles, keys):
+    """Function returning the keys that exist in none of the handles, from one pipeline per handle.
+    """
+    exist = [False] * len(keys)
+    for handle in handles:
+        p = handle.pipeline(transaction=False)
+        for key in keys:
+            p.exists(key)
+        exist = [e or bool(found) for e, found in zip(exist, p.execute())]
+    return [key for key, e in zip(keys, exist) if not e]
+
+
+class Report:
+    """A class collecting the keys checked and the mismatches of the walks of a verification, from several threads.
+    """
+
+    # numbers of mismatched keys printed per server-db and kind
+    examples = 5
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+        self.mismatches = {}
+        self.errors = {}
+
+    def add(self, servername, checked, mismatches):
+        with self.lock:
+            self.checked[servername] = self.checked.get(servername, 0) + checked
+            self.mismatches.setdefault(servername, []).extend(mismatches)
+
+    def fail(self, servername, error):
+        """Function to record the error stopping the walk of a server-db, whose keys are then not all checked.
+        """
+        with self.lock:
+            self.checked.setdefault(servername, 0)
+            self.errors[servername] = error
+
+    def keys(self, servername, kinds):
+        """Function returning the keys of a server-db with a mismatch of one of kinds, in order, once each.
+        """
+        keys = []
+        seen = set()
+        for kind, key in self.mismatches.get(servername, []):
+            if kind in kinds and key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return keys
+
+    def total(self):
+        """Function returning the numbers of mismatches and of walks stopped by an error.
+        """
+        return sum(len(mismatches) for mismatches in self.mismatches.values()) + len(self.errors)
+
+    def write(self, path):
+        """Function to write the mismatches to the file path, one "kind servername hexkey" line each.
+        """
+        with open(path, 'w') as f:
+            for servername in sorted(self.mismatches):
+                for kind, key in self.mismatches[servername]:
+                    f.write('%s %s %s\n' % (kind, servername, binascii.hexlify(key).decode('ascii')))
+
+    def summary(self):
+        """Function returning the counts of keys checked and of mismatches per server-db and kind, with a few examples.
+        """
+        lines = []
+        for servername in sorted(self.checked):
+            kinds = {}
+            for kind, key in self.mismatches.get(servername, []):
+                kinds.setdefault(kind, []).append(key)
+            lines.append("  %s: %d keys checked, %d mismatches" % (
+                servername, self.checked[servername], len(self.mismatches.get(servername, []))))
+            if servername in self.errors:
+                lines.append("    stopped by an error: %s" % self.errors[servername])
+            for kind in sorted(kinds):
+                lines.append("    %s: %d keys, e.g. %s" % (
+                    kind, len(kinds[kind]), ', '.join(repr(key) for key in kinds[kind][:self.examples])))
+        return '\n'.join(lines)
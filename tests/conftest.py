@@ -0,0 +1,95 @@
+import importlib.util
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+#the scripts and their modules are at the root of the repository, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REDIS_SERVER = shutil.which('redis-server')
+
+#numbers of redis servers of the session: a source, and a target being the first of three shard nodes for redis-sharding
+SERVERS = 4
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def load_script(name):
+    """Function returning a script of the repository, e.g. redis-copy.py, imported as a module.
+    """
+    spec = importlib.util.spec_from_file_location(name[:-3].replace('-', '_'), os.path.join(ROOT, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_script(name, *args, **kwargs):
+    """Function running a script of the repository, returning its output, failing if it exits with an error
+    unless check=False is given.
+    """
+    check = kwargs.pop('check', True)
+    process = subprocess.run([sys.executable, os.path.join(ROOT, name)] + [str(arg) for arg in args],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=ROOT, **kwargs)
+    output = process.stdout.decode('utf-8', 'replace')
+    if check:
+        assert process.returncode == 0, output
+    return output
+
+
+@pytest.fixture(scope='session')
+def redis_ports(tmp_path_factory):
+    """Fixture starting SERVERS throwaway redis servers for the session, without persistence,
+    the tests needing them being skipped when redis-server is not installed.
+    """
+    if REDIS_SERVER is None:
+        pytest.skip('redis-server is not installed')
+    redis = pytest.importorskip('redis')
+    processes = []
+    ports = []
+    try:
+        for i in range(SERVERS):
+            port = free_port()
+            processes.append(subprocess.Popen(
+                [REDIS_SERVER, '--port', str(port), '--dir', str(tmp_path_factory.mktemp('redis')),
+                 '--save', '', '--appendonly', 'no', '--notify-keyspace-events', 'Eg$lshzxe'],
+                stdout=subprocess.DEVNULL))
+            ports.append(port)
+        for port in ports:
+            for attempt in range(100):
+                try:
+                    redis.StrictRedis(port=port).ping()
+                    break
+                except redis.ConnectionError:
+                    time.sleep(0.05)
+        yield ports
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+@pytest.fixture
+def servers(redis_ports):
+    """Fixture returning the ports of the redis servers of the session, flushed: source, target, then the shard nodes.
+    """
+    import redis
+    for port in redis_ports:
+        redis.StrictRedis(port=port).flushall()
+    return redis_ports
+
+
+@pytest.fixture
+def redis_copy():
+    return load_script('redis-copy.py')
@@ -0,0 +1,122 @@
+import os
+import time
+
+import redis
+
+import gen_redis_proto
+from conftest import run_script
+
+COMMANDS = [('SELECT', '0'), ('SET', 'user:1', 'a'), ('SET', 'user:2', 'b'), ('SET', 'user:1', 'c'), ('DEL', 'user:2'),
+            ('SELECT', '1'), ('HSET', 'session:1', 'f', 'v'), ('INCR', 'counter')]
+
+
+def proto(commands):
+    return b''.join(gen_redis_proto.gen_redis_proto(*command) for command in commands)
+
+
+def write_aof(tmpdir, commands, name='appendonly.aof', preamble=b''):
+    path = str(tmpdir.join(name))
+    with open(path, 'wb') as f:
+        f.write(preamble + proto(commands))
+    return path
+
+
+def sections(output):
+    """Function returning the lines of each section of the output by title.
+    """
+    result = {}
+    for block in output.strip().split('\n\n'):
+        lines = block.split('\n')
+        result[lines[0]] = [line.split() for line in lines[2:]]
+    return result
+
+
+def stat(section, name):
+    return [line for line in section if line[0] == name][0]
+
+
+def test_stats_of_a_file_and_of_the_standard_input(tmpdir):
+    path = write_aof(tmpdir, COMMANDS)
+    output = run_script('redis-aof-stats.py', path)
+    with open(path, 'rb') as f:
+        assert run_script('redis-aof-stats.py', stdin=f).split('Throughput')[0] == output.split('Throughput')[0]
+
+    stats = sections(output)
+    assert stat(stats['Overall Stats'], 'Commands')[-1] == '8'
+    assert stat(stats['Heaviest Commands'], 'SET')[-2:] == ['3', 'commands']
+    assert stat(stats['Heaviest Prefixes'], 'user')[-2:] == ['4', 'commands']
+    assert stat(stats['Heaviest Prefixes'], 'session')[-2:] == ['1', 'commands']
+    #the SELECT is counted in the db it leaves
+    assert stat(stats['Heaviest Dbs'], '0')[-2:] == ['6', 'commands']
+    assert stat(stats['Heaviest Dbs'], '1')[-2:] == ['2', 'commands']
+
+
+def test_truncated_command(tmpdir):
+    path = write_aof(tmpdir, COMMANDS)
+    with open(path, 'ab') as f:
+        f.write(b'*3\r\n$3\r\nSET\r\n$1\r\nk')
+    stats = sections(run_script('redis-aof-stats.py', path))
+    assert stat(stats['Overall Stats'], 'Commands')[-1] == '8'
+    assert stat(stats['Overall Stats'], 'Truncated')[-1] == str(len(b'*3\r\n$3\r\nSET\r\n$1\r\nk'))
+
+
+def test_compact_drops_the_overwritten_sets(tmpdir):
+    commands = COMMANDS + [('SET', 'x', '1'), ('FLUSHALL',), ('SET', 'x', '2'), ('SET', 'y', '1'), ('SET', 'y', '2', 'NX'),
+                           ('SET', 'z', '1'), ('GET', 'z'), ('SET', 'z', '2')]
+    output = str(tmpdir.join('compacted.aof'))
+    stats = sections(run_script('redis-aof-stats.py', '--compact', '--output=%s' % output, write_aof(tmpdir, commands)))
+    assert stat(stats['Overall Stats'], 'Overwritten')[-1] == '2'
+    with open(output, 'rb') as f:
+        assert f.read() == proto([command for command in commands
+                                  if command not in (('SET', 'user:1', 'a'), ('SET', 'user:2', 'b'))])
+
+
+def test_match_and_exclude_keep_the_commands_without_keys(tmpdir):
+    output = str(tmpdir.join('filtered.aof'))
+    run_script('redis-aof-stats.py', '--match=user:*', '--exclude=user:2', '--output=%s' % output, write_aof(tmpdir, COMMANDS))
+    with open(output, 'rb') as f:
+        assert f.read() == proto([('SELECT', '0'), ('SET', 'user:1', 'a'), ('SET', 'user:1', 'c'), ('SELECT', '1')])
+
+
+def test_appendonlydir_files_are_read_in_the_order_of_the_manifest(tmpdir):
+    aofdir = tmpdir.mkdir('appendonlydir')
+    write_aof(aofdir, COMMANDS[:4], 'appendonly.aof.2.base.aof')
+    write_aof(aofdir, COMMANDS[6:], 'appendonly.aof.3.incr.aof')
+    write_aof(aofdir, COMMANDS[4:6], 'appendonly.aof.2.incr.aof')
+    aofdir.join('appendonly.aof.manifest').write('file appendonly.aof.2.base.aof seq 2 type b\n'
+                                                 'file appendonly.aof.3.incr.aof seq 3 type i\n'
+                                                 'file appendonly.aof.2.incr.aof seq 2 type i\n')
+    output = str(tmpdir.join('all.aof'))
+    run_script('redis-aof-stats.py', '--output=%s' % output, str(aofdir))
+    with open(output, 'rb') as f:
+        assert f.read() == proto(COMMANDS)
+
+
+def test_aof_of_a_server_with_a_rdb_preamble(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    for i in range(10):
+        r.set('before:%d' % i, i)
+    r.config_set('appendonly', 'yes')
+    try:
+        while r.info('persistence')['aof_rewrite_in_progress'] or r.info('persistence')['aof_rewrite_scheduled']:
+            time.sleep(0.1)
+        for i in range(5):
+            r.set('after:%d' % i, i)
+        r.set('before:0', 'overwritten', px=100000)
+        directory = r.config_get('dir')['dir']
+        path = os.path.join(directory, 'appendonlydir')
+        if not os.path.isdir(path):
+            path = os.path.join(directory, 'appendonly.aof')
+        output = str(tmpdir.join('loadable.aof'))
+        stats = sections(run_script('redis-aof-stats.py', '--output=%s' % output, path))
+    finally:
+        r.config_set('appendonly', 'no')
+    assert stat(stats['Overall Stats'], 'Keys')[-1] == '10'
+    assert stat(stats['Heaviest Commands'], 'RESTORE')[-2:] == ['10', 'commands']
+
+    with open(output, 'rb') as f:
+        for command, frame in gen_redis_proto.read_commands(f.read):
+            rr.execute_command(*[bytes(arg) for arg in command])
+    assert sorted(rr.keys('*')) == sorted(r.keys('*'))
+    assert rr.get('before:0') == b'overwritten' and rr.get('after:4') == b'4' and rr.pttl('before:0') > 0
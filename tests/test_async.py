@@ -0,0 +1,110 @@
+import asyncio
+import random
+
+import redis
+
+import redis_async
+
+
+class Handle:
+    """An asyncio handle replying to each command with its reply in replies, or raising it if it is an exception.
+    """
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.commands = []
+
+    async def execute_command(self, *args):
+        self.commands.append(args)
+        await asyncio.sleep(0)
+        reply = self.replies[args[0]]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def batches(count, size):
+    return [(list(range(i, i + size)), {'keymoved': i + size}) for i in range(0, count, size)]
+
+
+def test_batches_are_reported_in_order_with_at_most_inflight_keys():
+    state = {'in_flight': 0, 'max': 0}
+
+    async def copy_one(key):
+        state['in_flight'] += 1
+        state['max'] = max(state['max'], state['in_flight'])
+        #the keys of the later batches often complete first
+        await asyncio.sleep(random.random() * 0.005)
+        state['in_flight'] -= 1
+        return key % 10 != 0
+
+    reported = []
+    redis_async.copy_batches(batches(500, 50), copy_one, 20, lambda copied, checkpoint: reported.append((copied, checkpoint)))
+    assert [checkpoint['keymoved'] for copied, checkpoint in reported] == list(range(50, 550, 50))
+    #the keys multiple of 10 are not copied
+    assert [copied for copied, checkpoint in reported] == [45] * 10
+    assert 1 < state['max'] <= 20
+
+
+def test_inflight_is_read_again_before_each_key():
+    state = {'in_flight': 0, 'copied': 0, 'max_after': 0}
+    limits = {'inflight': 50}
+
+    async def copy_one(key):
+        state['in_flight'] += 1
+        if state['copied'] >= 100:
+            state['max_after'] = max(state['max_after'], state['in_flight'])
+        await asyncio.sleep(0.001)
+        state['in_flight'] -= 1
+        state['copied'] += 1
+        #the governor halves the keys in flight
+        if state['copied'] == 50:
+            limits['inflight'] = 5
+        return True
+
+    redis_async.copy_batches(batches(400, 100), copy_one, lambda: limits['inflight'], lambda copied, checkpoint: None)
+    assert state['copied'] == 400
+    assert 0 < state['max_after'] <= 5
+
+
+def test_run_steps_sends_the_replies_and_throws_the_errors():
+    source = Handle({'GET': b'value', 'TTL': -1})
+    target = Handle({'SET': b'OK', 'PERSIST': redis.ResponseError('ERR wrong')})
+    caught = []
+
+    def steps():
+        value = yield ('source', 'GET', 'key')
+        yield ('target', 'SET', 'key', value)
+        kttl = yield ('source', 'TTL', 'key')
+        try:
+            yield ('target', 'PERSIST', 'key')
+        except redis.ResponseError as e:
+            caught.append((kttl, str(e)))
+
+    window = redis_async.AdaptiveWindow(10)
+    assert asyncio.run(redis_async.run_steps(steps(), source, target, window))
+    assert target.commands == [('SET', 'key', b'value'), ('PERSIST', 'key')]
+    assert caught == [(-1, 'ERR wrong')]
+    assert window.in_flight == 0
+
+
+def test_adaptive_window_shrinks_on_slow_replies_and_grows_back():
+    window = redis_async.AdaptiveWindow(8)
+    sizes = []
+
+    async def replies(*latencies):
+        for latency in latencies:
+            await window.acquire()
+            await window.release(latency)
+        sizes.append(window.size)
+
+    async def run():
+        #a window of fast replies, then slow ones halve the window at most once per window of replies
+        await replies(*[0.002] * 8 + [0.1] * 8)
+        await replies(*[0.1] * 4)
+        #one more slot after each window of fast replies: 2 then 3 then 4 replies
+        await replies(*[0.002] * 9)
+        await replies(*[0.002] * 100)
+
+    asyncio.run(run())
+    assert sizes == [4, 2, 5, 8]
@@ -0,0 +1,153 @@
+import pytest
+import redis
+
+import redis_journal
+
+
+def copier(redis_copy, servers, tmpdir, scan=False, **attrs):
+    """Function returning a RedisCopy of db 0 of the source to db 0 of the target, its journals in tmpdir.
+    """
+    mig = redis_copy.RedisCopy({'host': 'localhost', 'port': servers[0]}, {'host': 'localhost', 'port': servers[1]},
+                               [['0', '0']], None, None, scan=scan)
+    mig.journal_dir = str(tmpdir)
+    for name, value in attrs.items():
+        setattr(mig, name, value)
+    return mig
+
+
+def fill(r, count, value=b'v'):
+    p = r.pipeline(transaction=False)
+    for i in range(count):
+        p.set('key:%d' % i, value)
+    p.execute()
+    return set(('key:%d' % i).encode() for i in range(count))
+
+
+def servername(servers):
+    return 'localhost:%d:0' % servers[0]
+
+
+def test_scan_batches_save_the_cursor_of_each_page(redis_copy, servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    keys = fill(r, 2000)
+    mig = copier(redis_copy, servers, tmpdir, scan=True, scan_count=100, batch_size=30, limit=500)
+
+    batches = list(mig.scan_batches(r, servername(servers)))
+    assert all(0 < len(batch) <= 30 for batch, checkpoint in batches)
+    #the run ends on the checkpoint of the page reaching the limit
+    checkpoints = [checkpoint for batch, checkpoint in batches if checkpoint]
+    assert batches[-1][1] is checkpoints[-1]
+    assert [checkpoint['keymoved'] for checkpoint in checkpoints] == sorted(set(checkpoint['keymoved'] for checkpoint in checkpoints))
+    assert checkpoints[-2]['keymoved'] < 500 <= checkpoints[-1]['keymoved'] == sum(len(batch) for batch, checkpoint in batches)
+
+    #each run resumes from the cursor of the previous one, until the keyspace is walked
+    journal = mig.journal(servername(servers))
+    seen = [key for batch, checkpoint in batches for key in batch]
+    journal.mset(checkpoints[-1])
+    while journal.get('cursor') != -1:
+        for batch, checkpoint in mig.scan_batches(r, servername(servers)):
+            seen.extend(batch)
+            if checkpoint:
+                journal.mset(checkpoint)
+    assert sorted(seen) == sorted(keys)
+    assert journal.get('keymoved') == 2000
+    assert list(mig.scan_batches(r, servername(servers))) == []
+
+
+def test_keylist_batches_save_the_offset_of_each_batch(redis_copy, servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    keys = fill(r, 1000)
+    mig = copier(redis_copy, servers, tmpdir, batch_size=100, limit=250)
+    mig.save_keylists()
+    journal = mig.journal(servername(servers))
+    assert journal.get('keys') == 1000
+
+    batches = list(mig.keylist_batches(r, servername(servers)))
+    assert [len(batch) for batch, checkpoint in batches] == [100, 100, 50]
+    assert [checkpoint['keymoved'] for batch, checkpoint in batches] == [100, 200, 250]
+    read = []
+    for batch, checkpoint in batches:
+        read.extend(batch)
+        assert checkpoint['keyoffset'] == redis_journal.keys_bytes(read)
+
+    journal.mset(batches[-1][1])
+    while journal.get('keymoved') < 1000:
+        for batch, checkpoint in mig.keylist_batches(r, servername(servers)):
+            read.extend(batch)
+            journal.mset(checkpoint)
+    assert sorted(read) == sorted(keys)
+    assert list(mig.keylist_batches(r, servername(servers))) == []
+
+
+def test_keylist_batches_stop_at_limit_bytes(redis_copy, servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    fill(r, 100, b'x' * 1000)
+    mig = copier(redis_copy, servers, tmpdir, batch_size=10, limit=100, limit_bytes=20000)
+    mig.save_keylists()
+    #batches of 10 keys of a bit more than 1000 bytes each, the second one reaching the limit
+    batches = list(mig.keylist_batches(r, servername(servers)))
+    assert [checkpoint['keymoved'] for batch, checkpoint in batches] == [10, 20]
+
+
+def test_scan_batches_stop_in_the_page_at_limit_bytes(redis_copy, servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    keys = fill(r, 1000, b'x' * 1000)
+    mig = copier(redis_copy, servers, tmpdir, scan=True, scan_count=1000, batch_size=10, limit_bytes=20000)
+    journal = mig.journal(servername(servers))
+
+    #each run stops after the second batch of 10 keys, in the middle of the page unless it ends there
+    seen = []
+    stopped = 0
+    while journal.get('cursor') != -1:
+        batches = list(mig.scan_batches(r, servername(servers)))
+        seen.extend(key for batch, checkpoint in batches for key in batch)
+        checkpoint = batches[-1][1]
+        assert sum(len(batch) for batch, checkpoint in batches) <= 20
+        assert checkpoint['keymoved'] == len(seen)
+        if checkpoint['pagedone']:
+            stopped += 1
+        journal.mset(checkpoint)
+    assert stopped > 40
+    assert sorted(seen) == sorted(keys)
+    assert journal.get('keymoved') == 1000 and journal.get('pagedone') is None
+
+
+def test_big_keys_are_alone_in_their_batch(redis_copy, servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    fill(r, 10)
+    r.set('key:5', b'x' * 20000)
+    mig = copier(redis_copy, servers, tmpdir, big_key_bytes=10000)
+    batches = [batch for batch, size, read in mig.sized_batches(r, [('key:%d' % i).encode() for i in range(10)])]
+    assert [len(batch) for batch in batches] == [5, 1, 4]
+    assert isinstance(batches[1][0], redis_copy.BigKey)
+
+
+@pytest.mark.parametrize('scan', [False, True])
+def test_a_failed_run_resumes_from_the_last_checkpoint(redis_copy, servers, tmpdir, scan):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    fill(r, 1000)
+    mig = copier(redis_copy, servers, tmpdir, scan=scan, scan_count=100, batch_size=100)
+    if not scan:
+        mig.save_keylists()
+    copy_keys = mig.copy_keys
+    copied = []
+
+    def failing_copy_keys(r, rr, keys, servername):
+        if len(copied) == 3:
+            raise redis.ConnectionError('target lost')
+        copied.append(keys)
+        return copy_keys(r, rr, keys, servername)
+
+    mig.copy_keys = failing_copy_keys
+    with pytest.raises(redis.ConnectionError):
+        mig.copy_db()
+    #the checkpoint of the last batch copied, or of the last page whose batches were all copied
+    keymoved = copier(redis_copy, servers, tmpdir).journal(servername(servers)).get('keymoved', 0)
+    assert keymoved <= 300 and (scan or keymoved == 300)
+
+    mig = copier(redis_copy, servers, tmpdir, scan=scan, scan_count=100, batch_size=100)
+    while mig.copy_db():
+        pass
+    assert rr.dbsize() == 1000
+    assert mig.journal(servername(servers)).get('keymoved') == 1000
@@ -0,0 +1,152 @@
+import gzip
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+import redis
+
+from conftest import ROOT, run_script
+
+
+def copy(servers, tmpdir, *args):
+    return run_script('redis-copy.py', '-s', 'localhost:%d' % servers[0], '-t', 'localhost:%d' % servers[1],
+                      '-d', '0:0', '--journal=%s' % tmpdir, *args)
+
+
+@pytest.mark.parametrize('args', [[], ['--scan'], ['--async']])
+def test_copy_replaces_the_keys_of_the_target(servers, tmpdir, args):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    r.hset('hash', mapping={'a': 1, 'b': 2})
+    rr.hset('hash', mapping={'a': 0, 'stale': 3})
+    r.sadd('set', 'a', 'b')
+    rr.sadd('set', 'stale')
+    r.zadd('zset', {'a': 1})
+    rr.zadd('zset', {'a': 2, 'stale': 3})
+    r.rpush('list', 'a', 'b')
+    rr.rpush('list', 'stale')
+    r.set('string', 'v')
+    rr.set('string', 'stale')
+    for key in ('hash', 'set', 'zset', 'list', 'string'):
+        rr.expire(key, 100)
+
+    copy(servers, tmpdir, *args)
+    assert rr.hgetall('hash') == {b'a': b'1', b'b': b'2'}
+    assert rr.smembers('set') == set([b'a', b'b'])
+    assert rr.zrange('zset', 0, -1, withscores=True) == [(b'a', 1.0)]
+    assert rr.lrange('list', 0, -1) == [b'a', b'b']
+    assert rr.get('string') == b'v'
+    #the expire times of the target are cleared when the source has none
+    assert [rr.ttl(key) for key in ('hash', 'set', 'zset', 'list', 'string')] == [-1] * 5
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.1)
+
+
+def test_follow_replays_the_changes_of_the_members(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    r.hset('hash', mapping={'a': 1, 'b': 2})
+    r.sadd('set', 'a', 'b')
+    r.zadd('zset', {'a': 1, 'b': 2})
+    r.set('string', 'v', ex=100)
+    r.set('gone', 'v')
+
+    process = subprocess.Popen([sys.executable, '-u', os.path.join(ROOT, 'redis-copy.py'), '-s', 'localhost:%d' % servers[0],
+                                '-t', 'localhost:%d' % servers[1], '-d', '0:0', '--journal=%s' % tmpdir, '--scan', '--follow'],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=ROOT)
+    try:
+        for line in process.stdout:
+            if b'following the changes' in line:
+                break
+        assert rr.hgetall('hash') == {b'a': b'1', b'b': b'2'}
+        assert rr.ttl('string') > 0
+
+        r.hdel('hash', 'a')
+        r.srem('set', 'a')
+        r.zrem('zset', 'a')
+        r.zadd('zset', {'b': 3})
+        r.persist('string')
+        r.delete('gone')
+        wait_for(lambda: rr.hgetall('hash') == {b'b': b'2'} and rr.smembers('set') == set([b'b'])
+                 and rr.zrange('zset', 0, -1, withscores=True) == [(b'b', 3.0)] and rr.ttl('string') == -1
+                 and not rr.exists('gone'))
+    finally:
+        process.send_signal(signal.SIGINT)
+        output = process.communicate()[0]
+    assert process.returncode == 0, output
+
+
+@pytest.mark.parametrize('dump', [False, True])
+def test_big_streams_are_restored_whole(redis_copy, servers, tmpdir, dump):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    for i in range(200):
+        r.xadd('stream', {'field': i})
+    r.pexpire('stream', 100000)
+    r.set('string', 'v')
+    mig = redis_copy.RedisCopy({'host': 'localhost', 'port': servers[0]}, {'host': 'localhost', 'port': servers[1]},
+                               [['0', '0']], None, None, scan=True, dump=dump)
+    mig.journal_dir = str(tmpdir)
+    #the stream is a big key, in the lane of the keys copied by chunks
+    mig.big_key_bytes = 1000
+    assert r.memory_usage('stream') > mig.big_key_bytes
+
+    while mig.copy_db():
+        pass
+    assert rr.xrange('stream') == r.xrange('stream')
+    assert 0 < rr.pttl('stream') <= 100000
+    assert rr.get('string') == b'v'
+
+
+def test_verify_then_copy_again_fixes_the_mismatches(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    for i in range(100):
+        r.hset('hash:%d' % i, mapping={'a': i, 'b': i})
+        r.sadd('set:%d' % i, 'a', 'b')
+        r.zadd('zset:%d' % i, {'a': i})
+        r.set('string:%d' % i, i, ex=1000)
+    copy(servers, tmpdir)
+
+    rr.hdel('hash:1', 'a')
+    rr.hset('hash:2', 'stale', 1)
+    rr.sadd('set:3', 'stale')
+    rr.zadd('zset:4', {'a': 0, 'stale': 1})
+    rr.delete('string:5')
+    rr.persist('string:6')
+    rr.expire('hash:7', 100)
+    output = run_script('redis-copy.py', '-s', 'localhost:%d' % servers[0], '-t', 'localhost:%d' % servers[1],
+                        '-d', '0:0', '--journal=%s' % tmpdir, '--verify', check=False)
+    assert '7 mismatches found' in output
+
+    output = copy(servers, tmpdir)
+    assert '7 keys have been copied' in output
+    assert '0 mismatches found' in copy(servers, tmpdir, '--verify')
+
+
+@pytest.mark.parametrize('args', [[], ['--dump']])
+def test_output_file_loads_the_keys(servers, tmpdir, args):
+    import gen_redis_proto
+
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1], db=2)
+    r.zadd('zset', {'a': 1.5, 'b': 2})
+    r.hset('hash', 'a', 1)
+    r.set('string', 'v', ex=1000)
+    path = str(tmpdir.join('keys.resp.gz'))
+    run_script('redis-copy.py', '-s', 'localhost:%d' % servers[0], '--output=%s' % path, '-d', '0:2',
+               '--journal=%s' % tmpdir, *args)
+    with gzip.open(path, 'rb') as f:
+        for command, frame in gen_redis_proto.read_commands(f.read):
+            rr.execute_command(*[bytes(arg) for arg in command])
+    assert rr.zrange('zset', 0, -1, withscores=True) == [(b'a', 1.5), (b'b', 2.0)]
+    assert rr.hgetall('hash') == {b'a': b'1'}
+    assert 990 < rr.ttl('string') <= 1000
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+import redis
+
+import redis_filter
+from conftest import run_script
+
+#bytes of the keys and the patterns, the patterns having no byte over 0x7f, compared as signed chars in the ranges of redis
+KEY_BYTES = b'ab-]^\\[\n\xff'
+PATTERN_BYTES = b'ab*?[]^-\\\n'
+
+
+@pytest.mark.parametrize('pattern,key,matched', [
+    ('user:*', b'user:1', True),
+    ('user:*', b'users', False),
+    ('h?llo', b'h\xffllo', True),
+    ('h[^e]llo', b'hallo', True),
+    ('h[^e]llo', b'hello', False),
+    ('h[a-b]llo', b'hbllo', True),
+    ('h[b-a]llo', b'hbllo', True),
+    ('h\\*llo', b'h*llo', True),
+    ('h\\*llo', b'hello', False),
+    ('[\\]]', b']', True),
+    ('[]', b']', False),
+    ('[^]', b'x', True),
+    ('h[el', b'e', False),
+    ('h[el', b'hl', True),
+    ('*', b'bin\x00\n\xff', True),
+    ('*', b'', True),
+    ('**', b'', False),
+])
+def test_glob_pattern(pattern, key, matched):
+    assert bool(redis_filter.glob_pattern(pattern).fullmatch(key)) == matched
+
+
+def test_glob_patterns_match_the_keys_the_server_matches(servers):
+    r = redis.StrictRedis(port=servers[0])
+    rand = random.Random(0)
+    keys = set(bytes(rand.choice(KEY_BYTES) for i in range(rand.randint(0, 5))) for j in range(300))
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.set(key, 1)
+    p.execute()
+    for i in range(1000):
+        pattern = bytes(rand.choice(PATTERN_BYTES) for i in range(rand.randint(1, 6)))
+        regex = redis_filter.glob_pattern(pattern)
+        assert set(key for key in keys if regex.fullmatch(key)) == set(r.keys(pattern)), pattern
+
+
+def test_match_and_exclude():
+    keyfilter = redis_filter.KeyFilter(['user:*', 'session:*'], ['session:tmp:*'])
+    assert keyfilter.match(b'user:1') and keyfilter.match(b'session:1')
+    assert not keyfilter.match(b'session:tmp:1') and not keyfilter.match(b'other')
+    #the server matched the patterns, only the exclusions are left
+    assert keyfilter.match(b'other', patterns=False)
+    assert not keyfilter.match(b'session:tmp:1', patterns=False)
+    assert redis_filter.KeyFilter().everything() and not keyfilter.everything()
+
+
+def test_scan_selects_the_keys_by_pattern_exclusion_and_type(servers):
+    r = redis.StrictRedis(port=servers[0])
+    for i in range(100):
+        r.hset('user:%d' % i, 'a', i)
+        r.set('user:string:%d' % i, i)
+        r.hset('session:%d' % i, 'a', i)
+        r.hset('session:tmp:%d' % i, 'a', i)
+        r.hset('other:%d' % i, 'a', i)
+    for keyfilter in (redis_filter.KeyFilter(['user:*', 'session:*'], ['session:tmp:*'], 'hash'),
+                      redis_filter.KeyFilter(['[us][se][es]*'], ['session:tmp:*'], 'hash')):
+        keys = []
+        cursor = 0
+        while True:
+            cursor, page = keyfilter.scan(r, cursor, 50)
+            keys.extend(page)
+            if cursor == 0:
+                break
+        assert sorted(keys) == sorted([('user:%d' % i).encode() for i in range(100)] + [('session:%d' % i).encode() for i in range(100)])
+        assert sorted(keyfilter.keys(r)) == sorted(keys)
+
+
+def test_copy_with_filters(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    rr = redis.StrictRedis(port=servers[1])
+    r.set('small', 'x')
+    r.set('big', 'x' * 10000)
+    r.set('tmp:big', 'x' * 10000)
+    r.hset('hash', 'a', 'x' * 10000)
+    run_script('redis-copy.py', '-s', 'localhost:%d' % servers[0], '-t', 'localhost:%d' % servers[1], '-d', '0:0',
+               '--journal=%s' % tmpdir, '--scan', '--type=string', '--exclude=tmp:*', '--min-size=1000')
+    assert rr.keys('*') == [b'big']
@@ -0,0 +1,69 @@
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+import gen_redis_proto
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SCRIPT = os.path.join(os.path.dirname(FIXTURES), os.pardir, 'gen_redis_proto.py')
+
+#commands.proto is the output of the original gen_redis_proto.py (python 2) for commands.txt
+COMMANDS = os.path.join(FIXTURES, 'commands.txt')
+with io.open(os.path.join(FIXTURES, 'commands.proto'), 'rb') as f:
+    BASELINE = f.read()
+
+
+def lines():
+    with io.open(COMMANDS, 'rb') as f:
+        return [line.rstrip().split(b' ') for line in f]
+
+
+def test_gen_redis_proto_matches_baseline():
+    assert b''.join(gen_redis_proto.gen_redis_proto(*line) for line in lines()) == BASELINE
+
+
+def test_gen_redis_protos_matches_baseline():
+    assert bytes(gen_redis_proto.gen_redis_protos(lines())) == BASELINE
+
+
+def test_input_batches_match_baseline():
+    batches = list(gen_redis_proto.input_batches([COMMANDS], batch=3))
+    assert [(first, count) for path, first, count, proto in batches] == [(1, 3), (4, 3), (7, 3), (10, 1)]
+    assert b''.join(bytes(proto) for path, first, count, proto in batches) == BASELINE
+
+
+def test_file_chunks_match_baseline():
+    chunks = gen_redis_proto.file_chunks(COMMANDS, size=100)
+    assert len(chunks) > 1
+    assert chunks[0][0] == 0 and chunks[-1][1] == os.path.getsize(COMMANDS)
+    protos = [proto for start, end in chunks for count, proto in gen_redis_proto.encode_chunk((COMMANDS, start, end, 2))]
+    assert b''.join(bytes(proto) for proto in protos) == BASELINE
+
+
+def test_file_batches_leave_no_worker_behind():
+    batches = gen_redis_proto.file_batches([COMMANDS, COMMANDS], 2, batch=3)
+    assert [(path, first, count) for path, first, count, proto in batches] == [
+        (COMMANDS, 1, 3), (COMMANDS, 4, 3), (COMMANDS, 7, 3), (COMMANDS, 10, 1)] * 2
+    #the pool is joined when the generator is closed early as well
+    batches = gen_redis_proto.file_batches([COMMANDS], 2, batch=3)
+    next(batches)
+    batches.close()
+    assert multiprocessing.active_children() == []
+
+
+def test_script_output_matches_baseline():
+    for workers in ('1', '2'):
+        assert subprocess.check_output([sys.executable, SCRIPT, '-w', workers, COMMANDS]) == BASELINE
+    with io.open(COMMANDS, 'rb') as f:
+        assert subprocess.check_output([sys.executable, SCRIPT], stdin=f) == BASELINE
+
+
+def test_encode_arguments():
+    assert gen_redis_proto.gen_redis_proto('SET', 'cl\xe9', b'\x00') == b'*3\r\n$3\r\nSET\r\n$4\r\ncl\xc3\xa9\r\n$1\r\n\x00\r\n'
+    assert gen_redis_proto.gen_redis_proto('SET', b'k', b'x' * 2000).startswith(b'*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$2000\r\nxx')
+    with pytest.raises(TypeError):
+        gen_redis_proto.gen_redis_proto('SET', 'k', 12)
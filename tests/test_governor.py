@@ -0,0 +1,86 @@
+import time
+
+import redis
+
+import redis_governor
+from conftest import run_script
+
+
+class Source:
+    """A redis handle whose PINGs take latency seconds, and whose commandstats are calls and usec.
+    """
+
+    def __init__(self):
+        self.latency = 0.0
+        self.calls = 0
+        self.usec = 0
+
+    def ping(self):
+        time.sleep(self.latency)
+
+    def info(self, section):
+        if section == 'stats':
+            return {'instantaneous_ops_per_sec': 100}
+        return {'cmdstat_get': {'calls': self.calls, 'usec': self.usec}}
+
+
+def governor(source, **kwargs):
+    governor = redis_governor.Governor(source, [], 0.005, 100, **kwargs)
+    governor.max_pause = 0.02
+    governor.sample_interval = 3600
+    return governor
+
+
+def limits(governor):
+    return governor.batch_size, governor.inflight, governor.workers
+
+
+def test_halves_over_the_slo_once_per_cooldown_then_grows_back():
+    source = Source()
+    g = governor(source, inflight=8, workers=4)
+    source.latency = 0.01
+    g.throttle()
+    assert limits(g) == (50, 4, 2) and g.pause == g.min_pause and g.throttled == 1
+    #no decision until cooldown samples are taken at the new rate
+    for i in range(g.cooldown - 1):
+        g.throttle()
+    assert limits(g) == (50, 4, 2)
+    g.throttle()
+    assert limits(g) == (25, 2, 1) and g.throttled == 2
+
+    #held until at most one slow sample is left in the window, then each batch grows back by a step
+    source.latency = 0.0
+    for i in range(g.window - 2):
+        g.throttle()
+    assert limits(g) == (25, 2, 1)
+    for i in range(12):
+        g.throttle()
+    assert limits(g) == (100, 8, 4) and g.pause == 0.0 and g.throttled == 2
+
+
+def test_the_commands_of_the_source_are_latency_samples():
+    source = Source()
+    g = governor(source)
+    source.calls, source.usec = 100, 1000
+    g.sample()
+    source.calls, source.usec = 200, 101000
+    g.sample()
+    assert g.latencies == [0.001]
+    assert g.stats['source'] == (100, 200, 101000, 1000.0)
+
+
+def test_state_shows_the_keys_in_flight_and_the_workers_only_when_throttled():
+    assert 'in flight' not in governor(Source()).state() and 'workers' not in governor(Source()).state()
+    assert '100 keys in flight, 4 workers' in governor(Source(), inflight=100, workers=4).state()
+
+
+def test_keys_in_flight_are_only_governed_with_async(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    for i in range(100):
+        r.set('key:%d' % i, i)
+    for args, shown in (([], False), (['--async'], True)):
+        redis.StrictRedis(port=servers[1]).flushall()
+        output = run_script('redis-copy.py', '-s', 'localhost:%d' % servers[0], '-t', 'localhost:%d' % servers[1], '-d', '0:0',
+                            '--journal=%s' % tmpdir.mkdir('async' if args else 'sync'), '--scan', '--slo=1000', *args)
+        assert 'throttled 0 times' in output
+        assert ('100 keys in flight' in output) == shown
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import redis_journal
+
+#takes the lock of argv[1] in another process, printing whether it got it
+LOCKER = "import sys, redis_journal; print(redis_journal.lock(sys.argv[1]) is not None)"
+
+
+def other_process_locks(path):
+    root = os.path.dirname(os.path.abspath(redis_journal.__file__))
+    return subprocess.check_output([sys.executable, '-c', LOCKER, path], cwd=root).strip() == b'True'
+
+
+def lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_journal_is_compacted_when_opened(tmpdir):
+    path = str(tmpdir.join('journal'))
+    journal = redis_journal.Journal(path)
+    journal.mset({'cursor': 10, 'keymoved': 500})
+    journal.mset({'cursor': 20, 'keymoved': 1000})
+    journal.mset({'cursor': 30, 'keymoved': 1500, 'keyoffset': None})
+    journal.close()
+    assert len(lines(path)) == 4
+
+    journal = redis_journal.Journal(path)
+    assert (journal.get('cursor'), journal.get('keymoved'), journal.get('keyoffset', 0)) == (30, 1500, 0)
+    assert len(lines(path)) == 1
+    journal.mset({'cursor': None})
+    journal.close()
+    assert redis_journal.Journal(path).get('cursor') is None
+
+
+def test_journal_ignores_a_line_cut_by_a_crash(tmpdir):
+    path = str(tmpdir.join('journal'))
+    journal = redis_journal.Journal(path)
+    journal.mset({'keymoved': 500})
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"keymoved": 10')
+    assert redis_journal.Journal(path).get('keymoved') == 500
+    assert len(lines(path)) == 1
+
+
+def test_lock_is_exclusive_between_processes(tmpdir):
+    path = str(tmpdir.join('lock'))
+    lockfile = redis_journal.lock(path)
+    assert lockfile is not None
+    assert lines(path) == [str(os.getpid())]
+    assert not other_process_locks(path)
+    lockfile.close()
+    assert other_process_locks(path)
+
+
+def test_keylist_offsets(tmpdir):
+    path = str(tmpdir.join('keylist'))
+    keys = [b'a', b'user:1', b'bin\xff\x00\n', b'', b'last']
+    keylist = redis_journal.KeyList(path)
+    for key in keys:
+        keylist.append(key)
+    keylist.close()
+    assert redis_journal.read_keys(path, 0, 2) == keys[:2]
+    offset = redis_journal.keys_bytes(keys[:2])
+    assert redis_journal.read_keys(path, offset, 10) == keys[2:]
+    assert redis_journal.read_keys(path, offset + redis_journal.keys_bytes(keys[2:]), 10) == []
@@ -0,0 +1,149 @@
+import gzip
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+
+#rows of the memory report of rdb: the key user:1 is in db 0 and db 1
+CSV = (b'database,type,key,size_in_bytes,encoding,num_elements,len_largest_element\n'
+       b'0,string,"user:1",100,string,1,1\n'
+       b'1,string,"user:1",50,string,1,1\n'
+       b'0,hash,"user:2",70,hashtable,1,1\n'
+       b'1,set,"session:1",30,intset,1,1\n')
+
+
+@pytest.fixture(scope='module')
+def python2():
+    """Fixture returning the python 2 interpreter of redis-mem-stats.py, the one of $PYTHON2 or python2,
+    the tests being skipped when there is none.
+    """
+    for python in (os.environ.get('PYTHON2'), shutil.which('python2')):
+        if python and subprocess.call([python, '-c', 'import sys; sys.exit(sys.version_info[0] != 2)'],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
+            return python
+    pytest.skip('python 2 is not installed')
+
+
+def mem_stats(python2, *args, **kwargs):
+    """Function running redis-mem-stats.py with python2, returning its output.
+    """
+    process = subprocess.run([python2, os.path.join(ROOT, 'redis-mem-stats.py')] + [str(arg) for arg in args],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=ROOT, **kwargs)
+    output = process.stdout.decode('utf-8', 'replace')
+    assert process.returncode == 0, output
+    return output
+
+
+def section(output, title):
+    """Function returning the rows of the section title of the output, split on whitespace.
+    """
+    lines = output.split(title + '\n' + '=' * 40 + '\n')[1].split('\n\n')[0]
+    return [line.split() for line in lines.split('\n')]
+
+
+def test_heaviest_keys_are_summed_by_name(python2, tmpdir):
+    path = tmpdir.join('memory.csv')
+    path.write_binary(CSV)
+    output = mem_stats(python2, path)
+    assert mem_stats(python2, input=CSV) == output
+    assert section(output, 'Heaviest Keys') == [['user:1', '150.0bytes', '(60.00%)'], ['user:2', '70.0bytes', '(28.00%)'],
+                                                ['session:1', '30.0bytes', '(12.00%)']]
+    assert section(output, 'Heaviest Dbs') == [['0', '170.0bytes', '(68.00%)'], ['1', '80.0bytes', '(32.00%)']]
+
+
+def test_keys_by_db(python2):
+    output = mem_stats(python2, '--keys-by-db', input=CSV)
+    assert section(output, 'Heaviest Keys') == [
+        ['user:1', '(db', '0)', '100.0bytes', '(40.00%)'], ['user:2', '(db', '0)', '70.0bytes', '(28.00%)'],
+        ['user:1', '(db', '1)', '50.0bytes', '(20.00%)'], ['session:1', '(db', '1)', '30.0bytes', '(12.00%)']]
+    #the heaviest keys of a single db are listed without it
+    single = b'\n'.join(line for line in CSV.split(b'\n') if not line.startswith(b'1,'))
+    assert mem_stats(python2, '--keys-by-db', input=single) == mem_stats(python2, input=single)
+
+
+def test_prefix_counters_keep_the_heaviest_prefixes(python2):
+    rnd = random.Random(1)
+    rows = [b'%d,string,"heavy:%d:%d",%d,string,1,1' % (rnd.randint(0, 1), i % 10, i, 1000) for i in range(1000)]
+    rows += [b'0,string,"light:%d:1",%d,string,1,1' % (i, rnd.randint(1, 10)) for i in range(5000)]
+    rnd.shuffle(rows)
+    csv = b'\n'.join(rows) + b'\n'
+    exact = mem_stats(python2, input=csv)
+    bounded = mem_stats(python2, '--prefix-counters=100', input=csv)
+    error = int(section(bounded, 'Overall Stats')[1][-1])
+    assert 0 < error <= sum(int(row.split(b',')[3]) for row in rows) // 100
+    bounded_prefixes = [row[0] for row in section(bounded, 'Heaviest Prefixes')]
+    #the heavy prefixes are the first ones, in an order of their overestimated sizes
+    assert sorted(bounded_prefixes[:10]) == sorted(row[0] for row in section(exact, 'Heaviest Prefixes')[:10])
+    assert section(bounded, 'Heaviest Keys') == section(exact, 'Heaviest Keys')
+
+
+def test_prefix_tree(python2):
+    csv = (b'0,string,"user:1:name",100,string,1,1\n0,string,"user:2:name",50,string,1,1\n'
+           b'0,string,"user:2:email",40,string,1,1\n0,string,"user:deadbeef01:name",10,string,1,1\n'
+           b'1,string,"session:x",30,string,1,1\n0,string,"plain",20,string,1,1\n')
+    rows = section(mem_stats(python2, '--tree-depth=2', input=csv), 'Prefix Tree')
+    assert [(row[0], row[-2]) for row in rows] == [('user:', '4'), ('user:1:', '1'), ('user:2:', '2'),
+                                                   ('user:deadbeef01:', '1'), ('session:', '1')]
+    assert rows[2][1] == '90.0bytes'
+    rows = section(mem_stats(python2, '--tree-depth=1', '--collapse-ids', input=csv), 'Prefix Tree')
+    assert [(row[0], row[1], row[-2]) for row in rows] == [('user:', '200.0bytes', '4'), ('session:', '30.0bytes', '1')]
+    rows = section(mem_stats(python2, '--tree-depth=2', '--collapse-ids', input=csv), 'Prefix Tree')
+    assert [(row[0], row[1], row[-2]) for row in rows] == [('user:', '200.0bytes', '4'), ('user:*:', '200.0bytes', '4'),
+                                                           ('session:', '30.0bytes', '1')]
+
+
+def test_prefix_tree_sums_the_children_after_the_heaviest_ones(python2):
+    csv = b''.join(b'0,string,"user:%d:name",%d,string,1,1\n' % (i, i) for i in range(1, 41))
+    rows = section(mem_stats(python2, '--tree-depth=2', input=csv), 'Prefix Tree')
+    assert [row[0] for row in rows[1:31]] == ['user:%d:' % i for i in range(40, 10, -1)]
+    assert rows[31] == ['(others)', '55.0bytes', '(6.71%)', '10', 'keys']
+
+
+#redis-mem-stats.py parsing path by chunks of 4KB in workers processes, with the options kwargs
+CHUNKS = '''
+import imp, sys
+stats = imp.load_source('redis_mem_stats', 'redis-mem-stats.py')
+file_chunks = stats.file_chunks
+stats.file_chunks = lambda path: file_chunks(path, 4096)
+counter = stats.RedisMemStats(**%(kwargs)r)
+counter.process_file(%(path)r, %(workers)d)
+counter.print_stats()
+'''
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'tree_depth': 2, 'keys_by_db': True}])
+def test_chunks_parsed_by_workers_merge_into_the_stats_of_a_single_process(python2, tmpdir, kwargs):
+    rnd = random.Random(2)
+    csv = b''.join(b'%d,%s,"%s:%d:%d",%d,encoding,1,1\n' % (rnd.randint(0, 3), rnd.choice([b'string', b'hash', b'set']),
+                                                            rnd.choice([b'user', b'session', b'cache']), rnd.randint(0, 50),
+                                                            rnd.randint(0, 300), rnd.randint(1, 5000)) for i in range(2000))
+    #a last line without a newline
+    csv += b'0,string,"last",10,string,1,1'
+    path = tmpdir.join('memory.csv')
+    path.write_binary(csv)
+    args = ['--tree-depth=2', '--keys-by-db'] if kwargs else []
+    expected = mem_stats(python2, *args, input=csv)
+    for workers in (1, 3):
+        output = subprocess.check_output([python2, '-c', CHUNKS % {'kwargs': kwargs, 'path': str(path), 'workers': workers}],
+                                         cwd=ROOT).decode('utf-8')
+        assert output == expected
+    assert mem_stats(python2, '--workers=3', path, *args) == expected
+
+
+def test_rdb(python2, tmpdir):
+    snapshot = os.path.join(ROOT, 'tests', 'fixtures', 'small.rdb')
+    output = mem_stats(python2, '--rdb=%s' % snapshot)
+    assert section(output, 'Overall Stats') == [['Keys', 'Processed', '14']]
+    assert [row[0] for row in section(output, 'Heaviest Keys')[:3]] == ['bigset', 'bigzset', 'bighash']
+    assert [row[0] for row in section(output, 'Heaviest Dbs')] == ['0', '3']
+    assert set(row[0] for row in section(output, 'Heaviest Types')) == set(['set', 'sortedset', 'hash', 'string', 'list'])
+
+    path = str(tmpdir.join('small.rdb.gz'))
+    with open(snapshot, 'rb') as src:
+        with gzip.open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    assert mem_stats(python2, '--rdb=%s' % path) == output
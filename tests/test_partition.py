@@ -0,0 +1,76 @@
+import pytest
+
+import redis_partition
+
+NODES = ['node_1', 'node_2', 'node_3']
+KEYS = [('user:%d' % i).encode() for i in range(20000)]
+
+#slots returned by CLUSTER KEYSLOT of redis 6.2
+SLOTS = [(b'foo', 12182), (b'bar', 5061), (b'hello', 866), (b'123456789', 12739),
+         (b'{user1000}.following', 3443), (b'{user1000}.followers', 3443),
+         (b'foo{}{bar}', 8363), (b'foo{{bar}}zap', 4015), (b'foo{bar}{zap}', 5061), (b'', 0)]
+
+
+def moved(name, before, after):
+    old = redis_partition.partitioner(name, before)
+    new = redis_partition.partitioner(name, after)
+    return [(old.node(key), new.node(key)) for key in KEYS if old.node(key) != new.node(key)]
+
+
+def test_crc16_xmodem():
+    assert redis_partition.crc16(b'123456789') == 0x31c3
+    assert redis_partition.crc16(b'') == 0
+
+
+@pytest.mark.parametrize('key,slot', SLOTS)
+def test_key_slot(key, slot):
+    assert redis_partition.SlotPartitioner(NODES).key_slot(key) == slot
+
+
+def test_hash_tag():
+    assert redis_partition.hash_tag(b'{user1000}.following') == b'user1000'
+    assert redis_partition.hash_tag(b'foo{}{bar}') == b'foo{}{bar}'
+    assert redis_partition.hash_tag(b'foo{{bar}}zap') == b'{bar'
+    assert redis_partition.hash_tag(b'nobraces') == b'nobraces'
+
+
+def test_slots_cover_all_nodes_evenly():
+    slot_nodes = redis_partition.SlotPartitioner(NODES).slot_nodes
+    assert sorted(slot_nodes.count(node) for node in NODES) == [5461, 5461, 5462]
+
+
+@pytest.mark.parametrize('name', ['ketama', 'slots'])
+def test_adding_a_node_moves_its_share_to_it(name):
+    changes = moved(name, NODES, NODES + ['node_4'])
+    #about 1/4 of the keys, all of them to the new node
+    assert 0.15 < float(len(changes)) / len(KEYS) < 0.35
+    assert set(new for old, new in changes) == set(['node_4'])
+
+
+def test_adding_a_node_moves_most_keys_with_modulo():
+    changes = moved('modulo', NODES, NODES + ['node_4'])
+    assert float(len(changes)) / len(KEYS) > 0.6
+    assert set(new for old, new in changes) == set(NODES + ['node_4'])
+
+
+@pytest.mark.parametrize('name', ['modulo', 'ketama', 'slots'])
+def test_keys_are_spread_over_the_nodes(name):
+    partitioner = redis_partition.partitioner(name, NODES)
+    counts = dict((node, 0) for node in NODES)
+    for key in KEYS:
+        counts[partitioner.node(key)] += 1
+    assert min(counts.values()) > 0.2 * len(KEYS)
+
+
+def test_nodes_are_ordered_by_number():
+    assert redis_partition.partitioner('slots', ['node_10', 'node_2', 'node_1']).nodes == ['node_1', 'node_2', 'node_10']
+
+
+def test_partitioner_is_abstract():
+    with pytest.raises(TypeError):
+        redis_partition.Partitioner(NODES)
+
+
+def test_unknown_partitioner():
+    with pytest.raises(ValueError):
+        redis_partition.partitioner('random', NODES)
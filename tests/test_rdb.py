@@ -0,0 +1,110 @@
+import binascii
+import gzip
+import io
+import json
+import os
+import shutil
+import struct
+import time
+
+import pytest
+import redis
+
+import redis_rdb
+from conftest import run_script
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+#small.rdb is a snapshot of redis 6.2, small.dump.json the types and DUMP payloads of its keys by "db hex(key)"
+SNAPSHOT = os.path.join(FIXTURES, 'small.rdb')
+with io.open(os.path.join(FIXTURES, 'small.dump.json')) as f:
+    DUMPS = json.load(f)
+
+#expire time of the key ttl, in milliseconds
+TTL = 4102444800000
+
+
+def string(data):
+    return struct.pack('B', len(data)) + data
+
+
+def snapshot(*entries):
+    """Function returning a RDB snapshot of db 0 with the given serialized entries.
+    """
+    return b'REDIS0012' + b'\xfa' + string(b'redis-ver') + string(b'7.4.0') + b'\xfe\x00' + b''.join(entries) + b'\xff' + b'\x00' * 8
+
+
+def entry_name(db, key):
+    return '%d %s' % (db, binascii.hexlify(key).decode())
+
+
+def test_crc64_jones():
+    assert redis_rdb.crc64(b'123456789') == 0xe9c6d914c4b8d9ca
+
+
+def test_read_file_returns_the_dump_payloads():
+    entries = list(redis_rdb.read_file(SNAPSHOT, size=64))
+    assert sorted(entry_name(db, key) for db, key, rtype, payload, expire in entries) == sorted(DUMPS)
+    for db, key, rtype, payload, expire in entries:
+        dump = DUMPS[entry_name(db, key)]
+        assert redis_rdb.TYPES[rtype] == dump['type']
+        assert binascii.hexlify(payload).decode() == dump['dump']
+        assert expire == (TTL if key == b'ttl' else None)
+
+
+def test_read_gzipped_file(tmpdir):
+    path = str(tmpdir.join('small.rdb.gz'))
+    with open(SNAPSHOT, 'rb') as src:
+        with gzip.open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    assert list(redis_rdb.read_file(path)) == list(redis_rdb.read_file(SNAPSHOT))
+
+
+def test_memory_entries():
+    with open(SNAPSHOT, 'rb') as f:
+        sizes = dict((entry_name(db, key), size) for db, key, rtype, size, expire in redis_rdb.memory_entries(f.read()))
+    assert sorted(sizes) == sorted(DUMPS)
+    assert all(size > 0 for size in sizes.values())
+    assert sizes[entry_name(0, b'bigset')] > 600 * 8 > sizes[entry_name(0, b'set')]
+    assert sizes[entry_name(0, b'long')] > sizes[entry_name(0, b'str')]
+
+
+def test_hash_field_expire_and_module_types():
+    data = snapshot(
+        b'\x19' + string(b'listpack_ex') + struct.pack('<Q', 1000) + string(b'LISTPACK'),
+        b'\x18' + string(b'metadata') + struct.pack('<Q', 1000) + b'\x02' + b'\x05' + string(b'f1') + string(b'v1')
+        + b'\x00' + string(b'f2') + string(b'v2'),
+        b'\x16' + string(b'metadata_pre_ga') + b'\x01' + b'\x00' + string(b'f') + string(b'v'),
+        b'\x17' + string(b'listpack_ex_pre_ga') + string(b'LP'),
+        #module id, then an unsigned integer, a string, a double and a float, up to MODULE_EOF
+        b'\x07' + string(b'module') + b'\x81' + struct.pack('>Q', 12345) + b'\x02\x05' + b'\x05' + string(b'xyz')
+        + b'\x04' + b'\x00' * 8 + b'\x03' + b'\x00' * 4 + b'\x00',
+        #module aux field: module id, when opcode and when, then the module opcodes
+        b'\xf7' + b'\x81' + struct.pack('>Q', 1) + b'\x02\x02' + b'\x05' + string(b'aux') + b'\x00',
+        b'\x00' + string(b'string') + string(b'value'))
+    entries = list(redis_rdb.RDBParser(redis_rdb.Stream(io.BytesIO(data).read)).entries())
+    assert [(key, redis_rdb.TYPES[rtype]) for db, key, rtype, value, expire in entries] == [
+        (b'listpack_ex', 'hash'), (b'metadata', 'hash'), (b'metadata_pre_ga', 'hash'), (b'listpack_ex_pre_ga', 'hash'),
+        (b'module', 'module'), (b'string', 'string')]
+    assert entries[0][3] == struct.pack('<Q', 1000) + string(b'LISTPACK')
+    assert entries[-1][3] == string(b'value')
+    assert [key for db, key, rtype, size, expire in redis_rdb.memory_entries(data)] == [key for db, key, rtype, value, expire in entries]
+
+
+def test_unsupported_type_names_the_key():
+    data = snapshot(b'\x06' + string(b'old_module') + b'\x00' * 8)
+    with pytest.raises(ValueError) as e:
+        list(redis_rdb.RDBParser(redis_rdb.Stream(io.BytesIO(data).read)).entries())
+    assert 'unsupported RDB type 6' in str(e.value) and 'old_module' in str(e.value)
+
+
+def test_copy_a_snapshot(servers, tmpdir):
+    run_script('redis-copy.py', '--rdb=%s' % SNAPSHOT, '-t', 'localhost:%d' % servers[1], '-d', '0:1,3:3',
+               '--journal=%s' % tmpdir, '--exclude=big*')
+    rr = redis.StrictRedis(port=servers[1], db=1)
+    expected = dict((binascii.unhexlify(name.split(' ')[1]), dump['type']) for name, dump in DUMPS.items()
+                    if name.startswith('0 ') and not name.startswith('0 626967'))
+    assert dict((key, rr.type(key).decode()) for key in rr.keys('*')) == expected
+    assert abs(rr.pttl('ttl') - (TTL - time.time() * 1000)) < 5000
+    assert redis.StrictRedis(port=servers[1], db=3).get('other') is not None
+    assert redis.StrictRedis(port=servers[1], db=0).dbsize() == 0
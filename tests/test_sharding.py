@@ -0,0 +1,93 @@
+import re
+
+import pytest
+import redis
+
+import redis_partition
+from conftest import run_script
+
+NODES = ['node_1', 'node_2', 'node_3']
+
+
+def targets(servers):
+    return ','.join('%s#localhost:%d' % (node, port) for node, port in zip(NODES, servers[1:]))
+
+
+def reshard(servers, tmpdir, *args, **kwargs):
+    return run_script('redis-sharding.py', '--sources=localhost:%d' % servers[0], '--targets=%s' % targets(servers),
+                      '--journal=%s' % tmpdir, *args, **kwargs)
+
+
+def fill(servers, dbs, count):
+    keys = {}
+    for db in dbs:
+        r = redis.StrictRedis(port=servers[0], db=db)
+        p = r.pipeline(transaction=False)
+        for i in range(count):
+            p.set('key:%d:%d' % (db, i), i)
+        p.execute()
+        keys[db] = set(('key:%d:%d' % (db, i)).encode() for i in range(count))
+    return keys
+
+
+def node_keys(servers, db):
+    """Function returning the keys of db on each node.
+    """
+    return dict((node, set(redis.StrictRedis(port=port, db=db).keys('*'))) for node, port in zip(NODES, servers[1:]))
+
+
+@pytest.mark.parametrize('partitioner', ['modulo', 'slots'])
+def test_parallel_reshard_puts_each_key_on_its_node(servers, tmpdir, partitioner):
+    keys = fill(servers, [0, 1, 2], 1000)
+    output = reshard(servers, tmpdir, '--databases=0,1,2', '--workers=2', '--scan', '--partitioner=%s' % partitioner)
+    #one line per source server-db and per node in the final report
+    totals = dict(re.findall(r'(?:source|node) (\S+): (\d+) keys', output.split('Progress at')[-1]))
+    assert [int(totals['localhost:%d:%d' % (servers[0], db)]) for db in (0, 1, 2)] == [1000] * 3
+    assert sum(int(totals[node]) for node in NODES) == 3000
+
+    partition = redis_partition.partitioner(partitioner, NODES)
+    for db in (0, 1, 2):
+        placed = node_keys(servers, db)
+        assert set.union(*placed.values()) == keys[db]
+        for node in NODES:
+            assert placed[node] and all(partition.node(key) == node for key in placed[node])
+
+
+def test_streams_are_resharded(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    for i in range(10):
+        r.xadd('stream:%d' % i, {'field': i})
+    reshard(servers, tmpdir, '--databases=0', '--scan')
+    node = dict(zip(NODES, servers[1:]))
+    partition = redis_partition.partitioner('modulo', NODES)
+    for i in range(10):
+        key = ('stream:%d' % i).encode()
+        assert redis.StrictRedis(port=node[partition.node(key)]).xrange(key) == r.xrange(key)
+
+
+def test_verify_then_reshard_again_fixes_the_mismatches(servers, tmpdir):
+    r = redis.StrictRedis(port=servers[0])
+    for i in range(100):
+        r.hset('hash:%d' % i, mapping={'a': i, 'b': i})
+        r.sadd('set:%d' % i, 'a', 'b')
+        r.zadd('zset:%d' % i, {'a': i})
+        r.set('string:%d' % i, i, ex=1000)
+    reshard(servers, tmpdir, '--databases=0')
+
+    partition = redis_partition.partitioner('modulo', NODES)
+    nodes = dict((node, redis.StrictRedis(port=port)) for node, port in zip(NODES, servers[1:]))
+
+    def node(key):
+        return nodes[partition.node(key.encode())]
+
+    node('hash:1').hdel('hash:1', 'a')
+    node('hash:2').hset('hash:2', 'stale', 1)
+    node('set:3').sadd('set:3', 'stale')
+    node('zset:4').zadd('zset:4', {'a': 0, 'stale': 1})
+    node('string:5').delete('string:5')
+    node('string:6').persist('string:6')
+    node('hash:7').expire('hash:7', 100)
+    assert '7 mismatches found' in reshard(servers, tmpdir, '--databases=0', '--verify', check=False)
+
+    reshard(servers, tmpdir, '--databases=0')
+    assert '0 mismatches found' in reshard(servers, tmpdir, '--databases=0', '--verify')